@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+"""
+Concurrent PDF retrieval with asyncio and aiohttp.
+
+All requests share one aiohttp session whose connector keeps connections alive and caps
+both the total number of concurrent connections and the number per host. Listing pages of
+all entities are crawled first, one depth at a time as in pdf_retriever.crawl_pdf_links;
+then every PDF link is downloaded. Both are conditional requests based on the crawl state.
+"""
+import asyncio
+import os
+from pathlib import Path
+
+import aiohttp
+from tqdm.auto import tqdm
+
+import crawl_state
+from crawl_frontier import DEFAULT_MAX_DEPTH, DEFAULT_MAX_PAGES, CrawlFrontier
+from partial_download import ConditionalDownload, IncompleteDownloadError
+from pdf_retriever import (DOWNLOAD_RETRIES, HEADERS, existing_analysis, extract_links, pdf_destination, record_download,
+                           sitemap_pdf_links)
+
+DEFAULT_CONCURRENCY = 16
+DEFAULT_PER_HOST = 4
+CHUNK_SIZE = 64 * 1024
+TIMEOUT = aiohttp.ClientTimeout(total=None, sock_connect=15, sock_read=15)
+
+
+class AsyncRetriever:
+    """
+    Downloads the PDFs linked from entity listing pages over a shared, pooled aiohttp session.
+    Use as an async context manager.
+    """
+
+    def __init__(self, base_folder: str = "data_new", concurrency: int = DEFAULT_CONCURRENCY,
+                 per_host: int = DEFAULT_PER_HOST, max_depth: int = DEFAULT_MAX_DEPTH,
+                 max_pages: int = DEFAULT_MAX_PAGES, use_sitemaps: bool = False):
+        self.base_folder = base_folder
+        self.concurrency = concurrency
+        self.per_host = per_host
+        self.max_depth = max_depth
+        self.max_pages = max_pages
+        self.use_sitemaps = use_sitemaps
+        self.session: aiohttp.ClientSession | None = None
+
+    async def __aenter__(self):
+        connector = aiohttp.TCPConnector(limit=self.concurrency, limit_per_host=self.per_host, ttl_dns_cache=300)
+        self.session = aiohttp.ClientSession(connector=connector, headers=HEADERS, timeout=TIMEOUT)
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.session.close()
+
+    async def fetch_links(self, page_url: str) -> tuple[set[str], set[str]]:
+        """
+        Returns the (PDF links, other links) of a listing page, reusing the recorded links if it
+        is unchanged.
+        """
+        state, headers = crawl_state.page_request(page_url)
+        try:
+            async with self.session.get(page_url, headers=headers) as response:
+                if crawl_state.revalidated(page_url, "page", state, response.status, response.headers):
+                    return crawl_state.cached_links(state)
+                response.raise_for_status()
+                html = await response.text()
+        except aiohttp.ClientResponseError as e:
+            crawl_state.record_failure(page_url, "page", e, e.status)
+            raise
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            crawl_state.record_failure(page_url, "page", e)
+            raise
+        pdf_links, page_links = extract_links(html, page_url)
+        crawl_state.record_response(page_url, "page", response.status, response.headers, pdf_links, page_links)
+        return pdf_links, page_links
+
+    async def download_file(self, url: str, dest_path: Path,
+                            existing_etag: str | None = None) -> tuple[str, bool, str | None, int | None]:
+        """
+        Streams a file to dest_path. If the file exists, the request is conditional on the
+        crawl state (or existing_etag), and nothing is transferred when it is unchanged.
+        Interrupted downloads are resumed and bodies hashed as in pdf_retriever.download_file.
+        Returns tuple of (new_etag, was_modified, content_hash, size).
+        """
+        download = ConditionalDownload(url, dest_path, existing_etag)
+
+        for attempt in range(DOWNLOAD_RETRIES + 1):
+            headers = download.request_headers()
+            f = None
+            try:
+                async with self.session.get(url, headers=headers) as response:
+                    action = download.check(response.status, response.headers, headers)
+                    if action == download.RESTART:
+                        continue
+                    if action == download.UNCHANGED:
+                        return download.unchanged_result(response.status, response.headers)
+                    response.raise_for_status()
+                    f = download.open(response.status, response.headers)
+                    if f is None:
+                        continue
+                    async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+                        f.write(chunk)
+                    # fsync and comparison with the existing file stay off the event loop
+                    was_modified = await asyncio.to_thread(download.finish, f)
+            except aiohttp.ClientResponseError as e:
+                download.failed(e, e.status)
+                raise
+            except (aiohttp.ClientError, asyncio.TimeoutError, IncompleteDownloadError) as e:
+                if attempt < DOWNLOAD_RETRIES:
+                    continue
+                download.failed(e)
+                raise
+            finally:
+                if f is not None:
+                    f.close()
+            return download.result(response.status, response.headers, was_modified)
+        raise IncompleteDownloadError(f"Could not download {url} to {dest_path}")
+
+    async def download_pdf(self, entity_name: str, pdf_url: str) -> bool:
+        """
+        Downloads one PDF and records it in its DocumentAnalysis. Returns whether it changed.
+        Fingerprinting and recording the download run in threads, so they do not stall other
+        transfers.
+        """
+        dest_path = pdf_destination(self.base_folder, entity_name, pdf_url)
+        doc_analysis = await asyncio.to_thread(existing_analysis, dest_path, entity_name)
+        existing_etag = doc_analysis.retrieved_etag if doc_analysis is not None else None
+        try:
+            new_etag, was_modified, content_hash, size = await self.download_file(pdf_url, dest_path, existing_etag)
+        except (aiohttp.ClientError, asyncio.TimeoutError, IncompleteDownloadError) as e:
+            print(f"[ERROR] Failed to download {pdf_url} for {entity_name}: {e}")
+            return False
+        await asyncio.to_thread(record_download, entity_name, pdf_url, dest_path, doc_analysis, new_etag,
+                                was_modified, content_hash, size)
+        return was_modified
+
+    async def _download_reported(self, entity_name: str, pdf_url: str) -> bool:
+        """
+        download_pdf(), reporting any failure instead of raising, so one PDF cannot abort the run.
+        """
+        try:
+            return await self.download_pdf(entity_name, pdf_url)
+        except Exception as e:
+            print(f"[ERROR] Failed to retrieve {pdf_url} for {entity_name}: {type(e).__name__}: {e}")
+            return False
+
+    async def entity_links(self, entity_name: str, page_urls: list[str]) -> dict[Path, str]:
+        """
+        Crawls the pages below an entity's root URLs breadth-first, fetching each depth
+        concurrently, and collects their PDF links, one URL per destination file. With
+        use_sitemaps, the links are read from the entity's sitemaps if they list any PDFs.
+        """
+        if self.use_sitemaps:
+            pdf_links = await asyncio.to_thread(sitemap_pdf_links, entity_name, page_urls, self.base_folder)
+            if pdf_links is not None:
+                return {pdf_destination(self.base_folder, entity_name, pdf_url): pdf_url for pdf_url in pdf_links}
+        frontier = CrawlFrontier(page_urls, max_depth=self.max_depth, max_pages=self.max_pages)
+        for _, level in frontier:
+            results = await asyncio.gather(*(self.fetch_links(url) for url in level), return_exceptions=True)
+            for page_url, result in zip(level, results):
+                if isinstance(result, BaseException):
+                    print(f"[ERROR] Failed to fetch {page_url} for {entity_name}: {result}")
+                    continue
+                frontier.add(*result)
+        links: dict[Path, str] = {}
+        for pdf_url in frontier.documents:
+            links.setdefault(pdf_destination(self.base_folder, entity_name, pdf_url), pdf_url)
+        return links
+
+    async def retrieve(self, entity_urls: dict[str, list[str]]) -> int:
+        """
+        Downloads the PDFs of every entity. Returns the number of new or changed files.
+        """
+        entity_links = await asyncio.gather(*(self.entity_links(entity_name, urls)
+                                              for entity_name, urls in entity_urls.items()))
+        jobs = []
+        for entity_name, links in zip(entity_urls, entity_links):
+            os.makedirs(os.path.join(self.base_folder, entity_name), exist_ok=True)
+            jobs.extend((entity_name, pdf_url) for pdf_url in links.values())
+
+        changed = 0
+        tasks = [asyncio.ensure_future(self._download_reported(entity_name, pdf_url))
+                 for entity_name, pdf_url in jobs]
+        for task in tqdm(asyncio.as_completed(tasks), total=len(tasks), desc="Downloading PDFs", unit="file"):
+            changed += await task
+        return changed
+
+
+def retrieve_all(entity_urls: dict[str, list[str]], base_folder: str = "data_new",
+                 concurrency: int = DEFAULT_CONCURRENCY, per_host: int = DEFAULT_PER_HOST,
+                 max_depth: int = DEFAULT_MAX_DEPTH, max_pages: int = DEFAULT_MAX_PAGES,
+                 use_sitemaps: bool = False) -> int:
+    """
+    Downloads the PDFs linked from each entity's listing pages concurrently.
+    Returns the number of new or changed files.
+    """
+    async def run():
+        async with AsyncRetriever(base_folder, concurrency, per_host, max_depth, max_pages, use_sitemaps) as retriever:
+            return await retriever.retrieve(entity_urls)
+
+    changed = asyncio.run(run())
+    print(f"{changed} new or changed PDFs")
+    return changed
@@ -0,0 +1,32 @@
+"""
+Atomic file writes.
+
+Data is written to a temporary file in the destination directory, flushed to disk and
+renamed over the destination, so concurrent readers see either the old or the new file
+and never a half-written one.
+"""
+import os
+import tempfile
+from pathlib import Path
+
+
+def atomic_write_bytes(path: Path, data: bytes, fsync: bool = True) -> None:
+  path.parent.mkdir(parents=True, exist_ok=True)
+  fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+  try:
+    with os.fdopen(fd, "wb") as f:
+      f.write(data)
+      if fsync:
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+  except BaseException:
+    try:
+      os.unlink(tmp_path)
+    except FileNotFoundError:
+      pass
+    raise
+
+
+def atomic_write_text(path: Path, text: str, encoding: str = "utf-8", fsync: bool = True) -> None:
+  atomic_write_bytes(path, text.encode(encoding), fsync=fsync)
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Benchmark the registered PDF text-extraction engines on a corpus of PDFs.
+
+Each engine runs in a fresh process so that its peak RSS is measured in isolation.
+Reports pages/sec, peak RSS, the share of pages that came back empty and the share of
+letters that are Greek (a cheap proxy for whether the text layer is usable).
+"""
+import argparse
+import multiprocessing
+import resource
+import sys
+import time
+from pathlib import Path
+
+from extraction_engines import ENGINES, get_engine
+
+
+def greek_letter_count(text: str) -> tuple[int, int]:
+  """
+  Returns (greek letters, all letters) in the text.
+  """
+  letters = [c for c in text if c.isalpha()]
+  greek = sum(1 for c in letters if "Ͱ" <= c <= "Ͽ" or "ἀ" <= c <= "῿")
+  return greek, len(letters)
+
+
+def peak_rss_mb() -> float:
+  peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+  # ru_maxrss is in bytes on macOS and in kilobytes on Linux
+  return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def run_engine(engine_name: str, pdf_paths: list[Path]) -> dict:
+  engine = get_engine(engine_name)
+  pages = empty = greek = letters = failed = 0
+  started = time.perf_counter()
+  for pdf_path in pdf_paths:
+    try:
+      for text in engine.iter_pages(pdf_path):
+        pages += 1
+        if not text.strip():
+          empty += 1
+        g, l = greek_letter_count(text)
+        greek += g
+        letters += l
+    except ImportError:
+      raise
+    except Exception as e:
+      print(f"  [{engine_name}] failed on {pdf_path}: {e}", file=sys.stderr)
+      failed += 1
+  elapsed = time.perf_counter() - started
+  return {
+      "engine": engine_name,
+      "documents": len(pdf_paths) - failed,
+      "failed": failed,
+      "pages": pages,
+      "seconds": elapsed,
+      "pages_per_sec": pages / elapsed if elapsed > 0 else 0.0,
+      "peak_rss_mb": peak_rss_mb(),
+      "empty_rate": empty / pages if pages else 0.0,
+      "greek_rate": greek / letters if letters else 0.0,
+  }
+
+
+def main():
+  parser = argparse.ArgumentParser(description="Benchmark PDF text-extraction engines")
+  parser.add_argument("--root-dir", type=Path, default=Path.cwd() / "data",
+                      help="Directory to search for PDFs (default: ./data)")
+  parser.add_argument("--engines", nargs="+", default=sorted(ENGINES), choices=sorted(ENGINES),
+                      help="Engines to benchmark (default: all registered engines)")
+  parser.add_argument("--limit", type=int, default=0, help="Only use the first N PDFs (default: all)")
+  args = parser.parse_args()
+
+  pdf_paths = sorted(args.root_dir.glob("**/*.pdf"))
+  if args.limit:
+    pdf_paths = pdf_paths[:args.limit]
+  if not pdf_paths:
+    print(f"Error: No PDFs found under {args.root_dir}")
+    return
+
+  print(f"Benchmarking {len(args.engines)} engines on {len(pdf_paths)} PDFs from {args.root_dir}")
+  results = []
+  ctx = multiprocessing.get_context("spawn")
+  for engine_name in args.engines:
+    print(f"  Running {engine_name}...")
+    with ctx.Pool(processes=1) as pool:
+      try:
+        results.append(pool.apply(run_engine, (engine_name, pdf_paths)))
+      except ImportError as e:
+        print(f"  Skipping {engine_name}: {e}")
+
+  print()
+  print(f"{'engine':<12} {'docs':>5} {'pages':>6} {'pages/s':>9} {'peak RSS':>10} {'empty':>7} {'greek':>7}")
+  for r in sorted(results, key=lambda r: r["pages_per_sec"], reverse=True):
+    print(f"{r['engine']:<12} {r['documents']:>5} {r['pages']:>6} {r['pages_per_sec']:>9.1f} "
+          f"{r['peak_rss_mb']:>8.1f}MB {r['empty_rate']:>6.1%} {r['greek_rate']:>6.1%}")
+
+
+if __name__ == "__main__":
+  main()
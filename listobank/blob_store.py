@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+"""
+Content-addressed storage of PDFs.
+
+Every distinct PDF is stored once under `blobs/<hash[:2]>/<hash>.pdf`, keyed by the MD5
+content hash used throughout (DocumentAnalysis.content_hash, the fingerprint and
+extraction caches). The files in the entity trees (data/, data_extended/, data_new/) are
+views of the blobs: hard links where the filesystem allows it, symlinks otherwise. A PDF
+shared by several trees or entities thus takes disk space once, and since hard links
+share an inode, its fingerprint is only ever computed once.
+
+Blobs are made read-only. Downloads replace a view by renaming a new file over it, which
+never modifies the blob other views share.
+"""
+import argparse
+import errno
+import os
+import shutil
+import stat
+from pathlib import Path
+
+from tqdm.auto import tqdm
+
+import catalog
+import fingerprints
+
+BLOB_DIR = Path(os.getenv("BLOB_STORE_DIR", Path.cwd() / "blobs"))
+
+
+def blob_path(content_hash: str, blob_dir: Path = BLOB_DIR) -> Path:
+  return blob_dir / content_hash[:2] / f"{content_hash}.pdf"
+
+
+def _link(blob: Path, view: Path, symlink: bool) -> None:
+  """
+  Atomically replaces view with a link to blob, preferring a hard link.
+  """
+  tmp = view.with_name(view.name + ".link")
+  tmp.unlink(missing_ok=True)
+  if not symlink:
+    try:
+      os.link(blob, tmp)
+    except OSError as e:
+      if e.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK, errno.ENOTSUP):
+        raise
+      symlink = True
+  if symlink:
+    os.symlink(os.path.relpath(blob.resolve(), view.parent.resolve()), tmp)
+  os.replace(tmp, view)
+
+
+def _add_blob(path: Path, blob: Path) -> None:
+  """
+  Adds the content of path to the store, without copying if it can be hard linked.
+  """
+  blob.parent.mkdir(parents=True, exist_ok=True)
+  tmp = blob.with_name(blob.name + ".tmp")
+  tmp.unlink(missing_ok=True)
+  try:
+    os.link(path, tmp)
+  except OSError as e:
+    if e.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK, errno.ENOTSUP):
+      raise
+    shutil.copyfile(path, tmp)
+  os.chmod(tmp, stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH)
+  os.replace(tmp, blob)
+
+
+def is_view(path: Path, content_hash: str, blob_dir: Path = BLOB_DIR) -> bool:
+  """
+  Whether path is a hard link or symlink to the blob of content_hash.
+  """
+  blob = blob_path(content_hash, blob_dir)
+  try:
+    return os.path.samefile(path, blob)
+  except OSError:
+    return False
+
+
+def store(path: Path, content_hash: str | None = None, symlink: bool = False, blob_dir: Path = BLOB_DIR) -> Path:
+  """
+  Stores the PDF at path in the blob store, if its content is not there yet, and turns
+  path into a view of the blob. Returns the blob path.
+  """
+  path = Path(path)
+  if content_hash is None:
+    content_hash = fingerprints.content_hash(path)
+  blob = blob_path(content_hash, blob_dir)
+  if is_view(path, content_hash, blob_dir):
+    return blob
+  if not blob.exists():
+    _add_blob(path, blob)
+    if symlink or not os.path.samefile(path, blob):
+      _link(blob, path, symlink)
+  else:
+    if blob.stat().st_size != path.stat().st_size:
+      raise ValueError(f"{blob} does not match {path} although both hash to {content_hash}")
+    _link(blob, path, symlink)
+  fingerprints.record(path, content_hash)
+  return blob
+
+
+def try_store(path: Path, content_hash: str | None = None, blob_dir: Path = BLOB_DIR) -> Path | None:
+  """
+  Like store(), but leaves path as it is if the blob store cannot be written.
+  """
+  try:
+    return store(path, content_hash, blob_dir=blob_dir)
+  except OSError as e:
+    print(f"Warning: Could not add {path} to the blob store: {e}")
+    return None
+
+
+def build_category_tree(root_dir: Path, out_dir: Path, symlink: bool = False, blob_dir: Path = BLOB_DIR) -> int:
+  """
+  Builds `out_dir/<category>/<entity>/<name>.pdf` views of the blobs of the documents in
+  root_dir, from the catalog. Returns the number of views.
+  """
+  catalog.sync(root_dir)
+  count = 0
+  for entry in catalog.find_documents(root_dir=root_dir):
+    if not entry.pdf_path.is_file():
+      continue
+    blob = blob_path(entry.content_hash, blob_dir)
+    if not blob.exists():
+      store(entry.pdf_path, entry.content_hash, symlink=symlink, blob_dir=blob_dir)
+    view = out_dir / (entry.category or "Uncategorized") / entry.entity / entry.pdf_path.name
+    view.parent.mkdir(parents=True, exist_ok=True)
+    if not is_view(view, entry.content_hash, blob_dir):
+      _link(blob, view, symlink)
+    count += 1
+  return count
+
+
+def collect_garbage(roots: list[Path], blob_dir: Path = BLOB_DIR) -> tuple[int, int]:
+  """
+  Removes blobs no view in roots refers to any more. Returns (removed blobs, freed bytes).
+  """
+  symlinked = {path.resolve() for root in roots for path in root.glob("**/*.pdf") if path.is_symlink()}
+  removed = freed = 0
+  for blob in blob_dir.glob("*/*.pdf"):
+    st = blob.stat()
+    if st.st_nlink == 1 and blob.resolve() not in symlinked:
+      blob.unlink()
+      removed += 1
+      freed += st.st_size
+  return removed, freed
+
+
+def main():
+  parser = argparse.ArgumentParser(description="Store PDFs once in a content-addressed blob directory")
+  parser.add_argument("command", choices=["dedupe", "categories", "gc", "stats"],
+                      help="dedupe: turn the PDFs under the roots into views of blobs; "
+                           "categories: build a category/entity tree of views under --out; "
+                           "gc: remove blobs without views in the roots or under --out; stats: show disk usage")
+  parser.add_argument("roots", nargs="*", type=Path, default=[Path("data"), Path("data_extended"), Path("data_new")],
+                      help="Directories with entity subfolders (default: data data_extended data_new)")
+  parser.add_argument("--symlink", action="store_true", help="Create symlinks instead of hard links")
+  parser.add_argument("--blob-dir", type=Path, default=BLOB_DIR, help=f"Blob directory (default: {BLOB_DIR})")
+  parser.add_argument("--out", type=Path, default=Path("by_category"),
+                      help="Output directory of the categories command, also kept by gc (default: by_category)")
+  args = parser.parse_args()
+  roots = [root for root in args.roots if root.is_dir()]
+
+  if args.command == "categories":
+    count = sum(build_category_tree(root, args.out, symlink=args.symlink, blob_dir=args.blob_dir) for root in roots)
+    print(f"Linked {count} documents under {args.out}")
+    return
+
+  if args.command == "gc":
+    # symlinked category views keep their blobs too; hard links are counted by the blob's link count
+    removed, freed = collect_garbage(roots + ([args.out] if args.out.is_dir() else []), args.blob_dir)
+    print(f"Removed {removed} blobs ({freed / 1e6:.1f} MB)")
+    return
+
+  pdf_files = sorted(path for root in roots for path in root.glob("**/*.pdf"))
+  if args.command == "dedupe":
+    digests = fingerprints.content_hashes(pdf_files)
+    for pdf_file in tqdm(pdf_files, desc="Storing blobs", unit="file"):
+      store(pdf_file, digests[pdf_file], symlink=args.symlink, blob_dir=args.blob_dir)
+
+  inodes = {}
+  views = 0
+  for pdf_file in pdf_files:
+    st = pdf_file.stat()
+    inodes[(st.st_dev, st.st_ino)] = st.st_size
+    views += is_view(pdf_file, fingerprints.content_hash(pdf_file), args.blob_dir)
+  apparent = sum(pdf_file.stat().st_size for pdf_file in pdf_files)
+  print(f"{len(pdf_files)} PDFs ({views} views of blobs), {len(inodes)} distinct files: "
+        f"{apparent / 1e6:.1f} MB -> {sum(inodes.values()) / 1e6:.1f} MB on disk")
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+Removal of repeated headers, footers, disclaimers and page numbers from extracted text.
+
+A line is boilerplate when, after collapsing whitespace and replacing digits with `#`, it
+appears on most pages of a document, or in the header/footer lines of many documents of
+the same entity. Document boilerplate (running headers, repeated table headers) is kept on
+the first page it appears on. Entity boilerplate (address footers, legal notices) is only
+looked for at the top and bottom of pages, since standardized documents such as fee
+information documents share much of their body text, and never at the top of the first
+page, where the title is. Lines without letters are only treated as boilerplate when they
+look like page numbers, so repeated amounts in fee tables are kept.
+"""
+import argparse
+import re
+from collections import Counter
+from pathlib import Path
+
+# A line repeated on at least this fraction of a document's pages (and MIN_PAGES pages) is boilerplate
+MIN_PAGE_FRACTION = 0.6
+MIN_PAGES = 3
+# A line found in at least this fraction of an entity's documents (and ENTITY_MIN_DOCUMENTS documents) is boilerplate
+ENTITY_MIN_FRACTION = 0.3
+ENTITY_MIN_DOCUMENTS = 3
+# Number of lines at the top and bottom of a page where entity boilerplate is looked for
+EDGE_LINES = 3
+# Shorter lines with letters (e.g. column labels like "Max") are never removed
+MIN_LINE_LENGTH = 12
+
+_DIGITS_RE = re.compile(r"\d+")
+_LETTER_RE = re.compile(r"[^\W\d_]")
+_PAGE_NUMBER_RE = re.compile(r"^[\s\-–‒—|/#]*#[\s\-–‒—|/#]*$")
+
+
+def normalize_line(line: str) -> str:
+  return _DIGITS_RE.sub("#", " ".join(line.split()))
+
+
+def _is_candidate(normalized: str) -> bool:
+  if _LETTER_RE.search(normalized):
+    return len(normalized) >= MIN_LINE_LENGTH
+  return bool(_PAGE_NUMBER_RE.match(normalized))
+
+
+def _page_lines(page: str) -> set[str]:
+  return {normalized for line in page.splitlines() if (normalized := normalize_line(line))}
+
+
+def _edge_line_indices(line_count: int, first_page: bool) -> set[int]:
+  top = set() if first_page else set(range(min(EDGE_LINES, line_count)))
+  return top | set(range(max(0, line_count - EDGE_LINES), line_count))
+
+
+def _edge_lines(pages: list[str]) -> set[str]:
+  """
+  Normalized lines at the top or bottom of at least MIN_PAGE_FRACTION of the pages, like
+  a running footer; body text that happens to end up near a page break is not included.
+  """
+  counts = Counter()
+  for page_index, page in enumerate(pages):
+    lines = [normalized for line in page.splitlines() if (normalized := normalize_line(line))]
+    counts.update({lines[i] for i in _edge_line_indices(len(lines), page_index == 0)})
+  return {line for line, count in counts.items() if count >= MIN_PAGE_FRACTION * len(pages)}
+
+
+def document_boilerplate(pages: list[str]) -> set[str]:
+  """
+  Normalized lines repeated across most pages of a document.
+  """
+  if len(pages) < MIN_PAGES:
+    return set()
+  counts = Counter(line for page in pages for line in _page_lines(page))
+  min_count = max(MIN_PAGES, MIN_PAGE_FRACTION * len(pages))
+  return {line for line, count in counts.items() if count >= min_count and _is_candidate(line)}
+
+
+def entity_boilerplate(documents: list[list[str]]) -> set[str]:
+  """
+  Normalized lines found at the top or bottom of pages in many documents of one entity.
+  """
+  if len(documents) < ENTITY_MIN_DOCUMENTS:
+    return set()
+  counts = Counter(line for pages in documents for line in _edge_lines(pages))
+  min_count = max(ENTITY_MIN_DOCUMENTS, ENTITY_MIN_FRACTION * len(documents))
+  return {line for line, count in counts.items() if count >= min_count and _is_candidate(line)}
+
+
+def clean_pages(pages: list[str], document_lines: set[str], entity_lines: set[str] = frozenset()) -> list[str]:
+  """
+  Removes boilerplate lines from each page. Document boilerplate is kept where it first appears.
+  """
+  seen = set()
+  cleaned = []
+  for page_index, page in enumerate(pages):
+    lines = [line for line in page.splitlines() if line.strip()]
+    edge = _edge_line_indices(len(lines), page_index == 0) if entity_lines else set()
+    kept = []
+    for i, line in enumerate(lines):
+      normalized = normalize_line(line)
+      if i in edge and normalized in entity_lines:
+        continue
+      if normalized in document_lines:
+        if normalized in seen:
+          continue
+        seen.add(normalized)
+      kept.append(line)
+    cleaned.append("\n".join(kept))
+  return cleaned
+
+
+def main():
+  from doc_analysis import load_document_analysis
+
+  parser = argparse.ArgumentParser(description="Remove repeated headers and footers from extracted page text")
+  parser.add_argument("--root-dir", type=Path, default=Path("data_new"),
+                      help="Directory with entity subfolders (default: data_new)")
+  parser.add_argument("--dry-run", action="store_true", help="Report the reduction without writing cleaned text")
+  args = parser.parse_args()
+
+  raw_chars = clean_chars = 0
+  for entity_folder in sorted(path for path in args.root_dir.iterdir() if path.is_dir()):
+    analyses = []
+    for pdf_file in sorted(entity_folder.glob("*.pdf")):
+      try:
+        doc_analysis = load_document_analysis(pdf_file, bank=entity_folder.name)
+      except (FileNotFoundError, ValueError) as e:
+        print(f"Warning: Could not load DocumentAnalysis for {pdf_file}: {e}")
+        continue
+      if doc_analysis.pages_complete:
+        analyses.append(doc_analysis)
+
+    entity_lines = entity_boilerplate([doc_analysis.pages_text for doc_analysis in analyses])
+    entity_raw = entity_clean = 0
+    for doc_analysis in analyses:
+      pages = doc_analysis.pages_text
+      cleaned = clean_pages(pages, document_boilerplate(pages), entity_lines)
+      entity_raw += sum(map(len, pages))
+      entity_clean += sum(map(len, cleaned))
+      if not args.dry_run and cleaned != doc_analysis.clean_pages_text:
+        doc_analysis.clean_pages_text = cleaned
+        doc_analysis.save()
+    if entity_raw:
+      print(f"{entity_folder.name}: {len(analyses)} documents, {len(entity_lines)} entity boilerplate lines, "
+            f"{entity_raw} -> {entity_clean} characters ({1 - entity_clean / entity_raw:.1%} removed)")
+    raw_chars += entity_raw
+    clean_chars += entity_clean
+  if raw_chars:
+    print(f"Total: {raw_chars} -> {clean_chars} characters ({1 - clean_chars / raw_chars:.1%} removed)")
+
+
+if __name__ == "__main__":
+  main()
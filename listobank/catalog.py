@@ -0,0 +1,296 @@
+#!/usr/bin/env python3
+"""
+SQLite catalog of DocumentAnalysis metadata.
+
+Every DocumentAnalysis.save() upserts its metadata here, so scripts that only need to
+know a document's entity, category or dates can query the catalog instead of globbing
+the data tree and parsing every `.analysis.json`. `sync` picks up analysis files that
+were changed outside of save() by comparing file mtimes, without parsing unchanged files.
+Rows are keyed on the resolved path of the analysis file, so a file reached through a
+relative and an absolute path is catalogued once; the paths shown are relative to the
+working directory where possible.
+"""
+import argparse
+import datetime
+import os
+import sqlite3
+import threading
+from pathlib import Path
+
+from pydantic import BaseModel, Field
+
+DB_PATH = Path(os.getenv("CATALOG_DB", Path.cwd() / ".cache" / "catalog.sqlite"))
+
+_lock = threading.Lock()
+_connections: dict[Path, sqlite3.Connection] = {}
+
+
+class CatalogEntry(BaseModel):
+  analysis_path: Path = Field(
+      ..., description="path to the .analysis.json file"
+  )
+  pdf_path: Path = Field(
+      ..., description="relative path to the source file from the project directory"
+  )
+  entity: str = Field(
+      ..., description="entity the document was retrieved for"
+  )
+  category: str | None = Field(
+      default=None, description="document category"
+  )
+  document_title: str | None = Field(
+      default=None, description="title of the document, if available"
+  )
+  effective_date: datetime.datetime | None = Field(
+      default=None, description="date when the document becomes effective"
+  )
+  content_hash: str = Field(
+      ..., description="hash of the source file"
+  )
+  retrieved_from: str | None = Field(
+      default=None, description="URL from which the document was retrieved"
+  )
+  retrieved_at: datetime.datetime | None = Field(
+      default=None, description="timestamp of when the document was retrieved"
+  )
+
+
+def _connect(db_path: Path) -> sqlite3.Connection:
+  conn = _connections.get(db_path)
+  if conn is None:
+    db_path.parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(str(db_path), check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    legacy_rows = _legacy_rows(conn)
+    conn.executescript(
+        """
+        CREATE TABLE IF NOT EXISTS documents (
+            analysis_key TEXT PRIMARY KEY,
+            analysis_path TEXT NOT NULL,
+            pdf_path TEXT NOT NULL,
+            entity TEXT NOT NULL,
+            category TEXT,
+            document_title TEXT,
+            effective_date TEXT,
+            content_hash TEXT NOT NULL,
+            retrieved_from TEXT,
+            retrieved_at TEXT,
+            analysis_mtime_ns INTEGER
+        );
+        CREATE INDEX IF NOT EXISTS idx_documents_entity ON documents(entity);
+        CREATE INDEX IF NOT EXISTS idx_documents_category ON documents(category);
+        CREATE INDEX IF NOT EXISTS idx_documents_effective_date ON documents(effective_date);
+        CREATE INDEX IF NOT EXISTS idx_documents_content_hash ON documents(content_hash);
+        CREATE INDEX IF NOT EXISTS idx_documents_retrieved_at ON documents(retrieved_at);
+        CREATE INDEX IF NOT EXISTS idx_documents_entity_category_date
+            ON documents(entity, category, effective_date);
+        """
+    )
+    for row in legacy_rows:
+      analysis_file = Path(row["analysis_path"])
+      _insert(conn, {**row, "analysis_key": _key(analysis_file), "analysis_path": _display(analysis_file),
+                     "pdf_path": _display(Path(row["pdf_path"]))})
+    conn.commit()
+    _connections[db_path] = conn
+  return conn
+
+
+def _legacy_rows(conn: sqlite3.Connection) -> list[dict]:
+  """
+  Takes the rows out of a catalog created before rows were keyed on resolved paths, so they
+  can be re-inserted under the new key.
+  """
+  columns = {row["name"] for row in conn.execute("PRAGMA table_info(documents)")}
+  if not columns or "analysis_key" in columns:
+    return []
+  # oldest first, so the latest of the rows save() and sync() wrote for a file wins
+  rows = [dict(row) for row in conn.execute("SELECT * FROM documents ORDER BY analysis_mtime_ns")]
+  conn.execute("DROP TABLE documents")
+  return rows
+
+
+def _key(path: Path) -> str:
+  return str(path.resolve())
+
+
+def _display(path: Path) -> str:
+  try:
+    return str(path.resolve().relative_to(Path.cwd().resolve()))
+  except ValueError:
+    return str(path)
+
+
+def _timestamp(value: datetime.datetime | None) -> str | None:
+  """
+  Normalizes datetimes to UTC ISO strings so they sort and compare correctly as text.
+  """
+  if value is None:
+    return None
+  if value.tzinfo is None:
+    value = value.replace(tzinfo=datetime.timezone.utc)
+  return value.astimezone(datetime.timezone.utc).isoformat()
+
+
+def _prefix(root_dir: Path) -> str:
+  return str(root_dir).rstrip(os.sep) + os.sep
+
+
+_COLUMNS = ("analysis_key", "analysis_path", "pdf_path", "entity", "category", "document_title", "effective_date",
+            "content_hash", "retrieved_from", "retrieved_at", "analysis_mtime_ns")
+
+
+def _insert(conn: sqlite3.Connection, row: dict) -> None:
+  conn.execute(f"INSERT OR REPLACE INTO documents({', '.join(_COLUMNS)}) VALUES({', '.join('?' * len(_COLUMNS))})",
+               [row[column] for column in _COLUMNS])
+
+
+def upsert(doc_analysis, db_path: Path = DB_PATH) -> None:
+  """
+  Records the metadata of a DocumentAnalysis. Called from DocumentAnalysis.save().
+  """
+  analysis_file = doc_analysis.relative_file_path.with_suffix(".analysis.json")
+  try:
+    mtime_ns = analysis_file.stat().st_mtime_ns
+  except FileNotFoundError:
+    mtime_ns = None
+  with _lock:
+    conn = _connect(db_path)
+    _insert(conn, {
+        "analysis_key": _key(analysis_file),
+        "analysis_path": _display(analysis_file),
+        "pdf_path": _display(doc_analysis.relative_file_path),
+        "entity": doc_analysis.bank,
+        "category": doc_analysis.category,
+        "document_title": doc_analysis.document_title,
+        "effective_date": _timestamp(doc_analysis.effective_date),
+        "content_hash": doc_analysis.content_hash,
+        "retrieved_from": str(doc_analysis.retrieved_from) if doc_analysis.retrieved_from else None,
+        "retrieved_at": _timestamp(doc_analysis.retrieved_at),
+        "analysis_mtime_ns": mtime_ns,
+    })
+    conn.commit()
+
+
+def sync(root_dir: Path, db_path: Path = DB_PATH) -> tuple[int, int]:
+  """
+  Brings the catalog in line with the analysis files under root_dir: files whose mtime
+  changed are parsed and upserted, rows for deleted files are removed.
+  Returns the number of updated and removed rows.
+  """
+  from doc_analysis import DocumentAnalysis
+
+  prefix = _prefix(Path(_key(root_dir)))
+  with _lock:
+    known = {
+        row["analysis_key"]: row["analysis_mtime_ns"]
+        for row in _connect(db_path).execute(
+            "SELECT analysis_key, analysis_mtime_ns FROM documents WHERE substr(analysis_key, 1, ?) = ?",
+            (len(prefix), prefix))
+    }
+
+  seen = set()
+  updated = 0
+  for analysis_file in root_dir.glob("**/*.analysis.json"):
+    key = _key(analysis_file)
+    seen.add(key)
+    if known.get(key) == analysis_file.stat().st_mtime_ns:
+      continue
+    try:
+      doc_analysis = DocumentAnalysis.model_validate_json(analysis_file.read_text(encoding="utf-8"))
+    except ValueError as e:
+      print(f"Warning: Skipping invalid analysis file {analysis_file}: {e}")
+      continue
+    # index under the path the file was found at, even if it was moved since it was written
+    doc_analysis.relative_file_path = Path(str(analysis_file).removesuffix(".analysis.json") + ".pdf")
+    upsert(doc_analysis, db_path)
+    updated += 1
+
+  removed = [key for key in known if key not in seen]
+  if removed:
+    with _lock:
+      conn = _connect(db_path)
+      conn.executemany("DELETE FROM documents WHERE analysis_key = ?", [(key,) for key in removed])
+      conn.commit()
+  return updated, len(removed)
+
+
+def find_documents(entity: str | None = None,
+                   category: str | None = None,
+                   effective_after: datetime.datetime | None = None,
+                   effective_before: datetime.datetime | None = None,
+                   content_hash: str | None = None,
+                   retrieved_after: datetime.datetime | None = None,
+                   root_dir: Path | None = None,
+                   db_path: Path = DB_PATH) -> list[CatalogEntry]:
+  """
+  Returns catalog entries matching all given filters, ordered by entity and path.
+  """
+  clauses, params = [], []
+  if entity is not None:
+    clauses.append("entity = ?")
+    params.append(entity)
+  if category is not None:
+    clauses.append("category = ?")
+    params.append(category)
+  if effective_after is not None:
+    clauses.append("effective_date > ?")
+    params.append(_timestamp(effective_after))
+  if effective_before is not None:
+    clauses.append("effective_date < ?")
+    params.append(_timestamp(effective_before))
+  if content_hash is not None:
+    clauses.append("content_hash = ?")
+    params.append(content_hash)
+  if retrieved_after is not None:
+    clauses.append("retrieved_at > ?")
+    params.append(_timestamp(retrieved_after))
+  if root_dir is not None:
+    prefix = _prefix(Path(_key(root_dir)))
+    clauses.append("substr(analysis_key, 1, ?) = ?")
+    params.extend([len(prefix), prefix])
+
+  query = "SELECT * FROM documents"
+  if clauses:
+    query += " WHERE " + " AND ".join(clauses)
+  query += " ORDER BY entity, pdf_path"
+  with _lock:
+    rows = _connect(db_path).execute(query, params).fetchall()
+  return [CatalogEntry.model_validate({key: row[key] for key in row.keys() if key in CatalogEntry.model_fields})
+          for row in rows]
+
+
+def main():
+  parser = argparse.ArgumentParser(description="Sync and query the DocumentAnalysis catalog")
+  parser.add_argument("--db-path", type=Path, default=DB_PATH, help=f"Catalog database (default: {DB_PATH})")
+  subparsers = parser.add_subparsers(dest="command", required=True)
+  sync_parser = subparsers.add_parser("sync", help="Index new and changed analysis files")
+  sync_parser.add_argument("--root-dir", type=Path, default=Path("data_new"),
+                           help="Directory with analysis files (default: data_new)")
+  query_parser = subparsers.add_parser("query", help="List documents matching filters")
+  query_parser.add_argument("--root-dir", type=Path, default=Path("data_new"),
+                            help="Directory with analysis files, synced before querying (default: data_new)")
+  query_parser.add_argument("--entity", type=str, help="Entity to filter by")
+  query_parser.add_argument("--category", type=str, help="Category to filter by")
+  query_parser.add_argument("--effective-after", type=datetime.datetime.fromisoformat,
+                            help="Only documents effective after this date (YYYY-MM-DD)")
+  query_parser.add_argument("--effective-before", type=datetime.datetime.fromisoformat,
+                            help="Only documents effective before this date (YYYY-MM-DD)")
+  query_parser.add_argument("--content-hash", type=str, help="Content hash to filter by")
+  args = parser.parse_args()
+
+  if args.command == "sync":
+    updated, removed = sync(args.root_dir, args.db_path)
+    print(f"Updated {updated} and removed {removed} catalog entries")
+  elif args.command == "query":
+    sync(args.root_dir, args.db_path)
+    entries = find_documents(entity=args.entity, category=args.category,
+                             effective_after=args.effective_after, effective_before=args.effective_before,
+                             content_hash=args.content_hash, root_dir=args.root_dir, db_path=args.db_path)
+    for entry in entries:
+      effective = entry.effective_date.date().isoformat() if entry.effective_date else "-"
+      print(f"{entry.entity}\t{entry.category}\t{effective}\t{entry.pdf_path}")
+
+
+if __name__ == "__main__":
+  main()
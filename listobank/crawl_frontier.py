@@ -0,0 +1,150 @@
+"""
+Breadth-first crawl frontier for the document roots of an entity.
+
+Starting from the configured root URLs, pages are visited level by level up to a maximum
+depth, so documents linked one or more clicks below a root page are found as well. Only
+pages on the site of a root URL are followed; PDFs linked from those pages are accepted
+wherever they are hosted. URLs are compared by their canonical form, so the same page or
+PDF linked with a fragment, tracking parameters, a different parameter order or different
+casing is requested once. What is requested is the first link found, as written, since
+servers need not treat the canonical form the same way.
+"""
+import posixpath
+from urllib.parse import parse_qsl, unquote, urlencode, urlparse, urlunparse
+
+DEFAULT_MAX_DEPTH = 1
+DEFAULT_MAX_PAGES = 50
+
+TRACKING_PARAMS = {"fbclid", "gclid", "msclkid", "mc_cid", "mc_eid", "_ga", "_gl", "ref"}
+_TRACKING_PREFIXES = ("utm_",)
+_DEFAULT_PORTS = {"http": 80, "https": 443}
+# links to files that are neither pages nor PDFs are not followed
+_SKIPPED_EXTENSIONS = {
+    ".jpg", ".jpeg", ".png", ".gif", ".svg", ".webp", ".ico", ".css", ".js", ".json", ".xml",
+    ".zip", ".gz", ".doc", ".docx", ".xls", ".xlsx", ".ppt", ".pptx", ".mp3", ".mp4", ".avi",
+    ".mov", ".woff", ".woff2", ".ttf", ".eot", ".ics", ".vcf",
+}
+
+
+def is_pdf_url(url: str) -> bool:
+  return urlparse(url).path.lower().endswith(".pdf")
+
+
+def is_page_url(url: str) -> bool:
+  """
+  Whether a link may lead to an HTML page worth crawling.
+  """
+  parsed = urlparse(url)
+  if parsed.scheme not in _DEFAULT_PORTS:
+    return False
+  return posixpath.splitext(parsed.path.lower())[1] not in _SKIPPED_EXTENSIONS | {".pdf"}
+
+
+def canonicalize_url(url: str) -> str:
+  """
+  Canonical form of an absolute http(s) URL: lowercase scheme and host, no default port,
+  no fragment, no tracking parameters, sorted query parameters and dot segments resolved.
+  It identifies a URL for deduplication only and is not meant to be requested.
+  """
+  parsed = urlparse(url.strip())
+  scheme = parsed.scheme.lower()
+  host = (parsed.hostname or "").rstrip(".")
+  netloc = host
+  if parsed.port and parsed.port != _DEFAULT_PORTS.get(scheme):
+    netloc += f":{parsed.port}"
+
+  path = parsed.path or "/"
+  normalized = posixpath.normpath(path)
+  if normalized.startswith("//"):
+    normalized = "/" + normalized.lstrip("/")
+  if path.endswith("/") and normalized != "/":
+    normalized += "/"
+
+  params = [(key, value) for key, value in parse_qsl(parsed.query, keep_blank_values=True)
+            if key.lower() not in TRACKING_PARAMS and not key.lower().startswith(_TRACKING_PREFIXES)]
+  return urlunparse((scheme, netloc, normalized, "", urlencode(sorted(params)), ""))
+
+
+def url_key(url: str, ignore_query: bool = False) -> str:
+  """
+  Key under which a canonical URL is deduplicated. Paths are compared decoded and
+  case-insensitively, since the servers of most entities treat them that way. PDFs are
+  saved under the last path segment of their URL, so for them the query string is ignored
+  as well.
+  """
+  parsed = urlparse(url)
+  path = unquote(parsed.path).lower()
+  return urlunparse((parsed.scheme, parsed.netloc, path, "", "" if ignore_query else parsed.query, ""))
+
+
+def site_of(url: str) -> str:
+  host = (urlparse(url).hostname or "").rstrip(".")
+  return host[4:] if host.startswith("www.") else host
+
+
+def in_scope(url: str, sites: set[str]) -> bool:
+  """
+  Whether the host of url is one of sites or a subdomain of one.
+  """
+  host = (urlparse(url).hostname or "").rstrip(".")
+  return any(host == site or host.endswith("." + site) for site in sites)
+
+
+class CrawlFrontier:
+  """
+  Breadth-first frontier over the pages of one entity. Iterating yields the pages of each
+  depth in turn; the links found on them are passed to add() before the next level is taken.
+
+      frontier = CrawlFrontier(root_urls)
+      for depth, pages in frontier:
+          for page_url in pages:
+              pdf_links, page_links = fetch(page_url)
+              frontier.add(pdf_links, page_links)
+      frontier.documents  # unique PDF URLs in discovery order
+  """
+
+  def __init__(self, root_urls: list[str], max_depth: int = DEFAULT_MAX_DEPTH, max_pages: int = DEFAULT_MAX_PAGES):
+    self.max_depth = max_depth
+    self.max_pages = max_pages
+    self.sites = {site_of(url) for url in root_urls}
+    self.depth = 0
+    self.documents: list[str] = []
+    self.pages_queued = 0
+    self._seen: set[str] = set()
+    self._level: list[str] = []
+    self._next_level: list[str] = []
+    for url in root_urls:
+      self._queue_page(url, self._level, check_limit=False)
+
+  def _queue_page(self, url: str, level: list[str], check_limit: bool = True) -> None:
+    key = url_key(canonicalize_url(url))
+    if key in self._seen or (check_limit and self.pages_queued >= self.max_pages):
+      return
+    self._seen.add(key)
+    level.append(url)
+    self.pages_queued += 1
+
+  def __iter__(self):
+    while self._level:
+      level, self._level = self._level, []
+      yield self.depth, level
+      self.depth += 1
+      self._level, self._next_level = self._next_level, []
+
+  def add(self, pdf_links, page_links=()) -> list[str]:
+    """
+    Records the links found on a page of the current level. Returns the PDF URLs not seen before.
+    """
+    new_documents = []
+    for link in sorted(pdf_links):
+      key = url_key(canonicalize_url(link), ignore_query=True)
+      if key not in self._seen:
+        self._seen.add(key)
+        new_documents.append(link)
+    self.documents.extend(new_documents)
+
+    if self.depth < self.max_depth:
+      for link in sorted(page_links):
+        if is_page_url(link) and in_scope(link, self.sites):
+          self._queue_page(link, self._next_level)
+    return new_documents
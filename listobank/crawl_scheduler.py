@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+"""
+Long-running retrieval scheduler.
+
+Every (entity, root URL) pair is a refresh job kept in a priority queue ordered by its next
+run time. A job's interval starts at the entity's `"refresh_hours"` configuration (default
+24) and adapts to how often the source changes: it halves after a run that found new or
+changed PDFs and grows by half after a run that found none, within a quarter and four times
+the configured interval. Next run times are jittered and the first runs are staggered, so
+entities are not all hit in one burst; at most `concurrency` jobs run at a time, and never
+two of the same entity. The schedule is persisted, so a restart resumes where it stopped.
+"""
+import argparse
+import concurrent.futures
+import datetime
+import heapq
+import os
+import random
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+from pydantic import BaseModel, Field
+
+from domain_config import domain_manager
+
+DB_PATH = Path(os.getenv("SCHEDULE_DB", Path.cwd() / ".cache" / "schedule.sqlite"))
+
+DEFAULT_REFRESH_HOURS = 24.0
+MIN_INTERVAL_FACTOR = 0.25
+MAX_INTERVAL_FACTOR = 4.0
+# interval multipliers after a run that found changes / found none
+SPEEDUP = 0.5
+SLOWDOWN = 1.5
+# fraction of the interval by which a next run time is moved at random
+JITTER = 0.1
+# runs of new and overdue jobs at startup are spread over this many seconds
+STARTUP_SPREAD = 15 * 60
+# a failed job is retried after at most this many seconds
+ERROR_RETRY = 60 * 60
+DEFAULT_CONCURRENCY = 4
+
+_lock = threading.Lock()
+_connections: dict[Path, sqlite3.Connection] = {}
+
+
+class RefreshJob(BaseModel):
+  entity: str = Field(
+      ..., description="entity the root URL belongs to"
+  )
+  url: str = Field(
+      ..., description="document root URL to crawl"
+  )
+  interval: float = Field(
+      ..., description="current refresh interval in seconds"
+  )
+  next_run: float = Field(
+      ..., description="when the job is due, as a Unix timestamp"
+  )
+  last_run: float | None = Field(
+      default=None, description="when the job last ran"
+  )
+  last_changed: float | None = Field(
+      default=None, description="when the job last found new or changed PDFs"
+  )
+  error: str | None = Field(
+      default=None, description="error of the last run, if it failed"
+  )
+
+
+def _connect(db_path: Path) -> sqlite3.Connection:
+  conn = _connections.get(db_path)
+  if conn is None:
+    db_path.parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(str(db_path), check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS jobs (
+            entity TEXT NOT NULL,
+            url TEXT NOT NULL,
+            interval REAL NOT NULL,
+            next_run REAL NOT NULL,
+            last_run REAL,
+            last_changed REAL,
+            error TEXT,
+            PRIMARY KEY (entity, url)
+        )
+        """
+    )
+    conn.commit()
+    _connections[db_path] = conn
+  return conn
+
+
+def load_jobs(db_path: Path = DB_PATH) -> dict[tuple[str, str], RefreshJob]:
+  with _lock:
+    rows = _connect(db_path).execute("SELECT * FROM jobs").fetchall()
+  return {(row["entity"], row["url"]): RefreshJob.model_validate(dict(row)) for row in rows}
+
+
+def save_job(job: RefreshJob, db_path: Path = DB_PATH) -> None:
+  with _lock:
+    conn = _connect(db_path)
+    conn.execute(
+        """
+        INSERT OR REPLACE INTO jobs(entity, url, interval, next_run, last_run, last_changed, error)
+        VALUES(?, ?, ?, ?, ?, ?, ?)
+        """,
+        (job.entity, job.url, job.interval, job.next_run, job.last_run, job.last_changed, job.error),
+    )
+    conn.commit()
+
+
+def configured_interval(entity: str) -> float:
+  """
+  The refresh interval of an entity in seconds, from its `"refresh_hours"` configuration.
+  """
+  config = domain_manager.config.entities.get(entity, {}) if domain_manager.config else {}
+  return float(config.get("refresh_hours", DEFAULT_REFRESH_HOURS)) * 3600
+
+
+def adapt_interval(interval: float, base_interval: float, changed: bool) -> float:
+  """
+  Shortens the interval of a source that changed and lengthens it for one that did not,
+  within MIN_INTERVAL_FACTOR and MAX_INTERVAL_FACTOR of its configured interval.
+  """
+  interval *= SPEEDUP if changed else SLOWDOWN
+  return min(max(interval, base_interval * MIN_INTERVAL_FACTOR), base_interval * MAX_INTERVAL_FACTOR)
+
+
+def jittered(delay: float, jitter: float = JITTER) -> float:
+  return delay * (1 + random.uniform(-jitter, jitter))
+
+
+class CrawlScheduler:
+  """
+  Runs refresh jobs as they fall due. `run_job(entity, url)` does the work and returns the
+  number of new or changed PDFs; by default it is pdf_retriever.download_pdfs.
+  With stagger=False, all jobs due at startup run right away (as `--once` does, so a run
+  from cron does every due job).
+  """
+
+  def __init__(self, entity_urls: dict[str, list[str]], run_job=None, concurrency: int = DEFAULT_CONCURRENCY,
+               jitter: float = JITTER, db_path: Path = DB_PATH, clock=time.time, stagger: bool = True):
+    self.run_job = run_job
+    self.concurrency = concurrency
+    self.jitter = jitter
+    self.db_path = db_path
+    self.clock = clock
+    self.jobs: dict[tuple[str, str], RefreshJob] = {}
+    self._queue: list[tuple[float, int, tuple[str, str]]] = []
+    self._sequence = 0
+    # due jobs waiting for the running job of their entity
+    self._waiting: dict[str, list[RefreshJob]] = {}
+
+    self.stagger = stagger
+    stored = load_jobs(db_path)
+    now = clock()
+    for entity, urls in entity_urls.items():
+      for url in urls:
+        self.jobs[(entity, url)] = stored.get((entity, url)) or RefreshJob(
+            entity=entity, url=url, interval=configured_interval(entity), next_run=now)
+    # new and overdue jobs are staggered evenly over the startup window instead of all starting
+    # at once; only their place in the queue moves, so the stored schedule still has them due
+    due = sorted((job for job in self.jobs.values() if job.next_run <= now), key=lambda job: job.next_run)
+    for i, job in enumerate(due):
+      save_job(job, db_path)
+      self._push(job, now + STARTUP_SPREAD * i / len(due) if stagger else job.next_run)
+    for job in self.jobs.values():
+      if job.next_run > now:
+        self._push(job)
+
+  def _push(self, job: RefreshJob, run_at: float | None = None) -> None:
+    self._sequence += 1
+    heapq.heappush(self._queue, (job.next_run if run_at is None else run_at, self._sequence, (job.entity, job.url)))
+
+  def _finish(self, job: RefreshJob, changed: int | None, error: str | None) -> None:
+    for waiting in self._waiting.pop(job.entity, []):
+      self._push(waiting)
+    now = self.clock()
+    base_interval = configured_interval(job.entity)
+    job.last_run = now
+    job.error = error
+    if error is None:
+      # a run_job that reports nothing found nothing
+      changed = changed or 0
+      job.interval = adapt_interval(job.interval, base_interval, changed > 0)
+      if changed:
+        job.last_changed = now
+      job.next_run = now + jittered(job.interval, self.jitter)
+    else:
+      job.next_run = now + jittered(min(job.interval, ERROR_RETRY), self.jitter)
+    save_job(job, self.db_path)
+    self._push(job)
+
+  def _execute(self, job: RefreshJob) -> int:
+    if self.run_job is not None:
+      return self.run_job(job.entity, job.url)
+    from pdf_retriever import download_pdfs
+    return download_pdfs(job.entity, [job.url])
+
+  def run(self, once: bool = False, poll_interval: float = 60.0) -> None:
+    """
+    Runs due jobs until interrupted. With once=True, returns when no job is due any more.
+    """
+    running: dict[concurrent.futures.Future, RefreshJob] = {}
+    with concurrent.futures.ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+      while True:
+        busy_entities = {job.entity for job in running.values()}
+        while self._queue and len(running) < self.concurrency and self._queue[0][0] <= self.clock():
+          _, _, key = heapq.heappop(self._queue)
+          job = self.jobs[key]
+          if job.entity in busy_entities:
+            self._waiting.setdefault(job.entity, []).append(job)
+            continue
+          busy_entities.add(job.entity)
+          print(f"[{datetime.datetime.now():%Y-%m-%d %H:%M:%S}] Refreshing {job.entity}: {job.url}")
+          running[executor.submit(self._execute, job)] = job
+
+        if once and not running and (not self._queue or self._queue[0][0] > self.clock()):
+          return
+        timeout = poll_interval
+        if self._queue and len(running) < self.concurrency:
+          timeout = min(timeout, max(0.0, self._queue[0][0] - self.clock()))
+        if not running:
+          time.sleep(timeout)
+          continue
+        done, _ = concurrent.futures.wait(running, timeout=timeout, return_when=concurrent.futures.FIRST_COMPLETED)
+        for future in done:
+          job = running.pop(future)
+          try:
+            changed, error = future.result(), None
+          except Exception as e:
+            changed, error = None, str(e) or type(e).__name__
+            print(f"[ERROR] Refreshing {job.entity} {job.url} failed: {error}")
+          self._finish(job, changed, error)
+
+
+def main():
+  parser = argparse.ArgumentParser(description="Refresh entity documents continuously on adaptive schedules")
+  parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY,
+                      help=f"Maximum jobs running at once (default: {DEFAULT_CONCURRENCY})")
+  parser.add_argument("--once", action="store_true", help="Run the jobs that are due and exit")
+  parser.add_argument("--status", action="store_true", help="Show the schedule and exit")
+  args = parser.parse_args()
+
+  if not domain_manager.config:
+    banking_config = Path("banking_domain.json")
+    if not banking_config.exists():
+      print("Error: No domain configuration found. Please provide a domain config file.")
+      return
+    domain_manager.load_config(banking_config)
+
+  if args.status:
+    for job in sorted(load_jobs().values(), key=lambda job: job.next_run):
+      next_run = datetime.datetime.fromtimestamp(job.next_run)
+      print(f"{next_run:%Y-%m-%d %H:%M}\t{job.interval / 3600:.1f}h\t{job.entity}\t{job.url}"
+            + (f"\t{job.error}" if job.error else ""))
+    return
+
+  entity_urls = {entity: list(urls) for entity, urls in domain_manager.config.entity_urls.items()
+                 if entity in domain_manager.config.entities}
+  scheduler = CrawlScheduler(entity_urls, concurrency=args.concurrency, stagger=not args.once)
+  try:
+    scheduler.run(once=args.once)
+  except KeyboardInterrupt:
+    print("Stopped; the schedule is saved")
+
+
+if __name__ == "__main__":
+  main()
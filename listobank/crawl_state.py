@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+"""
+Crawl state of every retrieved URL.
+
+For listing pages and PDFs alike, the ETag and Last-Modified validators of the last
+response, its status and, for pages, the PDF and page links found on it are kept in a
+small SQLite database. Retrieval sends them back as If-None-Match/If-Modified-Since, so an
+unchanged listing page costs a 304 and its cached links are reused without parsing HTML.
+"""
+import argparse
+import datetime
+import json
+import os
+import sqlite3
+import threading
+from pathlib import Path
+
+from pydantic import BaseModel, Field
+
+DB_PATH = Path(os.getenv("CRAWL_STATE_DB", Path.cwd() / ".cache" / "crawl_state.sqlite"))
+
+_lock = threading.Lock()
+_connections: dict[Path, sqlite3.Connection] = {}
+
+
+class UrlState(BaseModel):
+  url: str = Field(
+      ..., description="requested URL"
+  )
+  kind: str = Field(
+      ..., description="'page' for listing pages, 'pdf' for documents"
+  )
+  etag: str | None = Field(
+      default=None, description="ETag of the last successful response"
+  )
+  last_modified: str | None = Field(
+      default=None, description="Last-Modified header of the last successful response"
+  )
+  status: int | None = Field(
+      default=None, description="HTTP status of the last request, None if it failed without a response"
+  )
+  links: list[str] | None = Field(
+      default=None, description="PDF links found on a listing page the last time it was parsed"
+  )
+  page_links: list[str] | None = Field(
+      default=None, description="links to other HTML pages found on a listing page the last time it was parsed"
+  )
+  error: str | None = Field(
+      default=None, description="error of the last request, if it failed"
+  )
+  checked_at: datetime.datetime = Field(
+      ..., description="when the URL was last requested"
+  )
+  changed_at: datetime.datetime | None = Field(
+      default=None, description="when the URL last returned new content"
+  )
+
+  def conditional_headers(self) -> dict[str, str]:
+    headers = {}
+    if self.etag:
+      headers["If-None-Match"] = self.etag
+    if self.last_modified:
+      headers["If-Modified-Since"] = self.last_modified
+    return headers
+
+
+def _connect(db_path: Path) -> sqlite3.Connection:
+  conn = _connections.get(db_path)
+  if conn is None:
+    db_path.parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(str(db_path), check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS urls (
+            url TEXT PRIMARY KEY,
+            kind TEXT NOT NULL,
+            etag TEXT,
+            last_modified TEXT,
+            status INTEGER,
+            links TEXT,
+            page_links TEXT,
+            error TEXT,
+            checked_at TEXT NOT NULL,
+            changed_at TEXT
+        )
+        """
+    )
+    columns = {row["name"] for row in conn.execute("PRAGMA table_info(urls)")}
+    if "page_links" not in columns:
+      # databases created before page links were recorded
+      conn.execute("ALTER TABLE urls ADD COLUMN page_links TEXT")
+    conn.commit()
+    _connections[db_path] = conn
+  return conn
+
+
+def _from_row(row: sqlite3.Row) -> UrlState:
+  data = dict(row)
+  for name in ("links", "page_links"):
+    data[name] = json.loads(data[name]) if data[name] is not None else None
+  return UrlState.model_validate(data)
+
+
+def get(url: str, db_path: Path = DB_PATH) -> UrlState | None:
+  with _lock:
+    row = _connect(db_path).execute("SELECT * FROM urls WHERE url = ?", (url,)).fetchone()
+  return _from_row(row) if row is not None else None
+
+
+def record(url: str, kind: str, status: int | None, etag: str | None = None, last_modified: str | None = None,
+           links: set[str] | list[str] | None = None, page_links: set[str] | list[str] | None = None,
+           error: str | None = None, changed: bool | None = None, db_path: Path = DB_PATH) -> None:
+  """
+  Records the outcome of a request. A 304 or a failed request keeps the stored validators
+  and links; a 2xx replaces them and marks the URL as changed, unless changed=False.
+  """
+  now = datetime.datetime.now(datetime.timezone.utc).isoformat()
+  if changed is None:
+    changed = status is not None and 200 <= status < 300
+  with _lock:
+    conn = _connect(db_path)
+    if changed:
+      conn.execute(
+          """
+          INSERT OR REPLACE INTO urls(url, kind, etag, last_modified, status, links, page_links, error,
+                                      checked_at, changed_at)
+          VALUES(?, ?, ?, ?, ?, ?, ?, NULL, ?, ?)
+          """,
+          (url, kind, etag, last_modified, status,
+           json.dumps(sorted(links)) if links is not None else None,
+           json.dumps(sorted(page_links)) if page_links is not None else None, now, now),
+      )
+    else:
+      conn.execute(
+          """
+          INSERT INTO urls(url, kind, status, error, checked_at) VALUES(?, ?, ?, ?, ?)
+          ON CONFLICT(url) DO UPDATE SET status = excluded.status, error = excluded.error,
+              checked_at = excluded.checked_at
+          """,
+          (url, kind, status, error, now),
+      )
+    conn.commit()
+
+
+def unchanged(state: UrlState | None, headers) -> bool:
+  """
+  Whether response headers show the same content as the stored state, for servers that
+  answer conditional requests with a full 200 response.
+  """
+  if state is None:
+    return False
+  etag = headers.get("ETag")
+  if etag and state.etag:
+    return etag == state.etag
+  last_modified = headers.get("Last-Modified")
+  return bool(last_modified and state.last_modified and last_modified == state.last_modified)
+
+
+def record_response(url: str, kind: str, status: int, headers, links: set[str] | list[str] | None = None,
+                    page_links: set[str] | list[str] | None = None, db_path: Path = DB_PATH) -> None:
+  """
+  Records a response with new content, keeping its validators (and the links of a page).
+  """
+  record(url, kind, status, etag=headers.get("ETag"), last_modified=headers.get("Last-Modified"), links=links,
+         page_links=page_links, db_path=db_path)
+
+
+def record_failure(url: str, kind: str, error: BaseException, status: int | None = None,
+                   db_path: Path = DB_PATH) -> None:
+  record(url, kind, status, error=str(error) or type(error).__name__, db_path=db_path)
+
+
+def page_request(url: str, db_path: Path = DB_PATH) -> tuple[UrlState | None, dict[str, str]]:
+  """
+  The state of a listing page and the conditional headers to request it with. A page whose
+  links were not recorded is requested unconditionally, since a 304 could not be answered.
+  """
+  state = get(url, db_path)
+  if state is not None and (state.links is None or state.page_links is None):
+    state = None
+  return state, state.conditional_headers() if state is not None else {}
+
+
+def cached_links(state: UrlState) -> tuple[set[str], set[str]]:
+  return set(state.links), set(state.page_links)
+
+
+def revalidated(url: str, kind: str, state: UrlState | None, status: int, headers, known_etag: str | None = None,
+                db_path: Path = DB_PATH) -> bool:
+  """
+  Whether a response shows that the content is unchanged: a 304, or a 2xx whose validators
+  match the stored state (or known_etag) from a server that ignored the conditional headers.
+  The outcome is recorded; the body of such a response need not be read.
+  """
+  if status == 304:
+    record(url, kind, 304, db_path=db_path)
+    return True
+  if 200 <= status < 300 and (unchanged(state, headers) or (known_etag and headers.get("ETag") == known_etag)):
+    record(url, kind, status, changed=False, db_path=db_path)
+    return True
+  return False
+
+
+def main():
+  parser = argparse.ArgumentParser(description="Show the crawl state of retrieved URLs")
+  parser.add_argument("--kind", choices=["page", "pdf"], help="Only show listing pages or PDFs")
+  parser.add_argument("--errors", action="store_true", help="Only show URLs whose last request failed")
+  args = parser.parse_args()
+
+  query, params = "SELECT * FROM urls", []
+  clauses = []
+  if args.kind:
+    clauses.append("kind = ?")
+    params.append(args.kind)
+  if args.errors:
+    clauses.append("(error IS NOT NULL OR status >= 400)")
+  if clauses:
+    query += " WHERE " + " AND ".join(clauses)
+  with _lock:
+    rows = _connect(DB_PATH).execute(query + " ORDER BY kind, url", params).fetchall()
+  for row in rows:
+    state = _from_row(row)
+    changed = state.changed_at.date().isoformat() if state.changed_at else "-"
+    print(f"{state.kind}\t{state.status or '-'}\t{changed}\t{state.url}" + (f"\t{state.error}" if state.error else ""))
+
+
+if __name__ == "__main__":
+  main()
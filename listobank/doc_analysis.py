@@ -1,14 +1,41 @@
 import datetime
+import json
+import threading
 from hashlib import md5
-from pydantic import BaseModel, Field, HttpUrl, ValidationError
-from utils import extract_pages_text
+from typing import Iterator
+from itertools import islice
+from contextlib import closing, contextmanager
+from pydantic import BaseModel, Field, HttpUrl, PrivateAttr, ValidationError
+from utils import extract_pages_text, iter_pages_text, page_count
 from pathlib import Path
 from domain_config import domain_manager
+import extraction_cache
+import fingerprints
+import sidecars
+import catalog
+import boilerplate
+from atomic_io import atomic_write_text
+from extraction_engines import engine_for_entity
+
+
+class ClassificationInputs(BaseModel):
+  content_hash: str = Field(
+      ..., description="content hash of the file that was classified"
+  )
+  categories_hash: str = Field(
+      ..., description="hash of the category identifiers and descriptions offered to the model"
+  )
+  prompt_version: int = Field(
+      ..., description="version of the classification prompt template"
+  )
+  model: str = Field(
+      ..., description="model that produced the classification"
+  )
 
 
 class DocumentAnalysis(BaseModel):
-  retrieved_from: HttpUrl = Field(
-      ..., description="URL from which the document was retrieved, if applicable"
+  retrieved_from: HttpUrl | None = Field(
+      default=None, description="URL from which the document was retrieved, if applicable"
   )
   retrieved_at: datetime.datetime = Field(
       ..., description="timestamp of when the document was retrieved"
@@ -34,52 +61,374 @@ class DocumentAnalysis(BaseModel):
   effective_date: datetime.datetime | None = Field(
       default=None, description="date when the document becomes effective"
   )
-  pages_text: list[str] | None = Field(
-      default=None, description="text content of each page in the document"
+  page_count: int | None = Field(
+      default=None, description="total number of pages in the document, used to detect partially extracted pages_text"
+  )
+  extraction_engine: str | None = Field(
+      default=None, description="text-extraction engine that produced pages_text"
+  )
+  page_hashes: list[str] | None = Field(
+      default=None, description="hash of the text of each page in pages_text, used to find unchanged pages when the file changes"
+  )
+  embedded_page_hashes: list[str] | None = Field(
+      default=None, description="hash of the cleaned text of each page, as embedded in page_embeddings"
+  )
+  indexed_page_hashes: list[str] | None = Field(
+      default=None, description="hashes of the cleaned page text as last pushed to the embeddings search index"
   )
-  page_embeddings: list[list[float]] | None = Field(
-      default=None, description="embedding vectors for each page in pages_text"
+  previous_content_hash: str | None = Field(
+      default=None, description="content hash of an earlier version of the file whose embeddings sidecar can still be reused"
   )
+  previous_page_hashes: list[str] | None = Field(
+      default=None, description="embedded_page_hashes of the earlier version, aligned with its embeddings"
+  )
+  near_duplicate_of: Path | None = Field(
+      default=None, description="relative path of a near-identical document whose classification and embeddings were reused"
+  )
+  classified_with: ClassificationInputs | None = Field(
+      default=None, description="inputs of the last classification, used to skip documents whose inputs did not change"
+  )
+
+  # Page text and embeddings live in sidecar files (see sidecars.py) and are only read
+  # when first accessed, so metadata-only reads stay small.
+  _pages_text: list[str] | None = PrivateAttr(default=None)
+  _clean_pages_text: list[str] | None = PrivateAttr(default=None)
+  _page_embeddings: list[list[float]] | None = PrivateAttr(default=None)
+  _loaded_sidecars: set[str] = PrivateAttr(default_factory=set)
+  _dirty_sidecars: set[str] = PrivateAttr(default_factory=set)
+  # Fields changed since the analysis was last written, and whether it was ever written
+  # (or loaded from disk). save() is a no-op when nothing changed.
+  _dirty_fields: set[str] = PrivateAttr(default_factory=set)
+  _persisted: bool = PrivateAttr(default=False)
+  _defer_depth: int = PrivateAttr(default=0)
+
+  def __setattr__(self, name, value):
+    if name in type(self).model_fields and getattr(self, name) != value:
+      self._dirty_fields.add(name)
+    super().__setattr__(name, value)
 
-  def get_pages_as_text(self, indent_level: int = 0) -> list[str]:
+  @property
+  def is_dirty(self) -> bool:
+    return not self._persisted or bool(self._dirty_fields) or bool(self._dirty_sidecars)
+
+  @property
+  def pages_text(self) -> list[str] | None:
     """
-    Extracts and returns a list of text content for each page in the document.
+    Text content of each page in the document.
+    """
+    if "pages" not in self._loaded_sidecars:
+      self._pages_text = sidecars.read_pages(self.relative_file_path, self.content_hash)
+      self._loaded_sidecars.add("pages")
+    return self._pages_text
+
+  @pages_text.setter
+  def pages_text(self, value: list[str] | None):
+    self._pages_text = value
+    self._loaded_sidecars.add("pages")
+    self._dirty_sidecars.add("pages")
+
+  @property
+  def clean_pages_text(self) -> list[str] | None:
+    """
+    Text of each page with repeated headers, footers and page numbers removed (see boilerplate.py).
+    """
+    if "clean" not in self._loaded_sidecars:
+      self._clean_pages_text = sidecars.read_clean_pages(self.relative_file_path, self.content_hash)
+      self._loaded_sidecars.add("clean")
+    return self._clean_pages_text
+
+  @clean_pages_text.setter
+  def clean_pages_text(self, value: list[str] | None):
+    self._clean_pages_text = value
+    self._loaded_sidecars.add("clean")
+    self._dirty_sidecars.add("clean")
+
+  @property
+  def page_embeddings(self) -> list[list[float]] | None:
+    """
+    Embedding vectors for each page in pages_text.
+    """
+    if "embeddings" not in self._loaded_sidecars:
+      self._page_embeddings = sidecars.read_embeddings(self.relative_file_path, self.content_hash)
+      self._loaded_sidecars.add("embeddings")
+    return self._page_embeddings
+
+  @page_embeddings.setter
+  def page_embeddings(self, value: list[list[float]] | None):
+    self._page_embeddings = value
+    self._loaded_sidecars.add("embeddings")
+    self._dirty_sidecars.add("embeddings")
+
+  @property
+  def engine(self) -> str:
+    """
+    Extraction engine for this document: the one that produced pages_text, otherwise the
+    engine configured for the entity.
+    """
+    return self.extraction_engine or engine_for_entity(self.bank)
+
+  @property
+  def pages_complete(self) -> bool:
+    """
+    Whether pages_text holds every page of the document. Analyses written before
+    page_count existed only ever stored fully extracted documents.
     """
     if not self.pages_text:
-      result = extract_pages_text(self.relative_file_path, indent_level=indent_level)
+      return False
+    return self.page_count is None or len(self.pages_text) >= self.page_count
+
+  def carry_over(self, previous: "DocumentAnalysis") -> None:
+    """
+    Keeps per-page work from the analysis of an earlier version of the same file: its
+    embeddings stay reusable for pages whose text is unchanged, and pages already pushed
+    to the search index are remembered.
+    """
+    # embeddings are keyed on the cleaned text they were computed from; older analyses did
+    # not record it, so their embeddings are not reused
+    previous_hashes = previous.embedded_page_hashes
+    embeddings = previous.page_embeddings if previous_hashes else None
+    if previous_hashes and embeddings is not None and len(embeddings) == len(previous_hashes):
+      self.previous_content_hash = previous.content_hash
+      self.previous_page_hashes = previous_hashes
+    else:
+      self.previous_content_hash = previous.previous_content_hash
+      self.previous_page_hashes = previous.previous_page_hashes
+    self.indexed_page_hashes = previous.indexed_page_hashes
+
+  def reusable_embeddings(self) -> dict[str, list[float]]:
+    """
+    Embeddings of this file, of an earlier version of it and of its near-duplicate, by the
+    hash of the cleaned page text they were computed from.
+    """
+    reusable = {}
+    if self.near_duplicate_of and self.near_duplicate_of != self.relative_file_path:
+      try:
+        duplicate = load_document_analysis(self.near_duplicate_of)
+      except (FileNotFoundError, ValueError):
+        duplicate = None
+      if duplicate is not None and duplicate.embedded_page_hashes:
+        embeddings = duplicate.page_embeddings
+        if embeddings is not None and len(duplicate.embedded_page_hashes) == len(embeddings):
+          reusable.update(zip(duplicate.embedded_page_hashes, embeddings))
+    if self.previous_content_hash and self.previous_page_hashes:
+      embeddings = sidecars.read_embeddings(self.relative_file_path, self.previous_content_hash)
+      if embeddings is not None and len(embeddings) == len(self.previous_page_hashes):
+        reusable.update(zip(self.previous_page_hashes, embeddings))
+    if self.embedded_page_hashes:
+      embeddings = self.page_embeddings
+      if embeddings is not None and len(embeddings) == len(self.embedded_page_hashes):
+        reusable.update(zip(self.embedded_page_hashes, embeddings))
+    return reusable
+
+  def load_cached_pages(self) -> bool:
+    """
+    Adopts page text from the shared extraction cache if it holds more pages than pages_text.
+    Returns True if pages were taken from the cache.
+    """
+    cached = extraction_cache.get(self.content_hash, self.engine)
+    if cached is None or len(cached.pages) <= len(self.pages_text or []):
+      return False
+    self.pages_text = cached.pages
+    self.page_count = cached.page_count
+    self.extraction_engine = self.engine
+    return True
+
+  def iter_pages_text(self, indent_level: int = 0) -> Iterator[str]:
+    """
+    Lazily yields the text content of each page in the document. Already extracted pages
+    are served from pages_text; extraction resumes after the last stored page and stops as
+    soon as the consumer stops iterating. Newly extracted pages are kept and saved.
+    """
+    if not self.pages_complete:
+      self.load_cached_pages()
+    if self.pages_text is None:
+      self.pages_text = []
+    yield from list(self.pages_text)
+    if self.pages_complete:
+      return
+
+    engine = self.engine
+    if self.page_count is None:
+      self.page_count = page_count(self.relative_file_path, engine=engine)
+    extracted = 0
+    try:
+      for text in iter_pages_text(self.relative_file_path, start=len(self.pages_text), indent_level=indent_level,
+                                  engine=engine):
+        self.pages_text.append(text)
+        self._dirty_sidecars.add("pages")
+        extracted += 1
+        yield text
+    finally:
+      if extracted:
+        self.extraction_engine = engine
+        extraction_cache.put(self.content_hash, self.pages_text, self.page_count, engine=engine)
+        self.save()
+
+  def get_pages_as_text(self, indent_level: int = 0, workers: int | None = None, limit: int = 0) -> list[str]:
+    """
+    Extracts and returns a list of text content for each page in the document.
+    workers > 1 extracts the pages in a process pool. With a limit, only the first
+    `limit` pages are extracted (or taken from previously extracted pages).
+    """
+    if limit != 0:
+      with closing(self.iter_pages_text(indent_level=indent_level)) as pages:
+        result = list(islice(pages, limit))
       if not result:
         raise ValueError(f"No text extracted from {self.relative_file_path}. "
                          "Ensure the file is a valid PDF and contains extractable text.")
-      self.pages_text = result
+      return result
+
+    if not self.pages_complete and self.load_cached_pages() and self.pages_complete:
       self.save()
+    if not self.pages_complete:
+      if self.pages_text and not (workers and workers > 1):
+        # resume a partial extraction where it stopped
+        result = list(self.iter_pages_text(indent_level=indent_level))
+      else:
+        engine = self.engine
+        result = extract_pages_text(self.relative_file_path, indent_level=indent_level, workers=workers, engine=engine)
+        self.pages_text = result
+        self.page_count = len(result)
+        self.extraction_engine = engine
+        extraction_cache.put(self.content_hash, result, len(result), engine=engine)
+        self.save()
+      if not result:
+        raise ValueError(f"No text extracted from {self.relative_file_path}. "
+                         "Ensure the file is a valid PDF and contains extractable text.")
       return result
     else:
       return self.pages_text
 
+  def get_clean_pages_as_text(self, indent_level: int = 0, workers: int | None = None, limit: int = 0) -> list[str]:
+    """
+    Like get_pages_as_text(), with boilerplate removed. Uses the cleaned text written by the
+    boilerplate stage (which also removes lines shared across the entity's documents) and
+    otherwise removes the lines repeated within this document.
+    """
+    pages = self.get_pages_as_text(indent_level=indent_level, workers=workers, limit=limit)
+    cleaned = self.clean_pages_text
+    if cleaned is None or len(cleaned) < len(pages):
+      cleaned = boilerplate.clean_pages(pages, boilerplate.document_boilerplate(pages))
+      if len(pages) == len(self.pages_text or []) and self.pages_complete:
+        self.clean_pages_text = cleaned
+        self.save()
+    return cleaned[:len(pages)]
+
+  @contextmanager
+  def deferred_save(self):
+    """
+    Coalesces every save() inside the block into a single write when the block exits.
+    """
+    self._defer_depth += 1
+    try:
+      yield self
+    finally:
+      self._defer_depth -= 1
+      if self._defer_depth == 0:
+        self.flush()
+
   def save(self):
     """
     Save the document analysis to a JSON file in the specified root directory.
+    Inside deferred_save() or deferred_saves() the write is postponed until the block exits.
+    """
+    if self._defer_depth > 0:
+      return
+    if _defer_saves(self):
+      return
+    self.flush()
+
+  def flush(self):
     """
-    analysis_file = self.relative_file_path.with_suffix(".analysis.json")
-    with analysis_file.open('w', encoding='utf-8') as f:
-      f.write(self.model_dump_json(indent=2, exclude_none=True))
+    Writes pending changes: sidecars whose content changed, then the metadata file if anything
+    changed. Files are replaced atomically, so concurrent readers never see a partial write.
+    """
+    if not self.is_dirty:
+      return
+    if "pages" in self._dirty_sidecars and self._pages_text is not None:
+      sidecars.write_pages(self.relative_file_path, self.content_hash, self._pages_text)
+      self.page_hashes = page_text_hashes(self._pages_text)
+      if "clean" not in self._dirty_sidecars:
+        # cleaned text of the previous page text is stale
+        sidecars.remove_clean_pages(self.relative_file_path)
+        self._clean_pages_text = None
+    if "clean" in self._dirty_sidecars and self._clean_pages_text is not None:
+      sidecars.write_clean_pages(self.relative_file_path, self.content_hash, self._clean_pages_text)
+    if "embeddings" in self._dirty_sidecars and self._page_embeddings is not None:
+      sidecars.write_embeddings(self.relative_file_path, self.content_hash, self._page_embeddings)
+      # the earlier version's embeddings were just overwritten
+      self.previous_content_hash = None
+      self.previous_page_hashes = None
+    self._dirty_sidecars.clear()
+    if self._dirty_fields or not self._persisted:
+      analysis_file = self.relative_file_path.with_suffix(".analysis.json")
+      atomic_write_text(analysis_file, self.model_dump_json(indent=2, exclude_none=True))
+      self._dirty_fields.clear()
+      self._persisted = True
+      catalog.upsert(self)
+
+
+# Analyses whose save() was postponed by deferred_saves(), flushed when the outermost block exits
+_deferred_lock = threading.Lock()
+_deferred_depth = 0
+_deferred_analyses: dict[int, DocumentAnalysis] = {}
+
+
+def _defer_saves(doc_analysis: DocumentAnalysis) -> bool:
+  with _deferred_lock:
+    if _deferred_depth == 0:
+      return False
+    _deferred_analyses[id(doc_analysis)] = doc_analysis
+    return True
+
+
+@contextmanager
+def deferred_saves():
+  """
+  Postpones every DocumentAnalysis.save() in the block, from any thread, and flushes each
+  modified analysis once when the outermost block exits. Use around a pipeline stage.
+  """
+  global _deferred_depth
+  with _deferred_lock:
+    _deferred_depth += 1
+  try:
+    yield
+  finally:
+    with _deferred_lock:
+      _deferred_depth -= 1
+      pending = list(_deferred_analyses.values()) if _deferred_depth == 0 else []
+      if _deferred_depth == 0:
+        _deferred_analyses.clear()
+    for doc_analysis in pending:
+      doc_analysis.flush()
+
+
+def page_text_hashes(pages: list[str]) -> list[str]:
+  return [md5(text.encode("utf-8")).hexdigest() for text in pages]
 
 
 def new_document_analysis(file_path: Path,
-                          retrieved_from: HttpUrl,
+                          retrieved_from: HttpUrl | None,
                           retrieved_at: datetime.datetime,
                           bank: str,
-                          retrieved_etag: str | None = None
+                          retrieved_etag: str | None = None,
+                          content_hash: str | None = None,
+                          size: int | None = None
                           ) -> DocumentAnalysis:
   """
   Create a new DocumentAnalysis object with the content hash and default category.
+  A content_hash (and size) computed while the file was written is recorded instead of
+  reading the file again.
   """
   if not file_path.is_file():
     raise FileNotFoundError(f"File {file_path} does not exist.")
-  content_hash = md5(file_path.read_bytes()).hexdigest()
+  if content_hash is not None:
+    fingerprints.record(file_path, content_hash, size)
+  else:
+    content_hash = fingerprints.content_hash(file_path)
   return DocumentAnalysis(
       relative_file_path=file_path,
-      retrieved_from=HttpUrl(retrieved_from),
+      retrieved_from=HttpUrl(str(retrieved_from)) if retrieved_from else None,
       retrieved_at=retrieved_at,
       bank=bank,
       content_hash=content_hash,
@@ -88,6 +437,30 @@ def new_document_analysis(file_path: Path,
   )
 
 
+LEGACY_INLINE_FIELDS = ("pages_text", "page_embeddings")
+
+
+def _parse_analysis(text: str) -> tuple[DocumentAnalysis, dict]:
+  """
+  Parses an analysis file, splitting off heavy fields that older files stored inline.
+  """
+  legacy_fields = {}
+  if any(f'"{name}"' in text for name in LEGACY_INLINE_FIELDS):
+    try:
+      data = json.loads(text)
+    except ValueError:
+      data = None
+  else:
+    data = None
+  if data is not None:
+    legacy_fields = {name: data.pop(name) for name in LEGACY_INLINE_FIELDS if data.get(name) is not None}
+    result = DocumentAnalysis.model_validate(data)
+  else:
+    result = DocumentAnalysis.model_validate_json(text)
+  result._persisted = True
+  return result, legacy_fields
+
+
 def load_document_analysis(file_path: Path, bank: str | None = None) -> DocumentAnalysis:
   """
   Load document analysis results from a JSON file.
@@ -98,24 +471,34 @@ def load_document_analysis(file_path: Path, bank: str | None = None) -> Document
   if not analysis_file.is_file():
     if bank is None:
       raise ValueError(f"No analysis file found for {file_path} and no bank specified")
-    return new_document_analysis(file_path, retrieved_from=HttpUrl("file://unknown"), 
-                                retrieved_at=datetime.datetime.now(datetime.timezone.utc), 
-                                bank=bank)
+    # a file that was not retrieved by the crawler, e.g. copied in by hand
+    return new_document_analysis(file_path, retrieved_from=None,
+                                 retrieved_at=datetime.datetime.now(datetime.timezone.utc),
+                                 bank=bank)
   with analysis_file.open('r', encoding='utf-8') as f:
     try:
-      result = DocumentAnalysis.model_validate_json(f.read())
+      result, legacy_fields = _parse_analysis(f.read())
       # validate content hash
-      content_hash = md5(file_path.read_bytes()).hexdigest()
+      content_hash = fingerprints.content_hash(file_path)
       if result.content_hash != content_hash:
         if bank is None:
           raise ValueError(f"Content hash mismatch for {file_path} and no bank specified for recreation")
-        return new_document_analysis(file_path, retrieved_from=HttpUrl("file://unknown"), 
-                                    retrieved_at=datetime.datetime.now(datetime.timezone.utc), 
-                                    bank=bank)
+        # the file was republished at the URL it was retrieved from
+        updated = new_document_analysis(file_path, retrieved_from=result.retrieved_from,
+                                        retrieved_at=datetime.datetime.now(datetime.timezone.utc),
+                                        bank=bank)
+        updated.carry_over(result)
+        return updated
+      if legacy_fields:
+        # move inline page text/embeddings from older analysis files into sidecars
+        for name, value in legacy_fields.items():
+          setattr(result, name, value)
+        result._persisted = False
+        result.save()
       return result
     except ValidationError:
       if bank is None:
         raise ValueError(f"Invalid analysis file for {file_path} and no bank specified")
-      return new_document_analysis(file_path, retrieved_from=HttpUrl("file://unknown"), 
-                                  retrieved_at=datetime.datetime.now(datetime.timezone.utc), 
-                                  bank=bank)
+      return new_document_analysis(file_path, retrieved_from=None,
+                                   retrieved_at=datetime.datetime.now(datetime.timezone.utc),
+                                   bank=bank)
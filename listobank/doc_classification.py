@@ -1,12 +1,16 @@
 #!/usr/bin/env python3
+import argparse
 import concurrent.futures
 import datetime
+import json
+from hashlib import md5
 
 from pydantic import BaseModel, Field
-from doc_analysis import load_document_analysis
+from doc_analysis import ClassificationInputs, DocumentAnalysis, deferred_saves, load_document_analysis
+from near_duplicates import find_duplicate_documents
 from tqdm import tqdm
 from pathlib import Path
-from gemini import create_gemini, generate_content
+from gemini import MODEL_NAME, create_gemini, generate_content, get_scheduler
 from generic_domain_model import DocumentCategory, Categories
 from domain_config import domain_manager
 
@@ -14,6 +18,10 @@ root_dir = Path.cwd() / "data_new"
 
 
 PAGES_CONTEXT_LIMIT = 12
+# Bump when classification_prompt changes, so documents are reclassified with the new prompt
+PROMPT_VERSION = 1
+# Documents at least this similar to an already classified one reuse its category and effective date
+NEAR_DUPLICATE_THRESHOLD = 0.9
 
 class DocumentLLMClassification(BaseModel):
   category: str = Field(
@@ -52,30 +60,184 @@ def classification_prompt(categories: dict[str, str], file_name: str, page_texts
   return prompt
 
 
-def process_pdf(gemini, pdf_file):
+def categories_hash(categories: dict[str, str]) -> str:
+  return md5(json.dumps(categories, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def classification_inputs(doc_analysis: DocumentAnalysis, categories: dict[str, str]) -> ClassificationInputs:
+  """
+  Everything a classification depends on besides the model's randomness.
+  """
+  return ClassificationInputs(content_hash=doc_analysis.content_hash, categories_hash=categories_hash(categories),
+                              prompt_version=PROMPT_VERSION, model=MODEL_NAME)
+
+
+def needs_classification(doc_analysis: DocumentAnalysis, categories: dict[str, str]) -> bool:
+  return doc_analysis.classified_with != classification_inputs(doc_analysis, categories)
+
+
+def load_analysis(pdf_file) -> DocumentAnalysis | None:
+  """
+  Loads the analysis of a PDF, recreating it if the file changed or has none.
+  """
   if not pdf_file.is_file() or pdf_file.name.startswith("_"):
     return None
+  try:
+    return load_document_analysis(pdf_file, bank=pdf_file.parent.name)
+  except (FileNotFoundError, ValueError) as e:
+    print(f"Warning: Could not load DocumentAnalysis for {pdf_file}: {e}")
+    return None
+
 
-  doc_analysis = load_document_analysis(pdf_file)
-  pages_text = doc_analysis.get_pages_as_text(indent_level=1)[:PAGES_CONTEXT_LIMIT]
+def load_pages(doc_analysis: DocumentAnalysis) -> tuple[DocumentAnalysis, list[str]] | None:
+  """
+  Loads the pages of a document used for classification. A document whose pages cannot be
+  extracted is reported and skipped, so it does not abort the run.
+  """
+  try:
+    pages_text = doc_analysis.get_clean_pages_as_text(indent_level=1, limit=PAGES_CONTEXT_LIMIT)
+  except Exception as e:
+    print(f"[ERROR] Loading the pages of {doc_analysis.relative_file_path} failed: {e}")
+    return None
   if not pages_text:
-    print(f"Warning: No text extracted from {pdf_file.name}. Skipping...")
+    print(f"Warning: No text extracted from {doc_analysis.relative_file_path.name}. Skipping...")
     return None
+  return doc_analysis, pages_text
 
+
+def classify_pdf(gemini, doc_analysis: DocumentAnalysis, pages_text: list[str], cache: bool = True) -> str:
+  pdf_file = doc_analysis.relative_file_path
   categories = Categories()
   prompt = classification_prompt(categories, pdf_file.name, pages_text)
   llm_classification: DocumentLLMClassification = generate_content(
-      gemini, prompt, response_schema=DocumentLLMClassification)
+      gemini, prompt, response_schema=DocumentLLMClassification, cache=cache)
+  doc_analysis.classified_with = classification_inputs(doc_analysis, categories)
   doc_analysis.category = llm_classification.category
   if llm_classification.effective_date:
     doc_analysis.effective_date = llm_classification.effective_date
   if llm_classification.document_title:
     doc_analysis.document_title = llm_classification.document_title
+  doc_analysis.near_duplicate_of = None
+  doc_analysis.save()
+  return llm_classification.category
+
+
+def try_classify_pdf(gemini, doc_analysis: DocumentAnalysis, pages_text: list[str], cache: bool = True) -> str | None:
+  """
+  Like classify_pdf(), but reports a failure instead of raising; the document keeps its
+  previous classification inputs, so the next run picks it up again.
+  """
+  try:
+    return classify_pdf(gemini, doc_analysis, pages_text, cache)
+  except Exception as e:
+    print(f"[ERROR] Classifying {doc_analysis.relative_file_path} failed: {e}")
+    return None
+
+
+def entity_of(path: Path) -> str:
+  return path.parent.name
+
+
+def find_entity_duplicates(pages_by_document: dict[Path, list[str]]) -> dict[Path, tuple[Path, float]]:
+  """
+  find_duplicate_documents() within each entity, so a document never takes over the
+  classification of another entity's document.
+  """
+  by_entity: dict[str, dict[Path, list[str]]] = {}
+  for path, pages_text in pages_by_document.items():
+    by_entity.setdefault(entity_of(path), {})[path] = pages_text
+  duplicates = {}
+  for documents in by_entity.values():
+    duplicates.update(find_duplicate_documents(documents, NEAR_DUPLICATE_THRESHOLD))
+  return duplicates
+
+
+def reuse_classification(doc_analysis: DocumentAnalysis, original: DocumentAnalysis) -> str:
+  """
+  Copies the classification of a near-identical document. The title is kept, since variants
+  of a document (e.g. different account tiers) share category and date but not title.
+  """
+  doc_analysis.category = original.category
+  if original.effective_date:
+    doc_analysis.effective_date = original.effective_date
+  doc_analysis.near_duplicate_of = original.relative_file_path
+  doc_analysis.classified_with = classification_inputs(doc_analysis, Categories())
   doc_analysis.save()
-  return (f"{pdf_file.parent.name}/{pdf_file.name}", llm_classification.category)
+  return original.category
+
+
+def classify_documents(root_dir: Path, full: bool = False, cache: bool = True) -> dict[Path, str]:
+  """
+  Classifies the PDFs under root_dir whose classification inputs changed (all of them with
+  full). Returns the category of each document classified or reused in this run.
+  """
+  pdf_files = list(root_dir.glob("**/*.pdf"))
+  categories = Categories()
+  # find out from the analyses alone whether anything needs classifying
+  with concurrent.futures.ThreadPoolExecutor() as executor:
+    stored = [doc_analysis for doc_analysis in executor.map(load_analysis, pdf_files) if doc_analysis]
+  stale = {doc_analysis.relative_file_path for doc_analysis in stored
+           if full or needs_classification(doc_analysis, categories)}
+  if not stale:
+    print(f"All {len(pdf_files)} documents are classified and unchanged")
+    return {}
+  # near-duplicates are variants an entity publishes side by side, so the unchanged documents
+  # of entities with stale ones are the candidates a classification can be reused from; they
+  # come first, so a stale document is matched to one of them rather than the other way round
+  stale_entities = {entity_of(path) for path in stale}
+  candidates = [doc_analysis for doc_analysis in stored if doc_analysis.relative_file_path not in stale
+                and entity_of(doc_analysis.relative_file_path) in stale_entities]
+  to_load = candidates + [doc_analysis for doc_analysis in stored if doc_analysis.relative_file_path in stale]
+
+  gemini = create_gemini()
+  # extracted pages and the classification of each document are written together, once
+  with deferred_saves():
+    with concurrent.futures.ThreadPoolExecutor() as executor:
+      loaded = [result for result in tqdm(executor.map(load_pages, to_load), total=len(to_load),
+                                          desc="Loading") if result]
+    analyses = {doc_analysis.relative_file_path: (doc_analysis, pages_text) for doc_analysis, pages_text in loaded}
+
+    # only one document of each group of near-duplicates is sent to the model
+    duplicates = find_entity_duplicates({path: pages_text for path, (_, pages_text) in analyses.items()})
+    originals = [path for path in analyses if path in stale and path not in duplicates]
+    # the shared request scheduler throttles and retries the calls; threads beyond its
+    # current concurrency limit wait for a slot. try_classify_pdf() reports failures, so one
+    # document cannot abort the others
+    scheduler = get_scheduler()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=scheduler.max_concurrency) as executor:
+      classified = dict(zip(originals, tqdm(
+          executor.map(lambda path: try_classify_pdf(gemini, *analyses[path], cache=cache), originals),
+          total=len(originals), desc="Classifying")))
+    results = {path: category for path, category in classified.items() if category is not None}
+    classified_count = len(results)
+    failed = len(originals) - classified_count
+    for path, (original_path, score) in duplicates.items():
+      if path not in stale:
+        continue
+      if original_path in stale and original_path not in results:
+        failed += 1
+        continue
+      try:
+        results[path] = reuse_classification(analyses[path][0], analyses[original_path][0])
+      except Exception as e:
+        print(f"[ERROR] Reusing the classification of {original_path} for {path} failed: {e}")
+        failed += 1
+        continue
+      print(f"{path.parent.name}/{path.name}: reused classification of {original_path.parent.name}/"
+            f"{original_path.name} (similarity {score:.2f}), review if needed")
+  print(f"{classified_count} documents classified, {len(results) - classified_count} reused, "
+        f"{failed} failed, {len(stored) - len(stale)} unchanged "
+        f"({scheduler.retries} retried calls, {scheduler.rate_limited} rate limited)")
+  return results
 
 
 def main():
+  parser = argparse.ArgumentParser(description="Classify the PDFs under data_new with Gemini")
+  parser.add_argument("--no-cache", action="store_true", help="Call Gemini even for prompts with a cached response")
+  parser.add_argument("--full", action="store_true",
+                      help="Reclassify every document, not only those whose file, categories, prompt or model changed")
+  args = parser.parse_args()
+
   # Initialize domain configuration
   if not domain_manager.config:
     from pathlib import Path
@@ -86,18 +248,14 @@ def main():
       print("Warning: No domain configuration found. Using default.")
       return
   
-  gemini = create_gemini()
-  pdf_files = list(root_dir.glob("**/*.pdf"))
-  with concurrent.futures.ThreadPoolExecutor() as executor:
-    results = list(
-        tqdm(executor.map(lambda pdf_file: process_pdf(gemini, pdf_file), pdf_files), total=len(pdf_files)))
+  results = classify_documents(root_dir, full=args.full, cache=not args.no_cache)
+  if not results:
+    return
 
-  # convert list of tuples in results to a dictionary
+  # convert the categories to a dictionary keyed by entity/file name
   file_categories = {}
-  for result in results:
-    if result:
-      fname, category = result
-      file_categories[fname] = category
+  for path, category in results.items():
+    file_categories[f"{path.parent.name}/{path.name}"] = category
 
   print()
   print("Classification Results:")
@@ -2,7 +2,7 @@
 
 import json
 from pathlib import Path
-from doc_analysis import load_document_analysis
+import catalog
 
 
 correct_classifications = {
@@ -76,22 +76,19 @@ correct_classifications = {
 
 def load_classification_results(data_dir: Path) -> dict[str, str]:
   """
-  Load classification results from DocumentAnalysis files.
+  Load classification results from the DocumentAnalysis catalog.
   """
   classifications = {}
-  
-  # Iterate through all subdirectories (banks)
-  for bank_dir in data_dir.iterdir():
-    if bank_dir.is_dir() and not bank_dir.name.startswith('_'):
-      # Iterate through PDF files in each bank directory
-      for pdf_file in bank_dir.glob('*.pdf'):
-        try:
-          doc_analysis = load_document_analysis(pdf_file)
-          relative_path = f"{bank_dir.name}/{pdf_file.name}"
-          classifications[relative_path] = doc_analysis.category.value
-        except Exception as e:
-          print(f"Error loading analysis for {pdf_file}: {e}")
-  
+
+  catalog.sync(data_dir)
+  for entry in catalog.find_documents(root_dir=data_dir):
+    pdf_file = entry.pdf_path
+    # Only PDFs present in bank subdirectories, as classified by doc_classification
+    if pdf_file.parent.name.startswith('_') or not pdf_file.is_file():
+      continue
+    relative_path = f"{pdf_file.parent.name}/{pdf_file.name}"
+    classifications[relative_path] = entry.category
+
   return classifications
 
 
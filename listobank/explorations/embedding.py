@@ -1,9 +1,10 @@
 #!/usr/bin/env python3
+import os
 from sklearn.decomposition import PCA
 from sklearn.cluster import KMeans, AgglomerativeClustering, DBSCAN, HDBSCAN
 import pandas as pd
 import json
-from utils import extract_pages_text
+from utils import extract_documents_text
 from time import sleep
 import numpy as np
 import fasttext
@@ -47,6 +48,12 @@ def weighted_mean_pooling(embeddings, decay_rate: float = 0.5, max_pages: int =
 
 pdf_fnames = {}
 
+all_pdf_files = [
+    pdf_file for pdf_file in root_dir.glob("*/*.pdf")
+    if pdf_file.is_file() and not pdf_file.name.startswith("_")
+]
+all_pages_text = extract_documents_text(all_pdf_files, limit=2, workers=os.cpu_count())
+
 for bank_folder in tqdm(list(root_dir.iterdir()), desc="Banks", unit="bank", leave=True):
   if not bank_folder.is_dir():
     continue
@@ -56,7 +63,7 @@ for bank_folder in tqdm(list(root_dir.iterdir()), desc="Banks", unit="bank", lea
     if not pdf_file.is_file() or pdf_file.name.startswith("_"):
       continue
 
-    pages_text = extract_pages_text(pdf_file, indent_level=2, limit=2)
+    pages_text = all_pages_text[pdf_file]
     pages_vecs = []
     for p in pages_text:
       line_vecs = []
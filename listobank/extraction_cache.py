@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""
+Content-addressed cache of extracted page text.
+
+Entries are keyed by the MD5 content hash stored in DocumentAnalysis.content_hash and
+the extraction engine, so the same PDF living in data/, data_extended/ and data_new/ is
+only extracted once per engine.
+The cache is bounded in size; least recently used entries are evicted first. Its size is
+counted once per process and then kept as a running total, so writes only scan the cache
+when it has outgrown its bound.
+"""
+import argparse
+import os
+import threading
+from pathlib import Path
+
+from pydantic import BaseModel, Field
+from extraction_engines import DEFAULT_ENGINE
+from atomic_io import atomic_write_text
+
+CACHE_DIR = Path(os.getenv("EXTRACTION_CACHE_DIR", Path.cwd() / ".cache" / "extraction"))
+MAX_CACHE_BYTES = int(os.getenv("EXTRACTION_CACHE_MAX_MB", "512")) * 1024 * 1024
+
+# a full cache is pruned to this fraction of its bound, so the next writes do not prune again
+PRUNE_TARGET = 0.9
+
+_lock = threading.Lock()
+# running total size of each cache directory written to by this process
+_sizes: dict[Path, int] = {}
+
+
+class CachedPages(BaseModel):
+  page_count: int | None = Field(
+      default=None, description="total number of pages in the document"
+  )
+  pages: list[str] = Field(
+      ..., description="text content of the extracted pages, possibly only the first few"
+  )
+
+  @property
+  def complete(self) -> bool:
+    return self.page_count is not None and len(self.pages) >= self.page_count
+
+
+def _entry_path(content_hash: str, engine: str, cache_dir: Path) -> Path:
+  return cache_dir / content_hash[:2] / f"{content_hash}.{engine}.json"
+
+
+def get(content_hash: str, engine: str = DEFAULT_ENGINE, cache_dir: Path = CACHE_DIR) -> CachedPages | None:
+  """
+  Returns the cached pages for a content hash, or None. A hit refreshes the entry's
+  position in the LRU order.
+  """
+  entry = _entry_path(content_hash, engine, cache_dir)
+  try:
+    cached = CachedPages.model_validate_json(entry.read_text(encoding="utf-8"))
+  except (FileNotFoundError, ValueError):
+    return None
+  try:
+    os.utime(entry)
+  except OSError:
+    pass
+  return cached
+
+
+def put(content_hash: str, pages: list[str], page_count: int | None = None, engine: str = DEFAULT_ENGINE,
+        cache_dir: Path = CACHE_DIR, max_bytes: int = MAX_CACHE_BYTES) -> None:
+  """
+  Stores extracted pages for a content hash. An existing entry holding more pages is
+  kept as is. Evicts least recently used entries if the cache grows beyond max_bytes.
+  """
+  existing = get(content_hash, engine, cache_dir)
+  if existing and len(existing.pages) >= len(pages):
+    return
+
+  entry = _entry_path(content_hash, engine, cache_dir)
+  data = CachedPages(page_count=page_count, pages=pages).model_dump_json()
+  try:
+    replaced_size = entry.stat().st_size
+  except FileNotFoundError:
+    replaced_size = 0
+  atomic_write_text(entry, data, fsync=False)
+
+  if max_bytes > 0:
+    with _lock:
+      if cache_dir in _sizes:
+        _sizes[cache_dir] += len(data.encode("utf-8")) - replaced_size
+      else:
+        _sizes[cache_dir] = sum(st.st_size for _, st in _entries(cache_dir))
+      full = _sizes[cache_dir] > max_bytes
+    if full:
+      prune(int(max_bytes * PRUNE_TARGET), cache_dir)
+
+
+def _entries(cache_dir: Path) -> list[tuple[Path, os.stat_result]]:
+  entries = []
+  for entry in cache_dir.glob("*/*.json"):
+    try:
+      entries.append((entry, entry.stat()))
+    except FileNotFoundError:
+      continue
+  return entries
+
+
+def prune(max_bytes: int = MAX_CACHE_BYTES, cache_dir: Path = CACHE_DIR) -> tuple[int, int]:
+  """
+  Evicts least recently used entries until the cache fits in max_bytes.
+  Returns the number of evicted entries and bytes freed.
+  """
+  entries = _entries(cache_dir)
+  total = sum(st.st_size for _, st in entries)
+  evicted, freed = 0, 0
+  for entry, st in sorted(entries, key=lambda e: e[1].st_mtime_ns):
+    if total <= max_bytes:
+      break
+    try:
+      entry.unlink()
+    except FileNotFoundError:
+      pass
+    total -= st.st_size
+    freed += st.st_size
+    evicted += 1
+  with _lock:
+    _sizes[cache_dir] = total
+  return evicted, freed
+
+
+def main():
+  parser = argparse.ArgumentParser(description="Inspect and prune the page text extraction cache")
+  parser.add_argument("--cache-dir", type=Path, default=CACHE_DIR, help=f"Cache directory (default: {CACHE_DIR})")
+  subparsers = parser.add_subparsers(dest="command", required=True)
+  subparsers.add_parser("stats", help="Show number of entries and total size")
+  prune_parser = subparsers.add_parser("prune", help="Evict least recently used entries")
+  prune_parser.add_argument("--max-mb", type=int, default=MAX_CACHE_BYTES // (1024 * 1024),
+                            help="Size to prune the cache down to, in MB (0 clears the cache)")
+  args = parser.parse_args()
+
+  if args.command == "stats":
+    entries = _entries(args.cache_dir)
+    total = sum(st.st_size for _, st in entries)
+    print(f"{len(entries)} entries, {total / (1024 * 1024):.1f} MB in {args.cache_dir}")
+  elif args.command == "prune":
+    evicted, freed = prune(args.max_mb * 1024 * 1024, args.cache_dir)
+    print(f"Evicted {evicted} entries, freed {freed / (1024 * 1024):.1f} MB")
+
+
+if __name__ == "__main__":
+  main()
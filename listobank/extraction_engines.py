@@ -0,0 +1,125 @@
+"""
+Registry of PDF text-extraction backends.
+
+Every engine exposes the same two operations (page count and lazy per-page text), so
+utils.extract_pages_text can switch backend per run (EXTRACTION_ENGINE) or per entity
+("extraction_engine" in the entity's domain configuration).
+"""
+import functools
+import os
+from pathlib import Path
+from typing import Iterator
+
+from domain_config import domain_manager
+
+DEFAULT_ENGINE = os.getenv("EXTRACTION_ENGINE", "pypdf2")
+
+
+class ExtractionEngine:
+  """Base class for PDF text-extraction backends."""
+  name: str = ""
+  # whether a page range costs less than the whole document; engines that parse whole
+  # documents are not split into chunks across worker processes
+  splits_pages: bool = True
+
+  def page_count(self, pdf_path: Path) -> int:
+    raise NotImplementedError
+
+  def iter_pages(self, pdf_path: Path, start: int = 0, stop: int | None = None) -> Iterator[str]:
+    """
+    Lazily yields the text of pages [start, stop) of the PDF, "" for pages without text.
+    """
+    raise NotImplementedError
+
+
+ENGINES: dict[str, type[ExtractionEngine]] = {}
+
+
+def register_engine(cls: type[ExtractionEngine]) -> type[ExtractionEngine]:
+  ENGINES[cls.name] = cls
+  return cls
+
+
+def get_engine(name: str | None = None) -> ExtractionEngine:
+  name = name or DEFAULT_ENGINE
+  if name not in ENGINES:
+    raise ValueError(f"Unknown extraction engine '{name}'. Available engines: {', '.join(sorted(ENGINES))}")
+  return ENGINES[name]()
+
+
+def engine_for_entity(entity: str | None) -> str:
+  """
+  Returns the extraction engine configured for an entity, falling back to DEFAULT_ENGINE.
+  """
+  if entity and domain_manager.config and entity in domain_manager.config.entities:
+    return domain_manager.config.entities[entity].get("extraction_engine", DEFAULT_ENGINE)
+  return DEFAULT_ENGINE
+
+
+@register_engine
+class PyPDF2Engine(ExtractionEngine):
+  name = "pypdf2"
+
+  def page_count(self, pdf_path: Path) -> int:
+    from PyPDF2 import PdfReader
+    return len(PdfReader(str(pdf_path)).pages)
+
+  def iter_pages(self, pdf_path: Path, start: int = 0, stop: int | None = None) -> Iterator[str]:
+    from PyPDF2 import PdfReader
+    reader = PdfReader(str(pdf_path))
+    stop = len(reader.pages) if stop is None else min(stop, len(reader.pages))
+    for i in range(start, stop):
+      yield reader.pages[i].extract_text() or ""
+
+
+@register_engine
+class PdfPlumberEngine(ExtractionEngine):
+  name = "pdfplumber"
+
+  def page_count(self, pdf_path: Path) -> int:
+    import pdfplumber
+    with pdfplumber.open(pdf_path) as pdf:
+      return len(pdf.pages)
+
+  def iter_pages(self, pdf_path: Path, start: int = 0, stop: int | None = None) -> Iterator[str]:
+    import pdfplumber
+    with pdfplumber.open(pdf_path) as pdf:
+      for page in pdf.pages[start:stop]:
+        yield page.extract_text() or ""
+        # drop cached layout objects so memory stays flat on long documents
+        page.flush_cache()
+
+
+@register_engine
+class OpenParseEngine(ExtractionEngine):
+  """
+  openparse parses a whole document into nodes at once; node text is grouped back into pages.
+  The parse is remembered per file version, so reading a document in several page ranges
+  parses it once.
+  """
+  name = "openparse"
+  splits_pages = False
+
+  def page_count(self, pdf_path: Path) -> int:
+    return PyPDF2Engine().page_count(pdf_path)
+
+  def iter_pages(self, pdf_path: Path, start: int = 0, stop: int | None = None) -> Iterator[str]:
+    pages = _openparse_pages(str(pdf_path), Path(pdf_path).stat().st_mtime_ns)
+    stop = len(pages) if stop is None else min(stop, len(pages))
+    for i in range(start, stop):
+      yield pages[i]
+
+
+@functools.lru_cache(maxsize=4)
+def _openparse_pages(pdf_path: str, mtime_ns: int) -> tuple[str, ...]:
+  """
+  Parses a document with openparse and returns the text of each page. mtime_ns keys the
+  cache on the file version.
+  """
+  import openparse
+  parsed = openparse.DocumentParser().parse(pdf_path)
+  pages: dict[int, list[str]] = {}
+  for node in parsed.nodes:
+    page = node.bbox[0].page if node.bbox else 0
+    pages.setdefault(page, []).append(node.text)
+  return tuple("\n".join(pages.get(i, [])) for i in range(PyPDF2Engine().page_count(Path(pdf_path))))
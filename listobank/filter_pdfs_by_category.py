@@ -1,7 +1,8 @@
 #!/usr/bin/env python3
 import argparse
 from pathlib import Path
-from doc_analysis import DocumentCategory, load_document_analysis
+import catalog
+from domain_config import domain_manager
 
 def main():
     parser = argparse.ArgumentParser(description="Print PDFs filtered by docanalysis category")
@@ -11,37 +12,36 @@ def main():
     args = parser.parse_args()
     
     # Validate category
-    try:
-        target_category = DocumentCategory(args.category)
-    except ValueError:
-        print(f"Error: Invalid category '{args.category}'")
-        print("Valid categories:", [c.value for c in DocumentCategory])
-        return
+    if not domain_manager.config:
+        banking_config = Path("banking_domain.json")
+        if banking_config.exists():
+            domain_manager.load_config(banking_config)
+    if domain_manager.config:
+        valid_categories = list(domain_manager.get_document_categories()) + [domain_manager.get_default_category()]
+        if args.category not in valid_categories:
+            print(f"Error: Invalid category '{args.category}'")
+            print("Valid categories:", valid_categories)
+            return
+    target_category = args.category
     
     root_dir = Path(args.data_dir)
     if not root_dir.exists():
         print(f"Error: Data directory '{root_dir}' does not exist")
         return
     
-    pdf_files = list(root_dir.glob("**/*.pdf"))
-    matching_files = []
-    
-    for pdf_file in pdf_files:
-        if pdf_file.name.startswith("_"):
-            continue
-            
-        try:
-            doc_analysis = load_document_analysis(pdf_file)
-            if doc_analysis and doc_analysis.category == target_category:
-                matching_files.append(pdf_file)
-        except Exception as e:
-            continue
+    # Pick up analyses changed outside DocumentAnalysis.save(), then query the catalog
+    catalog.sync(root_dir)
+    matching_files = [
+        entry.pdf_path
+        for entry in catalog.find_documents(category=target_category, root_dir=root_dir)
+        if not entry.pdf_path.name.startswith("_") and entry.pdf_path.is_file()
+    ]
     
     if matching_files:
         for pdf_file in matching_files:
             print(pdf_file)
     else:
-        print(f"No PDFs found with category '{target_category.value}'")
+        print(f"No PDFs found with category '{target_category}'")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+Cached file fingerprints.
+
+Computing the MD5 of every PDF each time its analysis is loaded means a full pipeline run
+hashes the corpus many times over. The MD5 of each file is remembered in a small SQLite
+database together with the file's (size, mtime_ns, inode); as long as those are unchanged
+the stored hash is returned without reading the file. Hard links to a file already hashed
+under another path (see blob_store) are recognized by their inode and not read either.
+"""
+import argparse
+import concurrent.futures
+import mmap
+import os
+import sqlite3
+import threading
+from hashlib import md5
+from pathlib import Path
+
+from tqdm.auto import tqdm
+
+DB_PATH = Path(os.getenv("FINGERPRINT_DB", Path.cwd() / ".cache" / "fingerprints.sqlite"))
+CHUNK_SIZE = 1024 * 1024
+
+_lock = threading.Lock()
+_connections: dict[Path, sqlite3.Connection] = {}
+
+
+def _connect(db_path: Path) -> sqlite3.Connection:
+  conn = _connections.get(db_path)
+  if conn is None:
+    db_path.parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(str(db_path), check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS fingerprints (
+            path TEXT PRIMARY KEY,
+            size INTEGER NOT NULL,
+            mtime_ns INTEGER NOT NULL,
+            inode INTEGER NOT NULL,
+            md5 TEXT NOT NULL
+        )
+        """
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_fingerprints_inode ON fingerprints(inode)")
+    conn.commit()
+    _connections[db_path] = conn
+  return conn
+
+
+def file_md5(path: Path) -> str:
+  """
+  Computes the MD5 of a file without loading it into memory, using mmap where possible.
+  """
+  digest = md5()
+  with open(path, "rb") as f:
+    try:
+      with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+        digest.update(m)
+    except (ValueError, OSError):
+      # empty files and special files cannot be mapped
+      for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+        digest.update(chunk)
+  return digest.hexdigest()
+
+
+def _key(path: Path) -> str:
+  return str(path.resolve())
+
+
+def record(path: Path, content_hash: str, size: int | None = None, db_path: Path = DB_PATH) -> None:
+  """
+  Remembers the hash of a file whose digest is already known, e.g. computed while writing it.
+  With size, the file is checked to still be the one that was hashed.
+  """
+  st = path.stat()
+  if size is not None and st.st_size != size:
+    raise ValueError(f"{path} is {st.st_size} bytes, but {size} bytes were hashed")
+  with _lock:
+    conn = _connect(db_path)
+    conn.execute(
+        "INSERT OR REPLACE INTO fingerprints(path, size, mtime_ns, inode, md5) VALUES(?, ?, ?, ?, ?)",
+        (_key(path), st.st_size, st.st_mtime_ns, st.st_ino, content_hash),
+    )
+    conn.commit()
+
+
+def content_hash(path: Path, db_path: Path = DB_PATH) -> str:
+  """
+  Returns the MD5 of a file, reading it only if its size, mtime or inode changed since the
+  hash was last recorded.
+  """
+  st = path.stat()
+  with _lock:
+    row = _connect(db_path).execute(
+        "SELECT size, mtime_ns, inode, md5 FROM fingerprints WHERE path = ?", (_key(path),)
+    ).fetchone()
+  if row is not None and tuple(row[:3]) == (st.st_size, st.st_mtime_ns, st.st_ino):
+    return row[3]
+  with _lock:
+    linked = _connect(db_path).execute(
+        "SELECT md5 FROM fingerprints WHERE inode = ? AND size = ? AND mtime_ns = ? LIMIT 1",
+        (st.st_ino, st.st_size, st.st_mtime_ns),
+    ).fetchone()
+  if linked is not None:
+    record(path, linked[0], db_path=db_path)
+    return linked[0]
+  digest = file_md5(path)
+  record(path, digest, db_path=db_path)
+  return digest
+
+
+def content_hashes(paths: list[Path], workers: int | None = None, verify: bool = False,
+                   db_path: Path = DB_PATH) -> dict[Path, str]:
+  """
+  Hashes many files in a thread pool (hashlib releases the GIL while hashing).
+  With verify=True every file is re-read and the stored fingerprints are refreshed.
+  """
+  def hash_one(path: Path) -> str:
+    if verify:
+      digest = file_md5(path)
+      record(path, digest, db_path=db_path)
+      return digest
+    return content_hash(path, db_path)
+
+  with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+    digests = list(tqdm(executor.map(hash_one, paths), total=len(paths), desc="Hashing files", unit="file"))
+  return dict(zip(paths, digests))
+
+
+def main():
+  parser = argparse.ArgumentParser(description="Warm or verify cached PDF fingerprints")
+  parser.add_argument("command", choices=["warm", "verify"],
+                      help="warm: hash files whose fingerprint changed; verify: re-hash every file")
+  parser.add_argument("--root-dir", type=Path, default=Path("data_new"),
+                      help="Directory to search for PDFs (default: data_new)")
+  parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                      help="Number of hashing threads (default: number of CPUs)")
+  args = parser.parse_args()
+
+  pdf_files = sorted(args.root_dir.glob("**/*.pdf"))
+  if args.command == "verify":
+    with _lock:
+      stored = {row[0]: row[1] for row in _connect(DB_PATH).execute("SELECT path, md5 FROM fingerprints")}
+    digests = content_hashes(pdf_files, workers=args.workers, verify=True)
+    changed = [path for path, digest in digests.items() if stored.get(_key(path), digest) != digest]
+    for path in changed:
+      print(f"Changed: {path}")
+    print(f"Verified {len(digests)} files, {len(changed)} changed since last recorded")
+  else:
+    content_hashes(pdf_files, workers=args.workers)
+    print(f"Fingerprinted {len(pdf_files)} files")
+
+
+if __name__ == "__main__":
+  main()
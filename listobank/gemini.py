@@ -1,15 +1,33 @@
+import hashlib
 import os
+import random
+import re
 import sys
+import threading
+import time
 from typing import Optional
 from google import genai
 from google.genai.types import Tool, GenerateContentConfig, GoogleSearch, SchemaUnion, ThinkingConfig
 
+import response_cache
+
 MODEL_NAME = "gemini-2.5-flash-preview-05-20"
 
 GOOGLE_SEARCH_TOOL = Tool(
     google_search=GoogleSearch()
 )
 
+# quotas of the API key; requests are throttled to stay within them
+REQUESTS_PER_MINUTE = int(os.getenv("GEMINI_RPM", "1000"))
+TOKENS_PER_MINUTE = int(os.getenv("GEMINI_TPM", "1000000"))
+MAX_CONCURRENCY = int(os.getenv("GEMINI_MAX_CONCURRENCY", "16"))
+MAX_RETRIES = int(os.getenv("GEMINI_MAX_RETRIES", "6"))
+RETRY_BASE_DELAY = 1.0
+RETRY_MAX_DELAY = 60.0
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+# rough number of prompt characters per token, to charge the token bucket before the call
+CHARS_PER_TOKEN = 4
+
 
 def create_gemini() -> genai.Client:
   """
@@ -24,12 +42,196 @@ def create_gemini() -> genai.Client:
   return client
 
 
-def generate_content(client: genai.Client, prompt: str, tools: list[Tool] = [], response_schema: Optional[SchemaUnion] = None):
+class TokenBucket:
+  """
+  Allows `per_minute` units per minute, in bursts of at most one minute's worth.
+  """
+
+  def __init__(self, per_minute: float, clock=time.monotonic, sleep=time.sleep):
+    self.capacity = float(per_minute)
+    self.rate = per_minute / 60.0
+    self.level = self.capacity
+    self.clock = clock
+    self.sleep = sleep
+    self.updated = clock()
+    self._lock = threading.Lock()
+
+  def _refill(self) -> None:
+    now = self.clock()
+    self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+    self.updated = now
+
+  def acquire(self, amount: float = 1) -> None:
+    """
+    Blocks until amount units are available and takes them. An amount larger than the
+    bucket waits for a full bucket and leaves it in debt.
+    """
+    while True:
+      with self._lock:
+        self._refill()
+        needed = min(amount, self.capacity)
+        if self.level >= needed:
+          self.level -= amount
+          return
+        wait = (needed - self.level) / self.rate
+      self.sleep(wait)
+
+  def adjust(self, amount: float) -> None:
+    """
+    Takes (or, if negative, returns) units once the actual cost of a request is known.
+    """
+    with self._lock:
+      self._refill()
+      self.level = min(self.capacity, self.level - amount)
+
+
+def retryable_status(error: BaseException) -> int | None:
+  """
+  The HTTP status of an API error worth retrying (rate limited or transient server error).
+  """
+  code = getattr(error, "code", None)
+  return code if code in RETRYABLE_STATUS else None
+
+
+def _retry_after(error: BaseException) -> float | None:
+  # 429 responses carry a RetryInfo detail such as {'retryDelay': '17s'}
+  match = re.search(r"retryDelay['\"]?\s*:\s*['\"](\d+(?:\.\d+)?)s", str(error))
+  return float(match.group(1)) if match else None
+
+
+class RequestScheduler:
+  """
+  Throttles API calls shared by all threads. Calls wait for the requests/minute and
+  tokens/minute buckets and for a concurrency slot. The concurrency limit follows AIMD: it
+  grows by one per limit-many successful calls and halves on a 429, at most once per
+  round of calls, so it settles just below the point where the quota starts rejecting
+  calls. Rate limited and transient server errors are retried with jittered exponential
+  backoff, honouring the delay the API asks for.
+  """
+
+  def __init__(self, requests_per_minute: float = REQUESTS_PER_MINUTE, tokens_per_minute: float = TOKENS_PER_MINUTE,
+               max_concurrency: int = MAX_CONCURRENCY, max_retries: int = MAX_RETRIES,
+               base_delay: float = RETRY_BASE_DELAY, max_delay: float = RETRY_MAX_DELAY,
+               clock=time.monotonic, sleep=time.sleep):
+    self.requests = TokenBucket(requests_per_minute, clock, sleep)
+    self.tokens = TokenBucket(tokens_per_minute, clock, sleep)
+    self.max_concurrency = max_concurrency
+    self.limit = max(1.0, max_concurrency / 2)
+    self.max_retries = max_retries
+    self.base_delay = base_delay
+    self.max_delay = max_delay
+    self.clock = clock
+    self.sleep = sleep
+    self.active = 0
+    self.retries = 0
+    self.rate_limited = 0
+    self._decreased_at = float("-inf")
+    self._condition = threading.Condition()
+
+  def _start(self) -> float:
+    with self._condition:
+      while self.active >= int(self.limit):
+        self._condition.wait()
+      self.active += 1
+      return self.clock()
+
+  def _end(self, started: float, rate_limited: bool) -> None:
+    with self._condition:
+      self.active -= 1
+      if rate_limited:
+        self.rate_limited += 1
+        # calls started before the last decrease saw the old limit and do not count again
+        if started >= self._decreased_at:
+          self.limit = max(1.0, self.limit / 2)
+          self._decreased_at = self.clock()
+      else:
+        self.limit = min(float(self.max_concurrency), self.limit + 1 / self.limit)
+      self._condition.notify_all()
+
+  def backoff(self, attempt: int, retry_after: float | None = None) -> float:
+    delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+    return max(delay, retry_after or 0.0)
+
+  def call(self, request, tokens: int = 0):
+    """
+    Runs request() within the quotas, retrying rate limited and transient failures.
+    tokens is the estimated token cost of the call.
+    """
+    for attempt in range(self.max_retries + 1):
+      self.requests.acquire()
+      self.tokens.acquire(tokens)
+      started = self._start()
+      try:
+        result = request()
+      except Exception as e:
+        status = retryable_status(e)
+        self._end(started, rate_limited=status == 429)
+        if status is None or attempt == self.max_retries:
+          raise
+        with self._condition:
+          self.retries += 1
+        delay = self.backoff(attempt, _retry_after(e))
+        print(f"Warning: Gemini returned {status}, retrying in {delay:.1f}s "
+              f"(attempt {attempt + 1}/{self.max_retries}, concurrency limit {int(self.limit)})", file=sys.stderr)
+        self.sleep(delay)
+        continue
+      self._end(started, rate_limited=False)
+      return result
+
+
+_scheduler: RequestScheduler | None = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler() -> RequestScheduler:
+  """
+  The request scheduler shared by all Gemini calls of the process.
+  """
+  global _scheduler
+  with _scheduler_lock:
+    if _scheduler is None:
+      _scheduler = RequestScheduler()
+    return _scheduler
+
+
+def estimate_tokens(prompt: str) -> int:
+  return len(prompt) // CHARS_PER_TOKEN + 1
+
+
+def _schema_key(response_schema: Optional[SchemaUnion]):
+  if response_schema is None:
+    return None
+  if hasattr(response_schema, "model_json_schema"):
+    return response_schema.model_json_schema()
+  if hasattr(response_schema, "model_dump"):
+    return response_schema.model_dump(mode="json", exclude_none=True)
+  return response_schema
+
+
+def cache_key(prompt: str, config: GenerateContentConfig, response_schema: Optional[SchemaUnion] = None) -> str:
+  """
+  Key of a response in the response cache: the model, a hash of the prompt, the response
+  schema and the rest of the generation config (thinking budget, tools, ...).
+  """
+  return response_cache.make_key(
+      model=MODEL_NAME,
+      prompt=hashlib.sha256(prompt.encode("utf-8")).hexdigest(),
+      schema=_schema_key(response_schema),
+      config=config.model_dump(mode="json", exclude_none=True, exclude={"response_schema"}),
+  )
+
+
+def generate_content(client: genai.Client, prompt: str, tools: list[Tool] = [], response_schema: Optional[SchemaUnion] = None,
+                     cache: bool = True):
   """
   Generate content using the Gemini model.
+  Responses are cached on disk (see response_cache), and concurrent identical requests
+  share one API call; pass cache=False or set RESPONSE_CACHE=0 to always call the API.
+  API calls go through the shared RequestScheduler, which throttles and retries them.
   Args:
       client: Configured Gemini client.
       prompt: The prompt to use for generating content.
+      cache: Whether to use the response cache.
   Returns:
       The generated content as a string, or an empty list if no content is found.
   """
@@ -52,24 +254,44 @@ def generate_content(client: genai.Client, prompt: str, tools: list[Tool] = [],
     )
   else:
     raise ValueError("Either response_schema or tools must be provided, but not both.")
-  
-  response = client.models.generate_content(
-      model=MODEL_NAME,
-      contents=prompt,
-      config=config,
-  )
 
-  if not response.candidates:
-    raise ValueError("No candidates found in the response.")
-  if not response.candidates[0].content.parts:
-    raise ValueError("No content parts found in the first candidate.")
-  if not response.candidates[0].content.parts[0].text:
-    raise ValueError("No text found in the first content part.")
+  def request() -> str:
+    scheduler = get_scheduler()
+    estimated_tokens = estimate_tokens(prompt)
+    response = scheduler.call(
+        lambda: client.models.generate_content(
+            model=MODEL_NAME,
+            contents=prompt,
+            config=config,
+        ),
+        tokens=estimated_tokens,
+    )
+    usage = getattr(response, "usage_metadata", None)
+    if usage and usage.prompt_token_count:
+      scheduler.tokens.adjust(usage.prompt_token_count - estimated_tokens)
+
+    if not response.candidates:
+      raise ValueError("No candidates found in the response.")
+    if not response.candidates[0].content.parts:
+      raise ValueError("No content parts found in the first candidate.")
+    if not response.candidates[0].content.parts[0].text:
+      raise ValueError("No text found in the first content part.")
+
+    text = response.candidates[0].content.parts[0].text
+    if response_schema:
+      # raises for invalid responses, so they are not cached
+      response_schema.model_validate_json(text)
+    return text
+
+  if cache and response_cache.ENABLED:
+    text = response_cache.get_or_compute(cache_key(prompt, config, response_schema), request)
+  else:
+    text = request()
 
   if response_schema:
-    return response_schema.model_validate_json(response.candidates[0].content.parts[0].text)
+    return response_schema.model_validate_json(text)
   else:
-    return response.candidates[0].content.parts[0].text.strip()
+    return text.strip()
 
 def generate_content_with_search(client: genai.Client, prompt: str) -> str:
   """
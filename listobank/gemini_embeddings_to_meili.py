@@ -3,6 +3,7 @@
 import os
 import argparse
 import datetime
+import hashlib
 from pathlib import Path
 
 from tqdm.auto import tqdm
@@ -10,7 +11,7 @@ from meilisearch import Client, errors as meilisearch_errors
 from meilisearch.models.task import TaskInfo
 
 from gemini import create_gemini
-from doc_analysis import load_document_analysis
+from doc_analysis import load_document_analysis, page_text_hashes
 from generic_domain_model import GenericDocument
 
 EMBEDDING_MODEL = "models/embedding-001"
@@ -25,9 +26,15 @@ def wait_for_task(meili: Client, task: TaskInfo, desc: str = "", verbose: bool =
     return task_result
 
 
-def embed_pages(gemini, pages: list[str]) -> list[list[float]]:
+def embed_pages(gemini, pages: list[str], page_hashes: list[str] | None = None,
+                reusable: dict[str, list[float]] | None = None) -> list[list[float]]:
+    """Embeds each page, reusing the embedding of any page whose hash is in `reusable`."""
+    reusable = reusable or {}
     embeddings = []
-    for text in pages:
+    for i, text in enumerate(pages):
+        if page_hashes and page_hashes[i] in reusable:
+            embeddings.append(reusable[page_hashes[i]])
+            continue
         res = gemini.embed_content(
             model=EMBEDDING_MODEL,
             content=text,
@@ -37,7 +44,18 @@ def embed_pages(gemini, pages: list[str]) -> list[list[float]]:
     return embeddings
 
 
-def index_embeddings(meili: Client, root_dir: Path, index_name: str, batch_size: int = 100):
+def index_embeddings(meili: Client, root_dir: Path, index_name: str, batch_size: int = 100, reindex: bool = False):
+    """
+    Pushes new and changed pages to the index. With reindex, the index is dropped and rebuilt,
+    which also removes pages indexed under an earlier id scheme or of deleted documents.
+    """
+    if reindex:
+        try:
+            meili.get_index(index_name)
+        except meilisearch_errors.MeilisearchApiError:
+            pass
+        else:
+            wait_for_task(meili, meili.delete_index(index_name), desc="Delete index")
     try:
         index = meili.get_index(index_name)
     except meilisearch_errors.MeilisearchApiError:
@@ -45,21 +63,38 @@ def index_embeddings(meili: Client, root_dir: Path, index_name: str, batch_size:
         wait_for_task(meili, meili.create_index(uid=index_name, options={"primaryKey": "id"}), desc="Create index")
         index = meili.get_index(index_name)
         wait_for_task(meili, index.update_filterable_attributes(["entity"]), desc="Set filterable attributes")
+        # pages recorded as indexed went to an index that no longer exists
+        reindex = True
 
     gemini = create_gemini()
     buffer = []
     tasks = []
+    # analyses whose indexed_page_hashes are recorded once their batches are indexed
+    indexed = []
 
     for analysis_path in tqdm(list(root_dir.glob("**/*.analysis.json")), desc="Analyses", unit="file"):
-        pdf_path = analysis_path.with_suffix(".pdf")
-        da = load_document_analysis(pdf_path)
-        pages = da.get_pages_as_text(indent_level=1)
-        if da.page_embeddings is None:
-            da.page_embeddings = embed_pages(gemini, pages)
-            da.save()
+        pdf_path = analysis_path.with_name(analysis_path.name.removesuffix(".analysis.json") + ".pdf")
+        da = load_document_analysis(pdf_path, bank=pdf_path.parent.name)
+        # extracted pages and embeddings are written together, once
+        with da.deferred_save():
+            # pages are embedded and indexed without boilerplate, and identified by that text, so
+            # a change of an entity's boilerplate re-embeds and re-indexes the affected pages
+            pages = da.get_clean_pages_as_text(indent_level=1)
+            page_hashes = page_text_hashes(pages)
+            if da.page_embeddings is None or da.embedded_page_hashes != page_hashes:
+                # only new or changed pages are embedded
+                da.page_embeddings = embed_pages(gemini, pages, page_hashes, da.reusable_embeddings())
+                da.embedded_page_hashes = page_hashes
+                da.save()
+
+        # ids are stable across versions of the file, so unchanged pages are not pushed again
+        document_name_hash = hashlib.md5(pdf_path.stem.encode()).hexdigest()
+        previously_indexed = [] if reindex else (da.indexed_page_hashes or [])
         for i, (text, embedding) in enumerate(zip(pages, da.page_embeddings)):
+            if i < len(previously_indexed) and previously_indexed[i] == page_hashes[i]:
+                continue
             doc = GenericDocument(
-                id=f"{da.bank}_{da.content_hash}_p{i}",
+                id=f"{da.bank}_{document_name_hash}_p{i}",
                 entity=da.bank,
                 filename=pdf_path.name,
                 path=str(pdf_path),
@@ -71,6 +106,11 @@ def index_embeddings(meili: Client, root_dir: Path, index_name: str, batch_size:
             if len(buffer) >= batch_size:
                 tasks.append(index.add_documents(buffer, primary_key="id"))
                 buffer.clear()
+        removed_pages = [f"{da.bank}_{document_name_hash}_p{i}" for i in range(len(pages), len(previously_indexed))]
+        if removed_pages:
+            tasks.append(index.delete_documents(removed_pages))
+        if page_hashes != da.indexed_page_hashes:
+            indexed.append((da, page_hashes))
 
     if buffer:
         tasks.append(index.add_documents(buffer, primary_key="id"))
@@ -78,6 +118,9 @@ def index_embeddings(meili: Client, root_dir: Path, index_name: str, batch_size:
     for t in tasks:
         wait_for_task(meili, t, desc="Index batch", verbose=False)
 
+    for da, page_hashes in indexed:
+        da.indexed_page_hashes = page_hashes
+        da.save()
 
 
 def main():
@@ -90,10 +133,13 @@ def main():
     parser.add_argument("--api-key", type=str, default=default_key, help="API key for MeiliSearch")
     parser.add_argument("--index-name", type=str, default="documents", help="Name of the MeiliSearch index")
     parser.add_argument("--batch-size", type=int, default=100, help="Number of documents per batch")
+    parser.add_argument("--reindex", action="store_true",
+                        help="Drop and rebuild the index, pushing every page (required after upgrading from "
+                             "content-hash document ids)")
     args = parser.parse_args()
 
     meili = Client(args.meili_url, args.api_key)
-    index_embeddings(meili, args.root_dir, args.index_name, batch_size=args.batch_size)
+    index_embeddings(meili, args.root_dir, args.index_name, batch_size=args.batch_size, reindex=args.reindex)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+"""
+Near-duplicate detection over extracted page text.
+
+Documents and pages are reduced to MinHash signatures of their word shingles; the
+similarity of two signatures estimates the Jaccard similarity of the shingle sets.
+Signatures use one-permutation hashing, so a signature costs a single pass over the
+shingles instead of one pass per hash function. An LSH index splits signatures into bands
+so candidate duplicates are found by bucket lookups instead of comparing every pair.
+"""
+import argparse
+import re
+from hashlib import blake2b
+from pathlib import Path
+
+# signature length; a power of two, as the low bits of a shingle hash pick its bin
+NUM_PERM = 128
+# 16 bands of 8 rows: pairs above ~0.7 similarity are very likely to share a bucket
+BANDS = 16
+SHINGLE_SIZE = 5
+DEFAULT_THRESHOLD = 0.8
+
+_BIN_BITS = NUM_PERM.bit_length() - 1
+_VALUE_BITS = 64 - _BIN_BITS
+_EMPTY = -1
+_WORD_RE = re.compile(r"\w+")
+
+Signature = tuple[int, ...]
+
+
+def shingles(text: str, size: int = SHINGLE_SIZE) -> set[int]:
+  """
+  Hashes the overlapping `size`-word windows of text. Case and punctuation are ignored.
+  """
+  words = _WORD_RE.findall(text.lower())
+  if not words:
+    return set()
+  windows = (" ".join(words[i:i + size]) for i in range(max(1, len(words) - size + 1)))
+  return {int.from_bytes(blake2b(window.encode("utf-8"), digest_size=8).digest(), "little") for window in windows}
+
+
+def minhash(shingle_set: set[int]) -> Signature:
+  """
+  MinHash signature of a shingle set. Each shingle hash falls into one of NUM_PERM bins by
+  its low bits and every bin keeps the smallest remaining value; empty bins borrow the value
+  of the next non-empty bin, offset by the distance to it. An empty set gets a signature
+  that matches nothing.
+  """
+  if not shingle_set:
+    return (_EMPTY,) * NUM_PERM
+  bins = [None] * NUM_PERM
+  for x in shingle_set:
+    slot, value = x & (NUM_PERM - 1), x >> _BIN_BITS
+    if bins[slot] is None or value < bins[slot]:
+      bins[slot] = value
+  filled = [i for i, value in enumerate(bins) if value is not None]
+  signature = list(bins)
+  for i, value in enumerate(bins):
+    if value is None:
+      distance, source = min(((j - i) % NUM_PERM, j) for j in filled)
+      signature[i] = (distance << _VALUE_BITS) | bins[source]
+  return tuple(signature)
+
+
+def similarity(a: Signature, b: Signature) -> float:
+  """
+  Estimated Jaccard similarity of the shingle sets behind two signatures.
+  """
+  if a[0] == _EMPTY or b[0] == _EMPTY:
+    return 0.0
+  return sum(x == y for x, y in zip(a, b)) / len(a)
+
+
+def document_signature(pages: list[str]) -> Signature:
+  shingle_set = set()
+  for page in pages:
+    shingle_set |= shingles(page)
+  return minhash(shingle_set)
+
+
+def page_signatures(pages: list[str]) -> list[Signature]:
+  return [minhash(shingles(page)) for page in pages]
+
+
+class LSHIndex:
+  """
+  Banded locality-sensitive hashing index over MinHash signatures.
+  """
+
+  def __init__(self, bands: int = BANDS):
+    if NUM_PERM % bands:
+      raise ValueError(f"bands must divide {NUM_PERM}")
+    self.bands = bands
+    self.rows = NUM_PERM // bands
+    self.signatures: dict = {}
+    self._buckets: dict[tuple[int, Signature], set] = {}
+
+  def _band_keys(self, signature: Signature):
+    for band in range(self.bands):
+      yield band, signature[band * self.rows:(band + 1) * self.rows]
+
+  def add(self, key, signature: Signature) -> None:
+    if signature[0] == _EMPTY:
+      return
+    self.signatures[key] = signature
+    for band_key in self._band_keys(signature):
+      self._buckets.setdefault(band_key, set()).add(key)
+
+  def query(self, signature: Signature, threshold: float = DEFAULT_THRESHOLD) -> list[tuple[object, float]]:
+    """
+    Returns (key, similarity) of indexed signatures at or above threshold, most similar first.
+    """
+    if signature[0] == _EMPTY:
+      return []
+    candidates = set()
+    for band_key in self._band_keys(signature):
+      candidates |= self._buckets.get(band_key, set())
+    matches = [(key, similarity(signature, self.signatures[key])) for key in candidates]
+    return sorted((match for match in matches if match[1] >= threshold), key=lambda match: -match[1])
+
+
+def find_duplicate_documents(pages_by_document: dict[Path, list[str]],
+                             threshold: float = DEFAULT_THRESHOLD) -> dict[Path, tuple[Path, float]]:
+  """
+  Maps each document that is a near-duplicate of an earlier one (in the given order) to
+  that document and their similarity. Documents are matched against the first document of
+  their group, so every group resolves to a single representative.
+  """
+  index = LSHIndex()
+  duplicates: dict[Path, tuple[Path, float]] = {}
+  for path, pages in pages_by_document.items():
+    signature = document_signature(pages)
+    matches = index.query(signature, threshold)
+    if matches:
+      duplicates[path] = matches[0]
+    else:
+      index.add(path, signature)
+  return duplicates
+
+
+def find_duplicate_pages(pages_by_document: dict[Path, list[str]],
+                         threshold: float = DEFAULT_THRESHOLD) -> list[tuple[tuple[Path, int], tuple[Path, int], float]]:
+  """
+  Returns pairs of near-duplicate pages from different documents as ((path, page), (path, page), similarity).
+  """
+  index = LSHIndex()
+  pairs = []
+  for path, pages in pages_by_document.items():
+    signatures = page_signatures(pages)
+    for page, signature in enumerate(signatures):
+      for (other_path, other_page), score in index.query(signature, threshold):
+        if other_path != path:
+          pairs.append(((path, page), (other_path, other_page), score))
+    for page, signature in enumerate(signatures):
+      index.add((path, page), signature)
+  return pairs
+
+
+def main():
+  from doc_analysis import load_document_analysis
+
+  parser = argparse.ArgumentParser(description="Find near-duplicate documents and pages")
+  parser.add_argument("--root-dir", type=Path, default=Path("data_new"),
+                      help="Directory to search for PDFs (default: data_new)")
+  parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                      help=f"Minimum estimated Jaccard similarity (default: {DEFAULT_THRESHOLD})")
+  parser.add_argument("--pages", action="store_true", help="Also report near-duplicate pages across documents")
+  parser.add_argument("--mark", action="store_true",
+                      help="Record near_duplicate_of in the analyses of duplicate documents")
+  args = parser.parse_args()
+
+  analyses = {}
+  for pdf_file in sorted(args.root_dir.glob("**/*.pdf")):
+    try:
+      doc_analysis = load_document_analysis(pdf_file, bank=pdf_file.parent.name)
+    except (FileNotFoundError, ValueError) as e:
+      print(f"Warning: Could not load DocumentAnalysis for {pdf_file}: {e}")
+      continue
+    if doc_analysis.pages_text:
+      analyses[pdf_file] = doc_analysis
+  pages_by_document = {path: doc_analysis.pages_text for path, doc_analysis in analyses.items()}
+
+  duplicates = find_duplicate_documents(pages_by_document, args.threshold)
+  for path, (original, score) in duplicates.items():
+    print(f"{score:.2f}\t{path}\t~ {original}")
+  print(f"{len(duplicates)} of {len(pages_by_document)} documents are near-duplicates")
+
+  if args.pages:
+    pairs = find_duplicate_pages(pages_by_document, args.threshold)
+    for (path, page), (other_path, other_page), score in pairs:
+      print(f"{score:.2f}\t{path} p{page + 1}\t~ {other_path} p{other_page + 1}")
+    print(f"{len(pairs)} near-duplicate page pairs")
+
+  if args.mark:
+    for path, doc_analysis in analyses.items():
+      doc_analysis.near_duplicate_of = duplicates[path][0] if path in duplicates else None
+      doc_analysis.save()
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,188 @@
+"""
+OCR fallback for pages without a text layer.
+
+Scanned pages come back from the text extraction engines as "". Those pages are
+rendered with pdf2image and read with Tesseract, starting at a low DPI and only
+re-rendering at a higher one when Tesseract's mean word confidence is poor. Pages are
+OCRed in a process pool, and results are cached by a hash of the page's own content
+(its content stream and images), so a scanned page is OCRed once even if the
+surrounding document changes. Whether Tesseract and poppler are installed is checked
+once per process; without them the fallback is skipped.
+"""
+import concurrent.futures
+import os
+import shutil
+from hashlib import md5
+from pathlib import Path
+
+from pydantic import BaseModel, Field
+from PyPDF2 import PdfReader
+
+from atomic_io import atomic_write_text
+
+OCR_ENABLED = os.getenv("OCR_FALLBACK", "1") != "0"
+OCR_LANG = os.getenv("OCR_LANG", "ell+eng")
+# Rendering resolutions to try, cheapest first
+DPI_LADDER = (150, 300)
+# Mean word confidence (0-100) at which a rendering is considered good enough
+MIN_CONFIDENCE = 75.0
+CACHE_DIR = Path(os.getenv("OCR_CACHE_DIR", Path.cwd() / ".cache" / "ocr"))
+
+# None until checked, then whether pytesseract, pdf2image, tesseract and poppler are installed
+_ocr_available: bool | None = None
+
+
+class OCRResult(BaseModel):
+  text: str = Field(
+      ..., description="recognized text of the page"
+  )
+  confidence: float = Field(
+      ..., description="mean Tesseract word confidence, 0-100"
+  )
+  dpi: int = Field(
+      ..., description="resolution the page was rendered at"
+  )
+
+
+def page_content_hash(reader: PdfReader, page_index: int) -> str:
+  """
+  Hashes what a page draws: its content stream and the data of its XObjects.
+  """
+  page = reader.pages[page_index]
+  digest = md5()
+  contents = page.get_contents()
+  if contents is not None:
+    digest.update(contents.get_data())
+  resources = page.get("/Resources")
+  xobjects = resources.get_object().get("/XObject") if resources else None
+  if xobjects:
+    for name in sorted(xobjects.get_object().keys()):
+      xobject = xobjects.get_object()[name].get_object()
+      digest.update(name.encode())
+      digest.update(xobject.get_data())
+  return digest.hexdigest()
+
+
+def _cache_path(page_hash: str, lang: str, cache_dir: Path) -> Path:
+  return cache_dir / page_hash[:2] / f"{page_hash}.{lang}.json"
+
+
+def _read_cached(page_hash: str, lang: str, cache_dir: Path) -> OCRResult | None:
+  try:
+    return OCRResult.model_validate_json(_cache_path(page_hash, lang, cache_dir).read_text(encoding="utf-8"))
+  except (FileNotFoundError, ValueError):
+    return None
+
+
+def _write_cached(page_hash: str, lang: str, result: OCRResult, cache_dir: Path) -> None:
+  atomic_write_text(_cache_path(page_hash, lang, cache_dir), result.model_dump_json(), fsync=False)
+
+
+def _tesseract_text(data: dict) -> tuple[str, float]:
+  """
+  Rebuilds line-broken text from pytesseract.image_to_data output and returns it with the
+  mean confidence of the recognized words.
+  """
+  lines: dict[tuple[int, int, int], list[str]] = {}
+  confidences = []
+  for i, word in enumerate(data["text"]):
+    confidence = float(data["conf"][i])
+    if confidence < 0 or not word.strip():
+      continue
+    confidences.append(confidence)
+    key = (data["block_num"][i], data["par_num"][i], data["line_num"][i])
+    lines.setdefault(key, []).append(word)
+  text = "\n".join(" ".join(words) for _, words in sorted(lines.items()))
+  return text, (sum(confidences) / len(confidences) if confidences else 0.0)
+
+
+def ocr_available() -> bool:
+  """
+  Whether the OCR dependencies are installed. Checked once; the first failure is reported.
+  """
+  global _ocr_available
+  if _ocr_available is None:
+    try:
+      import pdf2image  # noqa: F401
+      import pytesseract
+      pytesseract.get_tesseract_version()
+      if not (shutil.which("pdftoppm") or shutil.which("pdftocairo")):
+        raise FileNotFoundError("poppler (pdftoppm) is not installed")
+      _ocr_available = True
+    except Exception as e:
+      print(f"Warning: OCR fallback unavailable ({e}). Pages without a text layer stay empty.")
+      _ocr_available = False
+  return _ocr_available
+
+
+def _ocr_page(pdf_path: str, page_index: int, lang: str) -> OCRResult | str:
+  """
+  OCRs a single page, moving up the DPI ladder while confidence is below MIN_CONFIDENCE.
+  Runs inside worker processes. Returns the error message instead if the page fails, so
+  one bad page does not lose the results of the others.
+  """
+  try:
+    import pytesseract
+    from pdf2image import convert_from_path
+
+    best = OCRResult(text="", confidence=0.0, dpi=0)
+    for dpi in DPI_LADDER:
+      images = convert_from_path(pdf_path, dpi=dpi, first_page=page_index + 1, last_page=page_index + 1)
+      if not images:
+        break
+      data = pytesseract.image_to_data(images[0], lang=lang, output_type=pytesseract.Output.DICT)
+      text, confidence = _tesseract_text(data)
+      if confidence >= best.confidence:
+        best = OCRResult(text=text, confidence=confidence, dpi=dpi)
+      if confidence >= MIN_CONFIDENCE:
+        break
+    return best
+  except Exception as e:
+    return f"{type(e).__name__}: {e}"
+
+
+def ocr_pages(pdf_path: Path, page_indices: list[int], workers: int | None = None,
+              lang: str = OCR_LANG, cache_dir: Path = CACHE_DIR) -> dict[int, str]:
+  """
+  OCRs the given pages of a PDF and returns their text by page index. Cached pages are
+  served without rendering; the rest run in a process pool. Pages that cannot be OCRed
+  (e.g. Tesseract is not installed) are left out of the result.
+  """
+  if not page_indices:
+    return {}
+  reader = PdfReader(str(pdf_path))
+  page_hashes = {}
+  for i in page_indices:
+    try:
+      page_hashes[i] = page_content_hash(reader, i)
+    except Exception as e:
+      # e.g. an image filter PyPDF2 cannot decode; the page is OCRed without the cache
+      print(f"Warning: Could not hash page {i + 1} of {pdf_path} for the OCR cache: {e}")
+      page_hashes[i] = None
+
+  results: dict[int, str] = {}
+  missing = []
+  for i, page_hash in page_hashes.items():
+    cached = _read_cached(page_hash, lang, cache_dir) if page_hash else None
+    if cached is not None:
+      results[i] = cached.text
+    else:
+      missing.append(i)
+  if not missing or not ocr_available():
+    return results
+
+  workers = min(workers or os.cpu_count() or 1, len(missing))
+  if workers > 1:
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+      ocr_results = list(executor.map(_ocr_page, [str(pdf_path)] * len(missing), missing, [lang] * len(missing)))
+  else:
+    ocr_results = [_ocr_page(str(pdf_path), i, lang) for i in missing]
+
+  for i, result in zip(missing, ocr_results):
+    if isinstance(result, str):
+      print(f"Warning: OCR of page {i + 1} of {pdf_path} failed: {result}")
+      continue
+    if page_hashes[i]:
+      _write_cached(page_hashes[i], lang, result, cache_dir)
+    results[i] = result.text
+  return results
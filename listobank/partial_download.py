@@ -0,0 +1,258 @@
+"""
+Resumable, atomic file downloads.
+
+A download is written to `<name>.part` next to its destination, together with
+`<name>.part.json` recording the ETag/Last-Modified of the response it came from. An
+interrupted download is resumed with a Range request guarded by If-Range, so the server
+sends only the missing bytes if the file is unchanged and the whole file otherwise. The
+finished file is checked against the announced length, fsynced and renamed over the
+destination, so a crash never leaves a truncated PDF in place. The MD5 of the file is
+computed while it streams in, so it never has to be read back to be fingerprinted, and a
+download identical to the existing file does not replace it.
+
+Bodies sent with a Content-Encoding are decoded by the HTTP clients, so their length cannot
+be checked against Content-Length and they are not resumed, as Range requests count
+encoded bytes.
+
+The helpers are independent of the HTTP client. PartialDownload handles the file: callers
+send `resume_headers()`, pass the response status and headers to `open()`, write the body
+and call `finish()`. ConditionalDownload adds the request decisions shared by the sync and
+async retrievers (conditional headers from the crawl state, 304s, servers that ignore
+them, restarts after a 416) and records each outcome in the crawl state; the retrievers
+only do the transport.
+"""
+import json
+import os
+import re
+from hashlib import md5
+from pathlib import Path
+
+import crawl_state
+import fingerprints
+from atomic_io import atomic_write_text
+
+CHUNK_SIZE = 1024 * 1024
+_CONTENT_RANGE_RE = re.compile(r"bytes (\d+)-(\d+)/(\d+|\*)")
+
+
+class IncompleteDownloadError(IOError):
+    """
+    The body of a response was shorter or longer than announced. The partial file is kept
+    so the download can be resumed.
+    """
+
+
+class _HashingWriter:
+    """
+    File wrapper that hashes and counts everything written through it.
+    """
+
+    def __init__(self, f, digest, size: int):
+        self._f = f
+        self.digest = digest
+        self.size = size
+
+    def write(self, data: bytes) -> int:
+        self.digest.update(data)
+        self.size += len(data)
+        return self._f.write(data)
+
+    def flush(self):
+        self._f.flush()
+
+    def fileno(self) -> int:
+        return self._f.fileno()
+
+    def close(self):
+        self._f.close()
+
+
+def _is_encoded(headers) -> bool:
+    return headers.get("Content-Encoding", "identity").lower() not in ("", "identity")
+
+
+class PartialDownload:
+    def __init__(self, dest_path: Path):
+        self.dest_path = Path(dest_path)
+        self.part_path = self.dest_path.with_name(self.dest_path.name + ".part")
+        self.meta_path = self.dest_path.with_name(self.dest_path.name + ".part.json")
+        self.offset = 0
+        self.expected_size: int | None = None
+        # MD5 and size of the finished file, set by finish()
+        self.content_hash: str | None = None
+        self.size: int | None = None
+
+    def _validator(self) -> str | None:
+        try:
+            meta = json.loads(self.meta_path.read_text(encoding="utf-8"))
+        except (FileNotFoundError, ValueError):
+            return None
+        etag = meta.get("etag")
+        # If-Range only accepts strong ETags
+        if etag and not etag.startswith("W/"):
+            return etag
+        return meta.get("last_modified")
+
+    def resume_headers(self) -> dict[str, str]:
+        """
+        Range/If-Range headers that resume a previous partial download, if there is one.
+        """
+        size = self.part_path.stat().st_size if self.part_path.exists() else 0
+        validator = self._validator()
+        if size == 0 or validator is None:
+            self.discard()
+            return {}
+        return {"Range": f"bytes={size}-", "If-Range": validator}
+
+    def open(self, status: int, headers):
+        """
+        Opens the partial file for the body of a response: appending for a 206 that continues
+        it, from scratch otherwise. Write the body through the returned file.
+        """
+        content_range = _CONTENT_RANGE_RE.match(headers.get("Content-Range", "")) if status == 206 else None
+        part_size = self.part_path.stat().st_size if self.part_path.exists() else 0
+        if content_range and int(content_range.group(1)) == part_size and not _is_encoded(headers):
+            self.offset = part_size
+            total = content_range.group(3)
+            self.expected_size = int(total) if total != "*" else None
+            # the bytes already received are read once to resume the hash
+            digest = md5()
+            with open(self.part_path, "rb") as existing:
+                for chunk in iter(lambda: existing.read(CHUNK_SIZE), b""):
+                    digest.update(chunk)
+            return _HashingWriter(open(self.part_path, "ab"), digest, part_size)
+
+        if status == 206:
+            raise IncompleteDownloadError(f"Unexpected Content-Range {headers.get('Content-Range')!r} "
+                                          f"for {self.part_path} ({part_size} bytes)")
+        self.offset = 0
+        self.dest_path.parent.mkdir(parents=True, exist_ok=True)
+        if _is_encoded(headers):
+            # Content-Length is the encoded length and the decoded part cannot be resumed
+            self.expected_size = None
+            self.meta_path.unlink(missing_ok=True)
+        else:
+            length = headers.get("Content-Length")
+            self.expected_size = int(length) if length and length.isdigit() else None
+            atomic_write_text(self.meta_path, json.dumps({
+                "etag": headers.get("ETag"),
+                "last_modified": headers.get("Last-Modified"),
+            }), fsync=False)
+        return _HashingWriter(open(self.part_path, "wb"), md5(), 0)
+
+    def finish(self, f: _HashingWriter) -> bool:
+        """
+        Flushes and closes the partial file, verifies its size and moves it into place, unless
+        the destination already holds the same content. Returns whether the destination changed.
+        """
+        f.flush()
+        os.fsync(f.fileno())
+        f.close()
+        if self.expected_size is not None and f.size != self.expected_size:
+            if f.size > self.expected_size:
+                self.discard()
+            raise IncompleteDownloadError(f"{self.dest_path}: received {f.size} of {self.expected_size} bytes")
+        self.content_hash = f.digest.hexdigest()
+        self.size = f.size
+        if self.dest_path.exists() and fingerprints.content_hash(self.dest_path) == self.content_hash:
+            self.discard()
+            return False
+        os.replace(self.part_path, self.dest_path)
+        self.meta_path.unlink(missing_ok=True)
+        _fsync_dir(self.dest_path.parent)
+        return True
+
+    def discard(self) -> None:
+        self.part_path.unlink(missing_ok=True)
+        self.meta_path.unlink(missing_ok=True)
+
+
+class ConditionalDownload:
+    """
+    One download of url to dest_path, conditional on what is known about the existing file.
+    For each attempt: send `request_headers()`, pass the response to `check()`, and, if it
+    asks for the body, raise for an error status, write the body to `open()` and `finish()`
+    it; `failed()` records an error. The results are (new_etag, was_modified, content_hash,
+    size) tuples.
+    """
+
+    BODY = "body"
+    UNCHANGED = "unchanged"
+    RESTART = "restart"
+
+    def __init__(self, url: str, dest_path: Path, existing_etag: str | None = None):
+        self.url = url
+        self.dest_path = Path(dest_path)
+        self.download = PartialDownload(self.dest_path)
+        exists = self.dest_path.exists()
+        self.state = crawl_state.get(url) if exists else None
+        self.existing_etag = existing_etag if exists else None
+        self.conditional_headers = self.state.conditional_headers() if self.state is not None else {}
+        if self.existing_etag:
+            self.conditional_headers.setdefault("If-None-Match", self.existing_etag)
+
+    @property
+    def offset(self) -> int:
+        return self.download.offset
+
+    @property
+    def expected_size(self) -> int | None:
+        return self.download.expected_size
+
+    def request_headers(self) -> dict[str, str]:
+        return {**self.conditional_headers, **self.download.resume_headers()}
+
+    def check(self, status: int, headers, request_headers: dict[str, str]) -> str:
+        """
+        Decides what to do with a response: read its BODY, accept it as UNCHANGED (see
+        `unchanged_result()`) or RESTART the attempt from scratch.
+        """
+        if status == 416 and "Range" in request_headers:
+            # the partial file does not fit the current version
+            self.download.discard()
+            return self.RESTART
+        if crawl_state.revalidated(self.url, "pdf", self.state, status, headers, known_etag=self.existing_etag):
+            # a partial download of another version is of no use
+            self.download.discard()
+            return self.UNCHANGED
+        return self.BODY
+
+    def unchanged_result(self, status: int, headers) -> tuple[str | None, bool, None, None]:
+        if status == 304:
+            return self.existing_etag or (self.state.etag if self.state else None), False, None, None
+        return headers.get("ETag") or self.existing_etag, False, None, None
+
+    def open(self, status: int, headers):
+        """
+        The partial file to write the body to, or None if the attempt must restart because the
+        response does not continue the partial file.
+        """
+        try:
+            return self.download.open(status, headers)
+        except IncompleteDownloadError:
+            self.download.discard()
+            return None
+
+    def finish(self, f: _HashingWriter) -> bool:
+        return self.download.finish(f)
+
+    def result(self, status: int, headers, was_modified: bool) -> tuple[str | None, bool, str | None, int | None]:
+        crawl_state.record_response(self.url, "pdf", status, headers)
+        return headers.get("ETag"), was_modified, self.download.content_hash, self.download.size
+
+    def failed(self, error: BaseException, status: int | None = None) -> None:
+        crawl_state.record_failure(self.url, "pdf", error, status)
+
+
+def _fsync_dir(path: Path) -> None:
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        # not supported for directories on every platform
+        pass
+    finally:
+        os.close(fd)
@@ -1,7 +1,9 @@
 #!/usr/bin/env python3
+import argparse
 import os
 from pydantic import HttpUrl
 import requests
+from requests.adapters import HTTPAdapter
 from bs4 import BeautifulSoup
 from urllib.parse import urljoin, urlparse
 from generic_domain_model import EntityDocumentRoots
@@ -10,6 +12,11 @@ from tqdm import tqdm
 import datetime
 from pathlib import Path
 from doc_analysis import DocumentAnalysis, load_document_analysis, new_document_analysis
+import blob_store
+import crawl_state
+import sitemaps
+from crawl_frontier import DEFAULT_MAX_DEPTH, DEFAULT_MAX_PAGES, CrawlFrontier, is_page_url, is_pdf_url
+from partial_download import ConditionalDownload, IncompleteDownloadError
 
 HEADERS = {
     "User-Agent": (
@@ -18,106 +25,267 @@ HEADERS = {
         "Chrome/91.0.4472.124 Safari/537.36"
     )
 }
+# Keep-alive connections kept per host by the shared session
+POOL_SIZE = 16
+# Further attempts at a download interrupted by a network error, each resuming where the last stopped
+DOWNLOAD_RETRIES = 3
 
+_session: requests.Session | None = None
 
-def download_file(url: str, dest_path: str, chunk_size: int = 8192, existing_etag: str = None, indent_level: int = 0) -> tuple[str, bool]:
+
+def get_session() -> requests.Session:
+    """
+    Returns the session shared by all requests, so requests to the same host reuse
+    pooled keep-alive connections instead of opening a new TLS connection each time.
+    """
+    global _session
+    if _session is None:
+        session = requests.Session()
+        session.headers.update(HEADERS)
+        adapter = HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        _session = session
+    return _session
+
+
+def download_file(url: str, dest_path: str, chunk_size: int = 8192, existing_etag: str = None,
+                  indent_level: int = 0) -> tuple[str, bool, str | None, int | None]:
     """
     Streams a file from the given URL to the specified filesystem path.
-    Uses ETag for conditional requests if provided.
-    Returns tuple of (new_etag, was_modified).
+    If the file exists, the request is conditional on the ETag/Last-Modified recorded in the
+    crawl state (or existing_etag), and nothing is transferred when it is unchanged.
+    The file is written to a `.part` file that is renamed into place once complete; an
+    interrupted download is resumed with a Range request, here or on the next run.
+    The file is hashed as it streams in; if it turns out identical to the existing file, the
+    existing file is left in place.
+    Returns tuple of (new_etag, was_modified, content_hash, size), where content_hash and size
+    are the MD5 and length of the downloaded body, or None if no body was transferred.
     """
-    headers = HEADERS.copy()
-    if existing_etag:
-        headers["If-None-Match"] = existing_etag
+    download = ConditionalDownload(url, Path(dest_path), existing_etag)
 
     indentation = "  " * indent_level
-    with requests.get(url, headers=headers, stream=True, timeout=15) as response:
-        if response.status_code == 304:
-            # Not modified
-            return existing_etag, False
-        response.raise_for_status()
-        with open(dest_path, "wb") as f:
-            total = int(response.headers.get("content-length", 0))
-            with tqdm(
-                total=total,
-                unit="B",
-                unit_scale=True,
-                desc=indentation + os.path.basename(dest_path),
-                leave=False,
-            ) as pbar:
-                for chunk in response.iter_content(chunk_size=chunk_size):
-                    if chunk:
-                        f.write(chunk)
-                        pbar.update(len(chunk))
-        return response.headers.get("ETag"), True
-
-
-def download_pdfs(entity_name: str, page_url: str, base_folder: str = "data_new"):
-    """
-    Scrapes all PDF links from the given page URL and downloads them into
-    data_new/{entity_name}/, using DocumentAnalysis to track metadata and ETags.
+    for attempt in range(DOWNLOAD_RETRIES + 1):
+        headers = download.request_headers()
+        f = None
+        try:
+            with get_session().get(url, headers=headers, stream=True, timeout=15) as response:
+                action = download.check(response.status_code, response.headers, headers)
+                if action == download.RESTART:
+                    continue
+                if action == download.UNCHANGED:
+                    return download.unchanged_result(response.status_code, response.headers)
+                response.raise_for_status()
+                f = download.open(response.status_code, response.headers)
+                if f is None:
+                    continue
+                with tqdm(
+                    total=download.expected_size or 0,
+                    initial=download.offset,
+                    unit="B",
+                    unit_scale=True,
+                    desc=indentation + os.path.basename(dest_path),
+                    leave=False,
+                ) as pbar:
+                    for chunk in response.iter_content(chunk_size=chunk_size):
+                        if chunk:
+                            f.write(chunk)
+                            pbar.update(len(chunk))
+                was_modified = download.finish(f)
+        except requests.HTTPError as e:
+            download.failed(e, e.response.status_code)
+            raise
+        except (requests.RequestException, IncompleteDownloadError) as e:
+            # connect and read timeouts are retried like interrupted bodies
+            if attempt < DOWNLOAD_RETRIES:
+                continue
+            download.failed(e)
+            raise
+        finally:
+            if f is not None:
+                f.close()
+        return download.result(response.status_code, response.headers, was_modified)
+    raise IncompleteDownloadError(f"Could not download {url} to {dest_path}")
+
+
+def extract_links(html: str, page_url: str) -> tuple[set[str], set[str]]:
+    """
+    Returns the absolute URLs of all links in an HTML page as (PDF links, other links).
+    """
+    soup = BeautifulSoup(html, "html.parser")
+    pdf_links, page_links = set(), set()
+    for a in soup.find_all("a", href=True):
+        url = urljoin(page_url, a["href"].strip())
+        if is_pdf_url(url):
+            pdf_links.add(url)
+        elif is_page_url(url):
+            page_links.add(url)
+    return pdf_links, page_links
+
+
+def fetch_page_links(page_url: str) -> tuple[set[str], set[str]]:
+    """
+    Returns the (PDF links, other links) of a listing page. The request is conditional on the
+    crawl state, so an unchanged page is answered with a 304 and its recorded links are reused.
+    """
+    state, headers = crawl_state.page_request(page_url)
+    try:
+        resp = get_session().get(page_url, headers=headers, timeout=15)
+    except requests.RequestException as e:
+        crawl_state.record_failure(page_url, "page", e)
+        raise
+    if crawl_state.revalidated(page_url, "page", state, resp.status_code, resp.headers):
+        return crawl_state.cached_links(state)
+    try:
+        resp.raise_for_status()
+    except requests.HTTPError as e:
+        crawl_state.record_failure(page_url, "page", e, resp.status_code)
+        raise
+    pdf_links, page_links = extract_links(resp.text, page_url)
+    crawl_state.record_response(page_url, "page", resp.status_code, resp.headers, pdf_links, page_links)
+    return pdf_links, page_links
+
+
+def pdf_destination(base_folder: str, entity_name: str, pdf_url: str) -> Path:
+    return Path(base_folder) / entity_name / os.path.basename(urlparse(pdf_url).path)
+
+
+def existing_analysis(dest_path: Path, entity_name: str) -> DocumentAnalysis | None:
+    """
+    Loads the DocumentAnalysis of a previously downloaded PDF, if there is one.
+    """
+    try:
+        return load_document_analysis(dest_path, bank=entity_name)
+    except FileNotFoundError:
+        return None
+
+
+def record_download(entity_name: str, pdf_url: str, dest_path: Path, doc_analysis: DocumentAnalysis | None,
+                    new_etag: str | None, was_modified: bool, content_hash: str | None = None,
+                    size: int | None = None) -> DocumentAnalysis:
+    """
+    Creates or updates the DocumentAnalysis of a PDF after a download attempt. The content_hash
+    computed while downloading is used as is, so the file is not read again to fingerprint it
+    or to add it to the blob store; size, the number of bytes hashed, checks that the file on
+    disk is the one that was hashed.
+    """
+    if was_modified and content_hash:
+        # store the new content once and make the file a view of it
+        blob_store.try_store(dest_path, content_hash)
+    if doc_analysis is None or (was_modified and content_hash and content_hash != doc_analysis.content_hash):
+        previous = doc_analysis
+        doc_analysis = new_document_analysis(
+            file_path=dest_path,
+            retrieved_from=pdf_url,
+            retrieved_at=datetime.datetime.now(datetime.timezone.utc),
+            bank=entity_name,
+            retrieved_etag=new_etag,
+            content_hash=content_hash,
+            size=size,
+        )
+        if previous is not None:
+            # a new version of the document; reuse what did not change
+            doc_analysis.carry_over(previous)
+    if was_modified:
+        doc_analysis.retrieved_from = HttpUrl(pdf_url)
+        doc_analysis.retrieved_at = datetime.datetime.now(datetime.timezone.utc)
+        doc_analysis.retrieved_etag = new_etag
+        doc_analysis.save()
+    return doc_analysis
+
+
+def crawl_pdf_links(entity_name: str, root_urls: list[str], max_depth: int = DEFAULT_MAX_DEPTH,
+                    max_pages: int = DEFAULT_MAX_PAGES) -> list[str]:
+    """
+    Crawls the pages below an entity's root URLs breadth-first and returns the unique PDF
+    links found on them.
+    """
+    frontier = CrawlFrontier(root_urls, max_depth=max_depth, max_pages=max_pages)
+    for depth, page_urls in frontier:
+        for page_url in tqdm(page_urls, desc=f"  Crawling {entity_name} (depth {depth})", unit="page", leave=False):
+            try:
+                pdf_links, page_links = fetch_page_links(page_url)
+            except requests.RequestException as e:
+                print(f"[ERROR] Failed to fetch {page_url} for {entity_name}: {e}")
+                continue
+            frontier.add(pdf_links, page_links)
+    return frontier.documents
+
+
+def sitemap_pdf_links(entity_name: str, root_urls: list[str], base_folder: str = "data_new") -> list[str] | None:
+    """
+    Returns the PDF links in the entity's sitemaps, leaving out downloaded PDFs whose lastmod
+    is older than their last check, or None if its sitemaps list no PDFs.
     """
+    entries = sitemaps.entity_documents(entity_name, root_urls)
+    if not entries:
+        return None
+    return [entry.url for entry in entries
+            if not sitemaps.unchanged_since_checked(entry, pdf_destination(base_folder, entity_name, entry.url))]
+
+
+def download_pdfs(entity_name: str, root_urls: list[str] | str, base_folder: str = "data_new",
+                  max_depth: int = DEFAULT_MAX_DEPTH, max_pages: int = DEFAULT_MAX_PAGES,
+                  use_sitemaps: bool = False) -> int:
+    """
+    Crawls the given root URLs of an entity for PDF links, or reads them from its sitemaps,
+    and downloads them into data_new/{entity_name}/, using DocumentAnalysis to track metadata
+    and ETags. Entities without PDFs in their sitemaps are crawled.
+    Returns the number of new or changed PDFs.
+    """
+    if isinstance(root_urls, str):
+        root_urls = [root_urls]
     # Create target directory
     target_dir = os.path.join(base_folder, entity_name)
     os.makedirs(target_dir, exist_ok=True)
 
-    # Fetch page content
-    resp = requests.get(page_url, headers=HEADERS, timeout=15)
-    resp.raise_for_status()
-
-    # Parse HTML for PDF links
-    soup = BeautifulSoup(resp.text, "html.parser")
-    pdf_links = set()
-    for a in soup.find_all("a", href=True):
-        href = a["href"].strip()
-        parsed_href = urlparse(href)
-        if parsed_href.path.lower().endswith(".pdf"):
-            full_url = urljoin(page_url, href)
-            pdf_links.add(full_url)
+    pdf_links = sitemap_pdf_links(entity_name, root_urls, base_folder) if use_sitemaps else None
+    if pdf_links is None:
+        # Collect the PDF links, reusing the recorded ones of unchanged pages
+        pdf_links = crawl_pdf_links(entity_name, root_urls, max_depth=max_depth, max_pages=max_pages)
 
     # Download each PDF
+    changed = 0
     for pdf_url in tqdm(
-        sorted(pdf_links), desc=f"    Downloading PDFs from {page_url}", unit="file", leave=False
+        pdf_links, desc=f"    Downloading PDFs of {entity_name}", unit="file", leave=False
     ):
-        filename = os.path.basename(urlparse(pdf_url).path)
-        dest_path = Path(target_dir) / filename
+        dest_path = pdf_destination(base_folder, entity_name, pdf_url)
         
         # Load existing DocumentAnalysis if available
-        try:
-            doc_analysis = load_document_analysis(dest_path, bank=entity_name)
-        except FileNotFoundError:
-            doc_analysis = None
-        if doc_analysis is not None:
-            existing_etag = doc_analysis.retrieved_etag
-        else:
-            existing_etag = None
+        doc_analysis = existing_analysis(dest_path, entity_name)
+        existing_etag = doc_analysis.retrieved_etag if doc_analysis is not None else None
 
         try:
-            new_etag, was_modified = download_file(pdf_url, str(dest_path), existing_etag=existing_etag, indent_level=3)
-            
-            if doc_analysis is None:
-                doc_analysis = new_document_analysis(
-                    file_path=dest_path,
-                    retrieved_from=pdf_url,
-                    retrieved_at=datetime.datetime.now(datetime.timezone.utc),
-                    bank=entity_name,
-                    retrieved_etag=new_etag,
-                )
-            # Create or update DocumentAnalysis
-            if was_modified:
-                doc_analysis.retrieved_from = HttpUrl(pdf_url)
-                doc_analysis.retrieved_at = datetime.datetime.now(datetime.timezone.utc)
-                doc_analysis.retrieved_etag = new_etag
-                doc_analysis.save()
+            new_etag, was_modified, content_hash, size = download_file(pdf_url, str(dest_path),
+                                                                       existing_etag=existing_etag, indent_level=3)
+            record_download(entity_name, pdf_url, dest_path, doc_analysis, new_etag, was_modified, content_hash, size)
+            changed += was_modified
                 
         except requests.HTTPError as e:
             if e.response.status_code == 304:
                 # Not modified, skip
                 continue
             print(f"[ERROR] Failed to download {pdf_url} for {entity_name}: {e}")
+        except (requests.RequestException, IncompleteDownloadError) as e:
+            print(f"[ERROR] Failed to download {pdf_url} for {entity_name}: {e}")
+    return changed
 
 
 def main():
+    parser = argparse.ArgumentParser(description="Download PDFs from the document roots of every entity")
+    parser.add_argument("--base-folder", type=str, default="data_new", help="Download directory (default: data_new)")
+    parser.add_argument("--max-depth", type=int, default=DEFAULT_MAX_DEPTH,
+                        help=f"Links to follow from a document root to reach a PDF (default: {DEFAULT_MAX_DEPTH})")
+    parser.add_argument("--max-pages", type=int, default=DEFAULT_MAX_PAGES,
+                        help=f"Maximum pages crawled per entity (default: {DEFAULT_MAX_PAGES})")
+    parser.add_argument("--sitemaps", action="store_true",
+                        help="Discover PDFs from sitemaps, skipping those unchanged since their last check")
+    parser.add_argument("--async", dest="use_async", action="store_true",
+                        help="Fetch pages and PDFs concurrently over pooled connections")
+    parser.add_argument("--concurrency", type=int, default=16, help="Maximum concurrent requests with --async (default: 16)")
+    parser.add_argument("--per-host", type=int, default=4, help="Maximum concurrent requests per host with --async (default: 4)")
+    args = parser.parse_args()
+
     # Initialize domain configuration
     if not domain_manager.config:
         from pathlib import Path
@@ -129,10 +297,15 @@ def main():
             return
     
     entity_urls = EntityDocumentRoots()
+    if args.use_async:
+        from async_retriever import retrieve_all
+        retrieve_all({entity_name: [str(url) for url in urls] for entity_name, urls in entity_urls.items()},
+                     base_folder=args.base_folder, concurrency=args.concurrency, per_host=args.per_host,
+                     max_depth=args.max_depth, max_pages=args.max_pages, use_sitemaps=args.sitemaps)
+        return
     for entity_name, urls in tqdm(entity_urls.items(), desc="Entities", unit="entity"):
-        for url in tqdm(urls, desc=f"  Crawling {entity_name} URLs", unit="URL", leave=False):
-            download_pdfs(entity_name, str(url))
-
+        download_pdfs(entity_name, [str(url) for url in urls], base_folder=args.base_folder,
+                      max_depth=args.max_depth, max_pages=args.max_pages, use_sitemaps=args.sitemaps)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
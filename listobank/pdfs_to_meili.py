@@ -16,6 +16,8 @@ from tqdm.auto import tqdm
 from generic_domain_model import GenericDocument
 from domain_config import domain_manager
 from doc_analysis import load_document_analysis
+from utils import extract_documents_text
+import extraction_cache
 
 def wait_for_task(meili: Client, task: TaskInfo, desc: str = "", verbose: bool = True) -> TaskInfo:
   task_result = meili.wait_for_task(task.task_uid)
@@ -43,10 +45,57 @@ def swap_index(meili: Client, old_index_name: str, new_index_name: str):
   clean_index(meili, new_index_name)
 
 
-def index_pdfs(meili: Client, root_dir: Path, index_name: str, batch_size: int = 10):
+def prefetch_pages_text(root_dir: Path, workers: int):
+  """
+  Extract the text of every PDF under root_dir that has no stored pages yet, spreading
+  documents and pages across a process pool, and save the results to their analyses.
+  Each unique file (by content hash) is extracted once; cached text is reused.
+  """
+  pending = []
+  for entity_folder in root_dir.iterdir():
+    if not entity_folder.is_dir():
+      continue
+    for pdf_file in entity_folder.glob("*.pdf"):
+      if not pdf_file.is_file() or pdf_file.name.startswith("_"):
+        continue
+      try:
+        doc_analysis = load_document_analysis(pdf_file, bank=entity_folder.name)
+      except (FileNotFoundError, ValueError):
+        continue
+      if doc_analysis.pages_complete:
+        continue
+      if doc_analysis.load_cached_pages() and doc_analysis.pages_complete:
+        doc_analysis.save()
+        continue
+      pending.append(doc_analysis)
+
+  if not pending:
+    return
+  # group by engine, then by content hash, so every unique file is extracted once
+  unique_paths: dict[str, dict[str, Path]] = {}
+  for doc_analysis in pending:
+    unique_paths.setdefault(doc_analysis.engine, {}).setdefault(doc_analysis.content_hash, doc_analysis.relative_file_path)
+  extracted: dict[tuple[str, str], list[str]] = {}
+  for engine, paths in unique_paths.items():
+    engine_results = extract_documents_text(list(paths.values()), workers=workers, engine=engine)
+    for content_hash, pdf_path in paths.items():
+      extracted[(engine, content_hash)] = engine_results[pdf_path]
+      if engine_results[pdf_path]:
+        extraction_cache.put(content_hash, engine_results[pdf_path], len(engine_results[pdf_path]), engine=engine)
+  for doc_analysis in pending:
+    pages = extracted[(doc_analysis.engine, doc_analysis.content_hash)]
+    if pages:
+      doc_analysis.pages_text = pages
+      doc_analysis.page_count = len(pages)
+      doc_analysis.extraction_engine = doc_analysis.engine
+      doc_analysis.save()
+
+
+def index_pdfs(meili: Client, root_dir: Path, index_name: str, batch_size: int = 10, workers: int = 1):
   """
   Walk through each subfolder in root_dir (each representing an entity), extract text from all PDFs,
   split them by page, add previous-page context, and index them into the specified MeiliSearch index in batches.
+  With workers > 1, text extraction for all PDFs is done up front in a process pool.
   """
   try:
     index = meili.get_index(index_name)
@@ -64,6 +113,10 @@ def index_pdfs(meili: Client, root_dir: Path, index_name: str, batch_size: int =
                   ]),
                   desc=f"Set filterable attributes for index '{index_name}'")
 
+  if workers > 1:
+    print(f"Extracting text from PDFs in {root_dir} using {workers} workers...")
+    prefetch_pages_text(root_dir, workers)
+
   print(
       f"Indexing PDFs from {root_dir} into MeiliSearch index '{index_name}'...")
 
@@ -81,7 +134,7 @@ def index_pdfs(meili: Client, root_dir: Path, index_name: str, batch_size: int =
 
       try:
         doc_analysis = load_document_analysis(pdf_file, bank=entity_name)
-        pages = doc_analysis.get_pages_as_text(indent_level=2)
+        pages = doc_analysis.get_clean_pages_as_text(indent_level=2)
         
         document_name_hash = hashlib.md5(pdf_file.stem.encode()).hexdigest()
         document_mtime = pdf_file.stat().st_mtime_ns
@@ -181,6 +234,10 @@ def main():
       "--batch-size", type=int, default=500,
       help="Number of documents to index in each batch"
   )
+  parser.add_argument(
+      "--workers", type=int, default=os.cpu_count() or 1,
+      help="Number of processes used for PDF text extraction (default: number of CPUs)"
+  )
   args = parser.parse_args()
 
   meili = Client(args.meili_url, args.api_key)
@@ -198,6 +255,7 @@ def main():
       root_dir=args.root_dir,
       index_name=output_index_name,
       batch_size=args.batch_size,
+      workers=args.workers,
   )
 
   if using_temporary_index:
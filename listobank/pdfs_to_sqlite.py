@@ -4,49 +4,95 @@
 This script walks a directory tree, stores every PDF file as a BLOB and, if
 available, the corresponding ``.analysis.json`` file as text. The resulting
 SQLite database can then be bundled with the web application for offline use.
+
+PDFs are stored once per content hash in ``blobs``; ``document_paths`` maps each
+path to its blob. The ``documents`` view joins the two, so readers can keep
+querying ``SELECT pdf FROM documents WHERE path = ?``.
 """
 
 import argparse
 import sqlite3
+from hashlib import md5
 from pathlib import Path
 from typing import Iterable
 
 from tqdm.auto import tqdm
 
+import fingerprints
+
 
 def iter_pdfs(root: Path) -> Iterable[Path]:
     """Yield all PDF files under ``root``."""
     return root.glob("**/*.pdf")
 
 
+def _create_schema(conn: sqlite3.Connection) -> None:
+    """Create the tables and view, migrating a ``documents`` table with inline PDFs."""
+    legacy = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'documents'"
+    ).fetchone()
+    if legacy:
+        conn.execute("ALTER TABLE documents RENAME TO documents_legacy")
+    conn.executescript(
+        """
+        CREATE TABLE IF NOT EXISTS blobs (
+            content_hash TEXT PRIMARY KEY,
+            pdf BLOB NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS document_paths (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            path TEXT UNIQUE,
+            content_hash TEXT NOT NULL REFERENCES blobs(content_hash),
+            analysis TEXT
+        );
+        CREATE VIEW IF NOT EXISTS documents AS
+            SELECT d.id, d.path, b.pdf, d.analysis
+            FROM document_paths d JOIN blobs b ON b.content_hash = d.content_hash;
+        """
+    )
+    if legacy:
+        for path, pdf_blob, analysis_text in conn.execute(
+            "SELECT path, pdf, analysis FROM documents_legacy"
+        ).fetchall():
+            content_hash = md5(pdf_blob).hexdigest()
+            conn.execute("INSERT OR IGNORE INTO blobs(content_hash, pdf) VALUES(?, ?)", (content_hash, pdf_blob))
+            conn.execute(
+                "INSERT OR REPLACE INTO document_paths(path, content_hash, analysis) VALUES(?, ?, ?)",
+                (path, content_hash, analysis_text),
+            )
+        conn.execute("DROP TABLE documents_legacy")
+    conn.commit()
+
+
 def store_documents(db_path: Path, pdf_files: Iterable[Path], root: Path) -> None:
-    """Insert PDFs and optional analyses into the SQLite database."""
+    """Insert PDFs and optional analyses into the SQLite database, each distinct PDF once."""
     with sqlite3.connect(str(db_path)) as conn:
+        _create_schema(conn)
         cur = conn.cursor()
-        cur.execute(
-            """
-            CREATE TABLE IF NOT EXISTS documents (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                path TEXT UNIQUE,
-                pdf BLOB,
-                analysis TEXT
-            )
-            """
-        )
-        conn.commit()
 
         for pdf_file in tqdm(pdf_files, desc="Storing PDFs", unit="file"):
             rel_path = pdf_file.relative_to(root).as_posix()
-            pdf_blob = pdf_file.read_bytes()
+            content_hash = fingerprints.content_hash(pdf_file)
+            # only read PDFs whose content is not in the database yet
+            if cur.execute("SELECT 1 FROM blobs WHERE content_hash = ?", (content_hash,)).fetchone() is None:
+                cur.execute(
+                    "INSERT INTO blobs(content_hash, pdf) VALUES(?, ?)", (content_hash, pdf_file.read_bytes())
+                )
             analysis_file = pdf_file.with_suffix(".analysis.json")
             analysis_text = (
                 analysis_file.read_text(encoding="utf-8") if analysis_file.is_file() else None
             )
             cur.execute(
-                "INSERT OR REPLACE INTO documents(path, pdf, analysis) VALUES(?, ?, ?)",
-                (rel_path, pdf_blob, analysis_text),
+                "INSERT OR REPLACE INTO document_paths(path, content_hash, analysis) VALUES(?, ?, ?)",
+                (rel_path, content_hash, analysis_text),
             )
+        # blobs of paths whose content was replaced
+        cur.execute("DELETE FROM blobs WHERE content_hash NOT IN (SELECT content_hash FROM document_paths)")
         conn.commit()
+        documents, blobs = cur.execute(
+            "SELECT (SELECT COUNT(*) FROM document_paths), (SELECT COUNT(*) FROM blobs)"
+        ).fetchone()
+        print(f"{documents} documents, {blobs} distinct PDFs")
 
 
 def main() -> None:
@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+"""
+Persistent cache of LLM responses.
+
+Responses are stored in a small SQLite database under a key the caller derives from
+everything that determines the response (model, prompt, schema, generation config), so
+re-running a pipeline step after an unrelated change does not pay for the same calls
+again. Entries expire after a TTL and the least recently used ones are evicted when the
+cache outgrows its size bound. Concurrent requests for the same key are coalesced: one
+thread computes the response while the others wait for it.
+"""
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+DB_PATH = Path(os.getenv("RESPONSE_CACHE_DB", Path.cwd() / ".cache" / "responses.sqlite"))
+TTL_SECONDS = float(os.getenv("RESPONSE_CACHE_TTL_DAYS", "30")) * 24 * 3600
+MAX_CACHE_BYTES = int(os.getenv("RESPONSE_CACHE_MAX_MB", "256")) * 1024 * 1024
+# the cache is disabled altogether with RESPONSE_CACHE=0
+ENABLED = os.getenv("RESPONSE_CACHE", "1") != "0"
+
+_lock = threading.Lock()
+_connections: dict[Path, sqlite3.Connection] = {}
+_inflight_lock = threading.Lock()
+_inflight: dict[str, "_InFlight"] = {}
+
+
+class _InFlight:
+  def __init__(self):
+    self.done = threading.Event()
+    self.value: str | None = None
+    self.error: BaseException | None = None
+
+
+def _connect(db_path: Path) -> sqlite3.Connection:
+  conn = _connections.get(db_path)
+  if conn is None:
+    db_path.parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(str(db_path), check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript(
+        """
+        CREATE TABLE IF NOT EXISTS responses (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            created_at REAL NOT NULL,
+            accessed_at REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_responses_accessed_at ON responses(accessed_at);
+        """
+    )
+    conn.commit()
+    _connections[db_path] = conn
+  return conn
+
+
+def make_key(**parts) -> str:
+  """
+  Hashes the JSON-serializable parts that determine a response into a cache key.
+  """
+  return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+def get(key: str, ttl: float = TTL_SECONDS, db_path: Path = DB_PATH) -> str | None:
+  """
+  Returns the cached response for key, or None if there is none or it expired.
+  """
+  now = time.time()
+  with _lock:
+    conn = _connect(db_path)
+    row = conn.execute("SELECT value, created_at FROM responses WHERE key = ?", (key,)).fetchone()
+    if row is None:
+      return None
+    if now - row[1] > ttl:
+      conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+      conn.commit()
+      return None
+    conn.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+    conn.commit()
+  return row[0]
+
+
+def put(key: str, value: str, max_bytes: int = MAX_CACHE_BYTES, db_path: Path = DB_PATH) -> None:
+  """
+  Stores a response, evicting least recently used entries beyond max_bytes.
+  """
+  now = time.time()
+  size = len(value.encode("utf-8"))
+  with _lock:
+    conn = _connect(db_path)
+    conn.execute(
+        "INSERT OR REPLACE INTO responses(key, value, size, created_at, accessed_at) VALUES(?, ?, ?, ?, ?)",
+        (key, value, size, now, now),
+    )
+    total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+    if total > max_bytes:
+      excess = total - max_bytes
+      evicted = 0
+      for evict_key, evict_size in conn.execute(
+          "SELECT key, size FROM responses ORDER BY accessed_at").fetchall():
+        if evicted >= excess:
+          break
+        conn.execute("DELETE FROM responses WHERE key = ?", (evict_key,))
+        evicted += evict_size
+    conn.commit()
+
+
+def get_or_compute(key: str, compute, ttl: float = TTL_SECONDS, max_bytes: int = MAX_CACHE_BYTES,
+                   db_path: Path = DB_PATH) -> str:
+  """
+  Returns the cached response for key, or calls compute() and caches its result. While one
+  thread computes a key, other threads asking for it wait for that result instead of
+  calling compute() themselves. Exceptions are not cached.
+  """
+  cached = get(key, ttl, db_path)
+  if cached is not None:
+    return cached
+  with _inflight_lock:
+    inflight = _inflight.get(key)
+    owner = inflight is None
+    if owner:
+      inflight = _inflight[key] = _InFlight()
+  if not owner:
+    inflight.done.wait()
+    if inflight.error is not None:
+      raise inflight.error
+    return inflight.value
+
+  try:
+    # the previous owner may have stored the value between the first lookup and now
+    value = get(key, ttl, db_path)
+    if value is None:
+      value = compute()
+      put(key, value, max_bytes, db_path)
+    inflight.value = value
+    return value
+  except BaseException as e:
+    inflight.error = e
+    raise
+  finally:
+    with _inflight_lock:
+      del _inflight[key]
+    inflight.done.set()
+
+
+def prune(ttl: float = TTL_SECONDS, max_bytes: int = MAX_CACHE_BYTES, db_path: Path = DB_PATH) -> int:
+  """
+  Removes expired entries and evicts least recently used ones beyond max_bytes.
+  Returns the number of removed entries.
+  """
+  with _lock:
+    conn = _connect(db_path)
+    removed = conn.execute("DELETE FROM responses WHERE created_at < ?", (time.time() - ttl,)).rowcount
+    total = 0
+    for key, size in conn.execute("SELECT key, size FROM responses ORDER BY accessed_at DESC").fetchall():
+      total += size
+      if total > max_bytes:
+        conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+        removed += 1
+    conn.commit()
+  return removed
+
+
+def main():
+  parser = argparse.ArgumentParser(description="Inspect or prune the LLM response cache")
+  parser.add_argument("command", choices=["stats", "prune", "clear"])
+  parser.add_argument("--max-mb", type=int, help="Size bound for prune (default: RESPONSE_CACHE_MAX_MB)")
+  args = parser.parse_args()
+
+  if args.command == "prune":
+    max_bytes = args.max_mb * 1024 * 1024 if args.max_mb is not None else MAX_CACHE_BYTES
+    print(f"Removed {prune(max_bytes=max_bytes)} entries")
+  elif args.command == "clear":
+    with _lock:
+      conn = _connect(DB_PATH)
+      conn.execute("DELETE FROM responses")
+      conn.commit()
+  with _lock:
+    count, size = _connect(DB_PATH).execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+  print(f"{count} cached responses, {size / 1e6:.1f} MB")
+
+
+if __name__ == "__main__":
+  main()
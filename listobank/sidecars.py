@@ -0,0 +1,97 @@
+"""
+Sidecar files holding the heavy DocumentAnalysis fields.
+
+Page text is stored as gzip-compressed JSON (`<name>.pages.json.gz`, and the text with
+boilerplate removed in `<name>.clean.json.gz`) and page embeddings as packed
+little-endian float32 vectors (`<name>.embeddings.bin`), next to the `.analysis.json`
+metadata file. Both record the content hash of the PDF they were
+computed from, so a sidecar left over from a previous version of the file is ignored.
+"""
+import gzip
+import json
+import struct
+import sys
+from array import array
+from pathlib import Path
+
+from atomic_io import atomic_write_bytes
+
+EMBEDDINGS_MAGIC = b"LBEMB001"
+# magic, content hash (hex md5), rows, dimensions
+EMBEDDINGS_HEADER = struct.Struct("<8s32sII")
+
+
+def pages_path(pdf_path: Path) -> Path:
+  return pdf_path.with_suffix(".pages.json.gz")
+
+
+def clean_pages_path(pdf_path: Path) -> Path:
+  return pdf_path.with_suffix(".clean.json.gz")
+
+
+def embeddings_path(pdf_path: Path) -> Path:
+  return pdf_path.with_suffix(".embeddings.bin")
+
+
+def _read_pages_file(path: Path, content_hash: str) -> list[str] | None:
+  try:
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+      data = json.load(f)
+  except (FileNotFoundError, OSError, ValueError):
+    return None
+  if data.get("content_hash") != content_hash:
+    return None
+  return data["pages"]
+
+
+def _write_pages_file(path: Path, content_hash: str, pages: list[str]) -> None:
+  data = json.dumps({"content_hash": content_hash, "pages": pages}, ensure_ascii=False).encode("utf-8")
+  atomic_write_bytes(path, gzip.compress(data, compresslevel=6))
+
+
+def read_pages(pdf_path: Path, content_hash: str) -> list[str] | None:
+  return _read_pages_file(pages_path(pdf_path), content_hash)
+
+
+def write_pages(pdf_path: Path, content_hash: str, pages: list[str]) -> None:
+  _write_pages_file(pages_path(pdf_path), content_hash, pages)
+
+
+def read_clean_pages(pdf_path: Path, content_hash: str) -> list[str] | None:
+  return _read_pages_file(clean_pages_path(pdf_path), content_hash)
+
+
+def write_clean_pages(pdf_path: Path, content_hash: str, pages: list[str]) -> None:
+  _write_pages_file(clean_pages_path(pdf_path), content_hash, pages)
+
+
+def remove_clean_pages(pdf_path: Path) -> None:
+  clean_pages_path(pdf_path).unlink(missing_ok=True)
+
+
+def read_embeddings(pdf_path: Path, content_hash: str) -> list[list[float]] | None:
+  try:
+    raw = embeddings_path(pdf_path).read_bytes()
+  except FileNotFoundError:
+    return None
+  if len(raw) < EMBEDDINGS_HEADER.size:
+    return None
+  magic, stored_hash, rows, dim = EMBEDDINGS_HEADER.unpack_from(raw)
+  if magic != EMBEDDINGS_MAGIC or stored_hash.decode("ascii") != content_hash:
+    return None
+  values = array("f")
+  values.frombytes(raw[EMBEDDINGS_HEADER.size:EMBEDDINGS_HEADER.size + rows * dim * values.itemsize])
+  if sys.byteorder == "big":
+    values.byteswap()
+  return [values[i * dim:(i + 1) * dim].tolist() for i in range(rows)]
+
+
+def write_embeddings(pdf_path: Path, content_hash: str, embeddings: list[list[float]]) -> None:
+  dim = len(embeddings[0]) if embeddings else 0
+  if any(len(vector) != dim for vector in embeddings):
+    raise ValueError(f"All embeddings of {pdf_path} must have {dim} dimensions")
+  values = array("f", (value for vector in embeddings for value in vector))
+  if sys.byteorder == "big":
+    values.byteswap()
+  header = EMBEDDINGS_HEADER.pack(EMBEDDINGS_MAGIC, content_hash.encode("ascii"), len(embeddings), dim)
+  atomic_write_bytes(embeddings_path(pdf_path), header + values.tobytes())
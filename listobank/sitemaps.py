@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+"""
+Document discovery from sitemaps.
+
+Instead of scraping listing pages, the PDFs of an entity are read from the sitemaps of its
+sites: those named in the entity's `"sitemaps"` configuration, or else those announced in
+robots.txt, or else `/sitemap.xml`. Sitemap indexes are followed, gzipped sitemaps are
+decompressed, and only PDF URLs on the entity's sites are kept, optionally narrowed by the
+regular expressions in the entity's `"sitemap_include"` configuration. A PDF whose
+`<lastmod>` is older than the last time it was checked is skipped without any request.
+
+Sitemaps may also be local files, so discovery can be tried against fixtures:
+
+    python sitemaps.py --sitemap tests/fixtures/sitemap_index.xml
+"""
+import argparse
+import datetime
+import gzip
+import io
+import re
+import xml.etree.ElementTree as ET
+from pathlib import Path
+from urllib.parse import urljoin, urlparse
+from urllib.request import url2pathname
+
+from pydantic import BaseModel, Field
+
+import crawl_state
+from crawl_frontier import canonicalize_url, in_scope, is_pdf_url, site_of, url_key
+from domain_config import domain_manager
+
+# sitemaps.org limits a sitemap to 50 MB uncompressed
+MAX_SITEMAP_BYTES = 50 * 1024 * 1024
+CHUNK_SIZE = 64 * 1024
+# sitemaps fetched per entity, counting nested ones
+MAX_SITEMAPS = 50
+MAX_NESTING = 3
+
+
+class SitemapEntry(BaseModel):
+  url: str = Field(
+      ..., description="location of the document or nested sitemap"
+  )
+  lastmod: datetime.datetime | None = Field(
+      default=None, description="when the document last changed, according to the sitemap"
+  )
+
+
+def parse_lastmod(value: str | None) -> datetime.datetime | None:
+  """
+  Parses a W3C datetime. A date without a time stands for the end of that day (UTC), so a
+  document changed later on the day it was checked is not skipped.
+  """
+  if not value:
+    return None
+  value = value.strip()
+  try:
+    if re.fullmatch(r"\d{4}(-\d{2}(-\d{2})?)?", value):
+      parts = [int(part) for part in value.split("-")] + [1, 1]
+      return datetime.datetime(parts[0], parts[1], parts[2], tzinfo=datetime.timezone.utc) + \
+        datetime.timedelta(days=1)
+    parsed = datetime.datetime.fromisoformat(value.replace("Z", "+00:00"))
+  except ValueError:
+    return None
+  return parsed if parsed.tzinfo else parsed.replace(tzinfo=datetime.timezone.utc)
+
+
+def _decompress(content: bytes) -> bytes:
+  if content[:2] != b"\x1f\x8b":
+    return content
+  with gzip.GzipFile(fileobj=io.BytesIO(content)) as f:
+    data = f.read(MAX_SITEMAP_BYTES + 1)
+  if len(data) > MAX_SITEMAP_BYTES:
+    raise ValueError(f"Sitemap exceeds {MAX_SITEMAP_BYTES} bytes uncompressed")
+  return data
+
+
+def parse_sitemap(content: bytes, base_url: str = "") -> tuple[list[SitemapEntry], list[SitemapEntry]]:
+  """
+  Parses a (possibly gzipped) sitemap or sitemap index.
+  Returns (page entries, nested sitemap entries).
+  """
+  root = ET.fromstring(_decompress(content))
+  pages, sitemaps = [], []
+  for element in root:
+    tag = element.tag.rsplit("}", 1)[-1]
+    if tag not in ("url", "sitemap"):
+      continue
+    fields = {child.tag.rsplit("}", 1)[-1]: (child.text or "").strip() for child in element}
+    if not fields.get("loc"):
+      continue
+    entry = SitemapEntry(url=urljoin(base_url, fields["loc"]), lastmod=parse_lastmod(fields.get("lastmod")))
+    (sitemaps if tag == "sitemap" else pages).append(entry)
+  return pages, sitemaps
+
+
+def _is_local(location: str) -> bool:
+  return urlparse(location).scheme not in ("http", "https")
+
+
+def _base_url(location: str) -> str:
+  # relative locations in a local sitemap are resolved against its directory
+  if _is_local(location) and not location.startswith("file:"):
+    return Path(location).resolve().as_uri()
+  return location
+
+
+def _too_large(location: str) -> ValueError:
+  return ValueError(f"Sitemap {location} exceeds {MAX_SITEMAP_BYTES} bytes")
+
+
+def fetch(location: str) -> bytes | None:
+  """
+  Reads a sitemap (or robots.txt) from a URL, a file:// URL or a local path, refusing more
+  than MAX_SITEMAP_BYTES. Returns None if it does not exist.
+  """
+  if _is_local(location):
+    parsed = urlparse(location)
+    path = Path(url2pathname(parsed.path)) if parsed.scheme == "file" else Path(location)
+    if not path.is_file():
+      return None
+    if path.stat().st_size > MAX_SITEMAP_BYTES:
+      raise _too_large(location)
+    return path.read_bytes()
+  from pdf_retriever import get_session
+  with get_session().get(location, timeout=15, stream=True) as response:
+    if response.status_code in (404, 410):
+      return None
+    response.raise_for_status()
+    content = bytearray()
+    for chunk in response.iter_content(CHUNK_SIZE):
+      content += chunk
+      if len(content) > MAX_SITEMAP_BYTES:
+        raise _too_large(location)
+  return bytes(content)
+
+
+def robots_sitemaps(site_url: str, fetch=fetch) -> list[str]:
+  """
+  Sitemap URLs announced in the robots.txt of a site.
+  """
+  try:
+    content = fetch(urljoin(site_url, "/robots.txt"))
+  except (OSError, ValueError) as e:
+    print(f"Warning: Could not read robots.txt of {site_url}: {e}")
+    return []
+  if not content:
+    return []
+  return [line.split(":", 1)[1].strip() for line in content.decode("utf-8", "replace").splitlines()
+          if line.lower().startswith("sitemap:")]
+
+
+def entity_sitemaps(entity_name: str, root_urls: list[str], fetch=fetch) -> list[str]:
+  """
+  Sitemaps to read for an entity: configured ones, or those of the sites of its root URLs.
+  """
+  configured = domain_manager.config.entities.get(entity_name, {}).get("sitemaps") if domain_manager.config else None
+  if configured:
+    return list(configured)
+  sitemaps = []
+  for site_url in dict.fromkeys(f"{urlparse(url).scheme}://{urlparse(url).netloc}/" for url in root_urls):
+    sitemaps.extend(robots_sitemaps(site_url, fetch) or [urljoin(site_url, "/sitemap.xml")])
+  return list(dict.fromkeys(sitemaps))
+
+
+def discover(sitemap_urls: list[str], sites: set[str] | None = None, include: list[str] | None = None,
+             fetch=fetch) -> list[SitemapEntry]:
+  """
+  Reads sitemaps and the sitemap indexes among them, breadth-first, and returns the PDF
+  entries on the given sites (all sites if None) matching any include pattern.
+  When a PDF is listed more than once, its latest lastmod is kept.
+  """
+  patterns = [re.compile(pattern) for pattern in include or []]
+  documents: dict[str, SitemapEntry] = {}
+  queue = [(url, 0) for url in sitemap_urls]
+  seen = set()
+  while queue and len(seen) < MAX_SITEMAPS:
+    sitemap_url, depth = queue.pop(0)
+    if sitemap_url in seen:
+      continue
+    seen.add(sitemap_url)
+    try:
+      content = fetch(sitemap_url)
+      if content is None:
+        continue
+      pages, nested = parse_sitemap(content, base_url=_base_url(sitemap_url))
+    except (OSError, ValueError, ET.ParseError) as e:
+      print(f"Warning: Could not read sitemap {sitemap_url}: {e}")
+      continue
+    if depth < MAX_NESTING:
+      queue.extend((entry.url, depth + 1) for entry in nested)
+    for entry in pages:
+      if not is_pdf_url(entry.url):
+        continue
+      url = entry.url.strip()
+      if sites is not None and not in_scope(url, sites):
+        continue
+      if patterns and not any(pattern.search(url) for pattern in patterns):
+        continue
+      key = url_key(canonicalize_url(url), ignore_query=True)
+      known = documents.get(key)
+      if known is None or (entry.lastmod and (known.lastmod is None or entry.lastmod > known.lastmod)):
+        documents[key] = SitemapEntry(url=url, lastmod=entry.lastmod)
+  return list(documents.values())
+
+
+def entity_documents(entity_name: str, root_urls: list[str], fetch=fetch) -> list[SitemapEntry]:
+  """
+  PDF entries of an entity's sitemaps, restricted to the sites of its root URLs.
+  """
+  config = domain_manager.config.entities.get(entity_name, {}) if domain_manager.config else {}
+  return discover(entity_sitemaps(entity_name, root_urls, fetch), sites={site_of(url) for url in root_urls},
+                  include=config.get("sitemap_include"), fetch=fetch)
+
+
+def unchanged_since_checked(entry: SitemapEntry, dest_path: Path, checked_at: datetime.datetime | None = None) -> bool:
+  """
+  Whether a downloaded PDF was checked after its sitemap lastmod, so it need not be requested.
+  checked_at defaults to the last successful check recorded in the crawl state.
+  """
+  if entry.lastmod is None or not dest_path.exists():
+    return False
+  if checked_at is None:
+    state = crawl_state.get(entry.url)
+    if state is None or state.error or state.status is None or state.status >= 400:
+      return False
+    checked_at = state.checked_at
+  return checked_at >= entry.lastmod
+
+
+def main():
+  parser = argparse.ArgumentParser(description="List the PDFs found in sitemaps")
+  parser.add_argument("--sitemap", action="append", default=[],
+                      help="Sitemap URL or local file to read (repeatable); default: the configured entities'")
+  parser.add_argument("--entity", help="Only read the sitemaps of this entity")
+  args = parser.parse_args()
+
+  if args.sitemap:
+    entries = {"-": discover(args.sitemap)}
+  else:
+    if not domain_manager.config:
+      banking_config = Path("banking_domain.json")
+      if not banking_config.exists():
+        print("Error: No domain configuration found. Please provide a domain config file.")
+        return
+      domain_manager.load_config(banking_config)
+    roots = {entity: urls for entity, urls in domain_manager.config.entity_urls.items()
+             if args.entity is None or entity == args.entity}
+    entries = {entity: entity_documents(entity, urls) for entity, urls in roots.items()}
+  for entity, documents in entries.items():
+    for entry in documents:
+      print(f"{entity}\t{entry.lastmod.isoformat() if entry.lastmod else '-'}\t{entry.url}")
+    print(f"{entity}: {len(documents)} PDFs")
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""
+Extract fee tables from price list documents.
+
+Tables are pulled from every page with pdfplumber, in a process pool spanning pages of
+all selected documents, and stored as a `.tables.json` sidecar next to each PDF's
+`.analysis.json`. Results are also cached by content hash, so a document whose bytes
+have not changed is never parsed again, wherever it lives.
+"""
+import argparse
+import concurrent.futures
+import os
+from pathlib import Path
+
+from pydantic import BaseModel, Field
+from tqdm.auto import tqdm
+
+from atomic_io import atomic_write_text
+from doc_analysis import DocumentAnalysis, load_document_analysis
+from domain_config import domain_manager
+from utils import page_chunks, page_count
+
+TABLE_CATEGORIES = ["PriceList", "DeltioPliroforisisPeriTelon"]
+CACHE_DIR = Path(os.getenv("TABLE_CACHE_DIR", Path.cwd() / ".cache" / "tables"))
+
+
+class PageTables(BaseModel):
+  page: int = Field(
+      ..., description="page number within the PDF (1-based)"
+  )
+  tables: list[list[list[str]]] = Field(
+      default_factory=list, description="tables on the page, each a list of rows of cell text"
+  )
+
+
+class DocumentTables(BaseModel):
+  content_hash: str = Field(
+      ..., description="hash of the source file the tables were extracted from"
+  )
+  pages: list[PageTables] = Field(
+      default_factory=list, description="extracted tables per page, only pages that contain tables"
+  )
+
+
+def tables_path(pdf_path: Path) -> Path:
+  return pdf_path.with_suffix(".tables.json")
+
+
+def _cache_path(content_hash: str, cache_dir: Path = CACHE_DIR) -> Path:
+  return cache_dir / content_hash[:2] / f"{content_hash}.json"
+
+
+def _read_tables(path: Path) -> DocumentTables | None:
+  try:
+    return DocumentTables.model_validate_json(path.read_text(encoding="utf-8"))
+  except (FileNotFoundError, ValueError):
+    return None
+
+
+def _write_tables(path: Path, tables: DocumentTables) -> None:
+  atomic_write_text(path, tables.model_dump_json(indent=2))
+
+
+def clean_table(table: list[list[str | None]]) -> list[list[str]]:
+  """
+  Replaces missing cells with "" and joins multi-line cells into a single line.
+  """
+  return [[cell.replace("\n", " ").strip() if cell is not None else "" for cell in row] for row in table]
+
+
+def _extract_tables_range(pdf_path: str, start: int, stop: int) -> list[PageTables]:
+  """
+  Extracts the tables on pages [start, stop) of a PDF. Runs inside worker processes.
+  """
+  import pdfplumber
+  results = []
+  with pdfplumber.open(pdf_path) as pdf:
+    for i, page in enumerate(pdf.pages[start:stop], start=start):
+      tables = [clean_table(table) for table in page.extract_tables() if table]
+      if tables:
+        results.append(PageTables(page=i + 1, tables=tables))
+      page.flush_cache()
+  return results
+
+
+def load_document_tables(doc_analysis: DocumentAnalysis) -> DocumentTables | None:
+  """
+  Returns the stored tables for a document if they match its current content hash.
+  """
+  tables = _read_tables(tables_path(doc_analysis.relative_file_path))
+  if tables is None or tables.content_hash != doc_analysis.content_hash:
+    return None
+  return tables
+
+
+def extract_tables(doc_analyses: list[DocumentAnalysis], workers: int | None = None) -> dict[Path, DocumentTables]:
+  """
+  Extracts the tables of every given document and writes the `.tables.json` sidecars.
+  Documents with an up-to-date sidecar or a cache entry for their content hash are not parsed;
+  the remaining unique files are split into page ranges across a single process pool.
+  """
+  workers = workers or os.cpu_count() or 1
+  results: dict[Path, DocumentTables] = {}
+  pending: dict[str, list[DocumentAnalysis]] = {}
+  for doc_analysis in doc_analyses:
+    pdf_path = doc_analysis.relative_file_path
+    tables = load_document_tables(doc_analysis)
+    if tables is None:
+      tables = _read_tables(_cache_path(doc_analysis.content_hash))
+      if tables is not None:
+        _write_tables(tables_path(pdf_path), tables)
+    if tables is not None:
+      results[pdf_path] = tables
+    else:
+      pending.setdefault(doc_analysis.content_hash, []).append(doc_analysis)
+
+  if not pending:
+    return results
+
+  with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+    futures = {}
+    chunks: dict[str, list[list[PageTables]]] = {}
+    failed: set[str] = set()
+    for content_hash, analyses in pending.items():
+      pdf_path = analyses[0].relative_file_path
+      try:
+        ranges = page_chunks(page_count(pdf_path), workers)
+      except Exception as e:
+        print(f"Warning: Could not open {pdf_path}: {e}")
+        failed.add(content_hash)
+        continue
+      chunks[content_hash] = [[] for _ in ranges]
+      for chunk_idx, (start, stop) in enumerate(ranges):
+        future = executor.submit(_extract_tables_range, str(pdf_path), start, stop)
+        futures[future] = (content_hash, chunk_idx)
+
+    for future in tqdm(concurrent.futures.as_completed(futures), total=len(futures),
+                       desc="Extracting tables", unit="chunk", leave=False):
+      content_hash, chunk_idx = futures[future]
+      try:
+        chunks[content_hash][chunk_idx] = future.result()
+      except Exception as e:
+        print(f"Warning: Failed to extract tables from {pending[content_hash][0].relative_file_path}: {e}")
+        failed.add(content_hash)
+
+  for content_hash, analyses in pending.items():
+    if content_hash in failed:
+      continue
+    tables = DocumentTables(content_hash=content_hash,
+                            pages=[page for chunk in chunks[content_hash] for page in chunk])
+    _write_tables(_cache_path(content_hash), tables)
+    for doc_analysis in analyses:
+      _write_tables(tables_path(doc_analysis.relative_file_path), tables)
+      results[doc_analysis.relative_file_path] = tables
+  return results
+
+
+def main():
+  parser = argparse.ArgumentParser(description="Extract fee tables from price list PDFs")
+  parser.add_argument("--root-dir", type=Path, default=Path("data_new"),
+                      help="Root directory containing entity-named subfolders with PDFs (default: data_new)")
+  parser.add_argument("--categories", nargs="+", default=TABLE_CATEGORIES,
+                      help=f"Document categories to extract tables from (default: {' '.join(TABLE_CATEGORIES)})")
+  parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                      help="Number of processes used for table extraction (default: number of CPUs)")
+  args = parser.parse_args()
+
+  if not domain_manager.config:
+    banking_config = Path("banking_domain.json")
+    if banking_config.exists():
+      domain_manager.load_config(banking_config)
+
+  doc_analyses = []
+  for pdf_file in sorted(args.root_dir.glob("**/*.pdf")):
+    if pdf_file.name.startswith("_"):
+      continue
+    try:
+      doc_analysis = load_document_analysis(pdf_file)
+    except (FileNotFoundError, ValueError) as e:
+      print(f"Warning: Could not load DocumentAnalysis for {pdf_file}: {e}")
+      continue
+    if doc_analysis.category in args.categories:
+      doc_analyses.append(doc_analysis)
+
+  results = extract_tables(doc_analyses, workers=args.workers)
+  for pdf_path, tables in sorted(results.items()):
+    table_count = sum(len(page.tables) for page in tables.pages)
+    print(f"{pdf_path}: {table_count} tables on {len(tables.pages)} pages")
+
+
+if __name__ == "__main__":
+  main()
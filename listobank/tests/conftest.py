@@ -0,0 +1,100 @@
+"""
+The modules are flat and keep their caches under the working directory (resolved when they
+are imported), so the tests import them from the parent directory while running in a
+scratch directory. The `pdf_server` fixture serves a listing page and PDFs locally, and
+write_document() sets up an extracted document.
+"""
+import asyncio
+import datetime
+import os
+import sys
+import tempfile
+import threading
+from pathlib import Path
+
+import pytest
+from aiohttp import web
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.chdir(tempfile.mkdtemp(prefix="listobank-tests-"))
+
+
+PDF_A = b"%PDF-1.4\n" + bytes(range(256)) * 400
+PDF_B = b"%PDF-1.4\n" + b"second document\n" * 1000
+def write_document(pdf_path: Path, pages: list[str], bank: str | None = None, content: bytes | None = None):
+  """
+  Writes a PDF (any bytes will do) and an analysis holding its extracted pages, as the
+  extraction stage would. Returns the DocumentAnalysis.
+  """
+  from doc_analysis import new_document_analysis
+
+  pdf_path.parent.mkdir(parents=True, exist_ok=True)
+  pdf_path.write_bytes(content if content is not None else b"%PDF-1.4\n" + "\n".join(pages).encode("utf-8"))
+  doc_analysis = new_document_analysis(pdf_path, retrieved_from=f"https://example.com/{pdf_path.name}",
+                                       retrieved_at=datetime.datetime.now(datetime.timezone.utc),
+                                       bank=bank or pdf_path.parent.name)
+  doc_analysis.pages_text = pages
+  doc_analysis.page_count = len(pages)
+  doc_analysis.save()
+  return doc_analysis
+
+
+LISTING = '<html><body><a href="/docs/a.pdf">A</a> <a href="docs/b.pdf?ref=menu">B</a></body></html>'
+
+
+def pdf_server_app(requests: list) -> web.Application:
+  """
+  A listing page linking two PDFs. Both honour If-None-Match with a 304, and the PDFs honour
+  Range requests guarded by If-Range with a 206. /gzip/a.pdf is sent gzip-encoded.
+  """
+  documents = {"/docs/a.pdf": (PDF_A, '"a1"'), "/docs/b.pdf": (PDF_B, '"b1"')}
+
+  async def listing(request: web.Request) -> web.Response:
+    requests.append((request.path, dict(request.headers)))
+    if request.headers.get("If-None-Match") == '"list1"':
+      return web.Response(status=304)
+    return web.Response(text=LISTING, content_type="text/html", headers={"ETag": '"list1"'})
+
+  async def document(request: web.Request) -> web.Response:
+    requests.append((request.path, dict(request.headers)))
+    body, etag = documents[request.path]
+    if request.headers.get("If-None-Match") == etag:
+      return web.Response(status=304)
+    range_header = request.headers.get("Range")
+    if range_header and request.headers.get("If-Range") == etag:
+      start = int(range_header.removeprefix("bytes=").rstrip("-"))
+      return web.Response(body=body[start:], status=206, content_type="application/pdf", headers={
+          "ETag": etag, "Content-Range": f"bytes {start}-{len(body) - 1}/{len(body)}"})
+    return web.Response(body=body, content_type="application/pdf", headers={"ETag": etag})
+
+  async def gzipped(request: web.Request) -> web.Response:
+    requests.append((request.path, dict(request.headers)))
+    response = web.Response(body=PDF_A, content_type="application/pdf", headers={"ETag": '"a1"'})
+    response.enable_compression(web.ContentCoding.gzip)
+    return response
+
+  app = web.Application()
+  app.router.add_get("/gzip/a.pdf", gzipped)
+  app.router.add_get("/list.html", listing)
+  app.router.add_get("/docs/{name}", document)
+  return app
+
+
+@pytest.fixture
+def pdf_server():
+  """
+  Runs the fixture server on a free local port; yields (base URL, log of (path, headers)).
+  """
+  requests = []
+  loop = asyncio.new_event_loop()
+  runner = web.AppRunner(pdf_server_app(requests))
+  loop.run_until_complete(runner.setup())
+  site = web.TCPSite(runner, "127.0.0.1", 0)
+  loop.run_until_complete(site.start())
+  port = site._server.sockets[0].getsockname()[1]
+  thread = threading.Thread(target=loop.run_forever, daemon=True)
+  thread.start()
+  yield f"http://127.0.0.1:{port}", requests
+  asyncio.run_coroutine_threadsafe(runner.cleanup(), loop).result()
+  loop.call_soon_threadsafe(loop.stop)
+  thread.join()
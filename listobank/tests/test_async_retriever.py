@@ -0,0 +1,74 @@
+import asyncio
+import json
+import os
+from pathlib import Path
+
+import async_retriever
+from async_retriever import AsyncRetriever
+from conftest import PDF_A, PDF_B
+from partial_download import PartialDownload
+
+
+def retrieve(base_folder: Path, entity_urls: dict[str, list[str]]) -> int:
+  async def run():
+    async with AsyncRetriever(str(base_folder), concurrency=4, per_host=2) as retriever:
+      return await retriever.retrieve(entity_urls)
+  return asyncio.run(run())
+
+
+def test_downloads_linked_pdfs_then_revalidates(pdf_server, tmp_path):
+  base_url, requests = pdf_server
+  assert retrieve(tmp_path, {"bank": [f"{base_url}/list.html"]}) == 2
+  assert (tmp_path / "bank" / "a.pdf").read_bytes() == PDF_A
+  assert (tmp_path / "bank" / "b.pdf").read_bytes() == PDF_B
+  assert (tmp_path / "bank" / "a.analysis.json").exists()
+
+  requests.clear()
+  assert retrieve(tmp_path, {"bank": [f"{base_url}/list.html"]}) == 0
+  assert {path for path, _ in requests} == {"/list.html", "/docs/a.pdf", "/docs/b.pdf"}
+  assert all("If-None-Match" in headers for _, headers in requests)
+
+
+def test_resumes_partial_download(pdf_server, tmp_path):
+  base_url, requests = pdf_server
+  dest = tmp_path / "a.pdf"
+  download = PartialDownload(dest)
+  download.part_path.write_bytes(PDF_A[:1000])
+  download.meta_path.write_text(json.dumps({"etag": '"a1"', "last_modified": None}))
+
+  async def run():
+    async with AsyncRetriever(str(tmp_path)) as retriever:
+      return await retriever.download_file(f"{base_url}/docs/a.pdf", dest)
+  etag, was_modified, content_hash, size = asyncio.run(run())
+
+  assert requests[-1][1]["Range"] == "bytes=1000-"
+  assert (etag, was_modified, size) == ('"a1"', True, len(PDF_A))
+  assert dest.read_bytes() == PDF_A
+  assert not download.part_path.exists()
+
+
+def test_failure_of_one_pdf_does_not_abort_the_run(pdf_server, tmp_path, monkeypatch):
+  base_url, _ = pdf_server
+  record_download = async_retriever.record_download
+
+  def failing_record_download(entity_name, pdf_url, dest_path, *args):
+    if dest_path.name == "a.pdf":
+      raise OSError("blob store not writable")
+    return record_download(entity_name, pdf_url, dest_path, *args)
+
+  monkeypatch.setattr(async_retriever, "record_download", failing_record_download)
+  assert retrieve(tmp_path, {"bank": [f"{base_url}/list.html"]}) == 1
+  assert (tmp_path / "bank" / "b.analysis.json").exists()
+  assert not os.path.exists(tmp_path / "bank" / "a.analysis.json")
+
+
+def test_gzip_encoded_pdf_is_not_length_checked(pdf_server, tmp_path):
+  base_url, _ = pdf_server
+  dest = tmp_path / "a.pdf"
+
+  async def run():
+    async with AsyncRetriever(str(tmp_path)) as retriever:
+      return await retriever.download_file(f"{base_url}/gzip/a.pdf", dest)
+  etag, was_modified, content_hash, size = asyncio.run(run())
+  assert (was_modified, size) == (True, len(PDF_A))
+  assert dest.read_bytes() == PDF_A
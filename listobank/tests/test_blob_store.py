@@ -0,0 +1,28 @@
+import sys
+
+import blob_store
+from conftest import PDF_A, PDF_B
+
+
+def test_gc_keeps_blobs_of_symlinked_category_views(tmp_path, monkeypatch):
+  monkeypatch.chdir(tmp_path)
+  blob_dir = tmp_path / "blobs"
+  data = tmp_path / "data_new" / "bank"
+  data.mkdir(parents=True)
+  (data / "a.pdf").write_bytes(PDF_A)
+  (data / "b.pdf").write_bytes(PDF_B)
+  for name in ("a.pdf", "b.pdf"):
+    blob_store.store(data / name, blob_dir=blob_dir)
+  blob_a, blob_b = (blob_store.blob_path(blob_store.fingerprints.content_hash(data / name), blob_dir)
+                    for name in ("a.pdf", "b.pdf"))
+  view = tmp_path / "by_category" / "PriceList" / "bank" / "a.pdf"
+  view.parent.mkdir(parents=True)
+  view.symlink_to(blob_a)
+  # the documents leave the entity tree; a.pdf is still linked from the category tree
+  (data / "a.pdf").unlink()
+  (data / "b.pdf").unlink()
+
+  monkeypatch.setattr(sys, "argv", ["blob_store.py", "gc", "data_new", "--blob-dir", str(blob_dir)])
+  blob_store.main()
+  assert blob_a.exists() and view.read_bytes() == PDF_A
+  assert not blob_b.exists()
@@ -0,0 +1,46 @@
+import datetime
+import sqlite3
+from pathlib import Path
+
+import catalog
+from doc_analysis import DocumentAnalysis
+
+
+def write_analysis(pdf_path: Path, category: str) -> DocumentAnalysis:
+  pdf_path.parent.mkdir(parents=True, exist_ok=True)
+  pdf_path.write_bytes(b"%PDF-1.4\n")
+  doc_analysis = DocumentAnalysis(relative_file_path=pdf_path, retrieved_from="https://example.com/x.pdf",
+                                  retrieved_at=datetime.datetime.now(datetime.timezone.utc), bank="nbg",
+                                  content_hash="0" * 32, category=category)
+  pdf_path.with_suffix(".analysis.json").write_text(doc_analysis.model_dump_json(), encoding="utf-8")
+  return doc_analysis
+
+
+def test_relative_and_absolute_paths_are_catalogued_once(tmp_path, monkeypatch):
+  monkeypatch.chdir(tmp_path)
+  db_path = tmp_path / "catalog.sqlite"
+  doc_analysis = write_analysis(Path("data_new/nbg/x.pdf"), "PriceList")
+  catalog.upsert(doc_analysis, db_path)
+  catalog.sync(tmp_path / "data_new", db_path)
+
+  entries = catalog.find_documents(root_dir=tmp_path / "data_new", db_path=db_path)
+  assert [entry.pdf_path for entry in entries] == [Path("data_new/nbg/x.pdf")]
+  assert catalog.find_documents(root_dir=Path("data_new"), db_path=db_path) == entries
+
+
+def test_legacy_catalog_is_rekeyed(tmp_path, monkeypatch):
+  monkeypatch.chdir(tmp_path)
+  db_path = tmp_path / "legacy.sqlite"
+  write_analysis(Path("data_new/nbg/x.pdf"), "PriceList")
+  conn = sqlite3.connect(db_path)
+  conn.execute("""CREATE TABLE documents (analysis_path TEXT PRIMARY KEY, pdf_path TEXT NOT NULL, entity TEXT NOT NULL,
+                  category TEXT, document_title TEXT, effective_date TEXT, content_hash TEXT NOT NULL,
+                  retrieved_from TEXT, retrieved_at TEXT, analysis_mtime_ns INTEGER)""")
+  for analysis_path in ("data_new/nbg/x.analysis.json", str(tmp_path / "data_new/nbg/x.analysis.json")):
+    conn.execute("INSERT INTO documents VALUES(?, ?, 'nbg', 'PriceList', NULL, NULL, ?, NULL, NULL, 1)",
+                 (analysis_path, analysis_path.replace(".analysis.json", ".pdf"), "0" * 32))
+  conn.commit()
+  conn.close()
+
+  entries = catalog.find_documents(db_path=db_path)
+  assert [entry.analysis_path for entry in entries] == [Path("data_new/nbg/x.analysis.json")]
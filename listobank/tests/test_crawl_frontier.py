@@ -0,0 +1,23 @@
+from crawl_frontier import CrawlFrontier, canonicalize_url
+
+
+def test_canonical_form_is_only_the_dedupe_key():
+  frontier = CrawlFrontier(["https://www.example.com/list?b=2&a=1&ref=menu"], max_depth=1)
+  levels = iter(frontier)
+  depth, level = next(levels)
+  assert (depth, level) == (0, ["https://www.example.com/list?b=2&a=1&ref=menu"])
+
+  new = frontier.add(
+      {"https://www.example.com/docs/A%20B.pdf?ref=menu", "https://WWW.example.com/docs/a%20b.pdf#page=2"},
+      {"https://www.example.com/list?a=1&b=2", "https://www.example.com/more/../other?utm_source=x#top"},
+  )
+  # the first of the equivalent links is kept as written
+  assert new == ["https://WWW.example.com/docs/a%20b.pdf#page=2"]
+  assert frontier.documents == new
+  _, next_level = next(levels)
+  assert next_level == ["https://www.example.com/more/../other?utm_source=x#top"]
+
+
+def test_canonicalize_url():
+  assert canonicalize_url("HTTPS://Example.com:443/a/./b/../c.pdf?z=1&utm_medium=x&a=2#frag") == \
+    "https://example.com/a/c.pdf?a=2&z=1"
@@ -0,0 +1,88 @@
+import threading
+import time
+
+import crawl_scheduler
+from crawl_scheduler import DEFAULT_REFRESH_HOURS, STARTUP_SPREAD, CrawlScheduler, load_jobs
+
+BASE_INTERVAL = DEFAULT_REFRESH_HOURS * 3600
+ENTITY_URLS = {"bank": ["https://bank.example/a", "https://bank.example/b"], "other": ["https://other.example/"]}
+
+
+class FakeClock:
+  def __init__(self, now: float = 1_000_000.0):
+    self.now = now
+
+  def __call__(self) -> float:
+    return self.now
+
+
+class FakeJobs:
+  """
+  run_job that returns the queued results per URL and records overlapping runs of an entity.
+  """
+
+  def __init__(self, results: dict[str, list] | None = None):
+    self.results = results or {}
+    self.calls = []
+    self.overlaps = 0
+    self._running = set()
+    self._lock = threading.Lock()
+
+  def __call__(self, entity: str, url: str):
+    with self._lock:
+      if entity in self._running:
+        self.overlaps += 1
+      self._running.add(entity)
+      self.calls.append(url)
+    try:
+      # long enough for another job of the entity to start, if the scheduler allowed it
+      time.sleep(0.05)
+      results = self.results.get(url, [])
+      return results.pop(0) if results else 0
+    finally:
+      with self._lock:
+        self._running.discard(entity)
+
+
+def test_once_runs_every_due_job_one_per_entity_and_exits(tmp_path):
+  clock, jobs = FakeClock(), FakeJobs()
+  scheduler = CrawlScheduler(ENTITY_URLS, run_job=jobs, jitter=0, db_path=tmp_path / "schedule.sqlite",
+                             clock=clock, stagger=False)
+  scheduler.run(once=True)
+  assert sorted(jobs.calls) == sorted(url for urls in ENTITY_URLS.values() for url in urls)
+  assert jobs.overlaps == 0
+  assert all(job.next_run > clock.now for job in scheduler.jobs.values())
+
+
+def test_intervals_adapt_and_persist_across_restarts(tmp_path):
+  db_path = tmp_path / "schedule.sqlite"
+  clock = FakeClock()
+  jobs = FakeJobs({"https://bank.example/a": [3], "https://bank.example/b": [None]})
+  CrawlScheduler(ENTITY_URLS, run_job=jobs, jitter=0, db_path=db_path, clock=clock, stagger=False).run(once=True)
+
+  stored = load_jobs(db_path)
+  changed, unchanged, _ = (stored[("bank", "https://bank.example/a")], stored[("bank", "https://bank.example/b")],
+                           stored[("other", "https://other.example/")])
+  assert changed.interval == BASE_INTERVAL * crawl_scheduler.SPEEDUP
+  assert changed.last_changed == clock.now and changed.next_run == clock.now + changed.interval
+  # a run_job returning None counts as finding nothing
+  assert (unchanged.interval, unchanged.error) == (BASE_INTERVAL * crawl_scheduler.SLOWDOWN, None)
+
+  # after a restart the schedule resumes: nothing is due until the shortest interval passed
+  restarted = CrawlScheduler(ENTITY_URLS, run_job=jobs, jitter=0, db_path=db_path, clock=clock)
+  assert restarted.jobs[("bank", "https://bank.example/a")] == changed
+  calls = len(jobs.calls)
+  restarted.run(once=True)
+  assert len(jobs.calls) == calls
+  clock.now = changed.next_run
+  restarted.run(once=True)
+  assert jobs.calls[calls:] == ["https://bank.example/a"]
+
+
+def test_due_jobs_are_staggered_in_memory_only(tmp_path):
+  db_path = tmp_path / "schedule.sqlite"
+  clock = FakeClock()
+  scheduler = CrawlScheduler(ENTITY_URLS, run_job=FakeJobs(), jitter=0, db_path=db_path, clock=clock)
+  run_times = sorted(run_at for run_at, _, _ in scheduler._queue)
+  assert run_times == [clock.now + STARTUP_SPREAD * i / 3 for i in range(3)]
+  assert all(job.next_run == clock.now for job in load_jobs(db_path).values())
@@ -0,0 +1,31 @@
+import pytest
+
+from doc_analysis import load_document_analysis
+from conftest import write_document
+
+
+def test_pdf_without_analysis_gets_a_new_one(tmp_path):
+  pdf_path = tmp_path / "bank" / "manual.pdf"
+  pdf_path.parent.mkdir()
+  pdf_path.write_bytes(b"%PDF-1.4\n")
+  doc_analysis = load_document_analysis(pdf_path, bank="bank")
+  assert (doc_analysis.bank, doc_analysis.retrieved_from) == ("bank", None)
+  with pytest.raises(ValueError):
+    load_document_analysis(pdf_path)
+
+
+def test_invalid_analysis_is_recreated(tmp_path):
+  pdf_path = tmp_path / "bank" / "broken.pdf"
+  pdf_path.parent.mkdir()
+  pdf_path.write_bytes(b"%PDF-1.4\n")
+  pdf_path.with_suffix(".analysis.json").write_text('{"bank": "bank"}', encoding="utf-8")
+  assert load_document_analysis(pdf_path, bank="bank").retrieved_from is None
+
+
+def test_changed_file_keeps_its_url(tmp_path):
+  pdf_path = tmp_path / "bank" / "fees.pdf"
+  write_document(pdf_path, ["fees"])
+  pdf_path.write_bytes(b"%PDF-1.4\nrepublished")
+  doc_analysis = load_document_analysis(pdf_path, bank="bank")
+  assert str(doc_analysis.retrieved_from) == "https://example.com/fees.pdf"
+  assert doc_analysis.pages_text is None
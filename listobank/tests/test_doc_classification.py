@@ -0,0 +1,79 @@
+import pytest
+
+pytest.importorskip("google.genai")
+
+import doc_classification
+import extraction_cache
+import fingerprints
+from doc_analysis import load_document_analysis
+from conftest import write_document
+
+FEES = " ".join(f"account fee {i} is {i * 2} euro per month" for i in range(100))
+TERMS = " ".join(f"term {i} of the general conditions applies to clause {i + 7}" for i in range(100))
+
+
+@pytest.fixture
+def classifier(monkeypatch):
+  """
+  Classifies by file name instead of calling Gemini; yields the file names sent to the model.
+  """
+  calls = []
+
+  def generate_content(gemini, prompt, response_schema=None, cache=True):
+    file_name = prompt.split("<FileName>", 1)[1].split("</FileName>", 1)[0]
+    calls.append(file_name)
+    if file_name == "failing.pdf":
+      raise RuntimeError("model unavailable")
+    category = "Terms" if "terms" in file_name else "PriceList"
+    return doc_classification.DocumentLLMClassification(category=category, effective_date=None, document_title=None)
+
+  monkeypatch.setattr(doc_classification, "Categories", lambda: {"PriceList": "fees", "Terms": "terms"})
+  monkeypatch.setattr(doc_classification, "create_gemini", lambda: None)
+  monkeypatch.setattr(doc_classification, "generate_content", generate_content)
+  yield calls
+
+
+def test_only_changed_documents_are_reclassified(tmp_path, classifier):
+  root_dir = tmp_path / "data_new"
+  write_document(root_dir / "bank" / "fees.pdf", [FEES])
+  write_document(root_dir / "bank" / "terms.pdf", [TERMS])
+  assert set(doc_classification.classify_documents(root_dir).values()) == {"PriceList", "Terms"}
+  assert sorted(classifier) == ["fees.pdf", "terms.pdf"]
+
+  classifier.clear()
+  terms_path = root_dir / "bank" / "terms.pdf"
+  terms_path.write_bytes(b"%PDF-1.4\nrevised terms")
+  engine = load_document_analysis(terms_path, bank="bank").engine
+  extraction_cache.put(fingerprints.content_hash(terms_path), [TERMS + " revised"], 1, engine=engine)
+  assert list(doc_classification.classify_documents(root_dir).values()) == ["Terms"]
+  assert classifier == ["terms.pdf"]
+  assert not doc_classification.needs_classification(load_document_analysis(terms_path), {"PriceList": "fees",
+                                                                                          "Terms": "terms"})
+
+  classifier.clear()
+  assert doc_classification.classify_documents(root_dir) == {}
+  assert classifier == []
+
+
+def test_duplicates_reuse_classifications_within_their_entity(tmp_path, classifier):
+  root_dir = tmp_path / "data_new"
+  write_document(root_dir / "bank" / "fees.pdf", [FEES])
+  write_document(root_dir / "bank" / "fees-premium.pdf", [FEES + " premium"])
+  write_document(root_dir / "other" / "fees.pdf", [FEES])
+  results = doc_classification.classify_documents(root_dir)
+  assert len(results) == 3
+  # one call per entity: the premium variant reuses the classification of its sibling only
+  assert sorted(classifier) == ["fees.pdf", "fees.pdf"]
+  reused = [load_document_analysis(path).near_duplicate_of for path in results]
+  assert [path.parent.name for path in reused if path] == ["bank"]
+
+
+def test_failures_are_isolated_per_document(tmp_path, classifier):
+  root_dir = tmp_path / "data_new"
+  write_document(root_dir / "bank" / "fees.pdf", [FEES])
+  write_document(root_dir / "bank" / "failing.pdf", [TERMS])
+  # neither an analysis nor extractable pages
+  (root_dir / "bank" / "scan.pdf").write_bytes(b"not a pdf")
+  results = doc_classification.classify_documents(root_dir)
+  assert [path.name for path in results] == ["fees.pdf"]
+  assert sorted(classifier) == ["failing.pdf", "fees.pdf"]
@@ -0,0 +1,20 @@
+import extraction_cache
+
+
+def test_writes_scan_the_cache_only_when_it_is_full(tmp_path, monkeypatch):
+  scans = []
+  entries = extraction_cache._entries
+  monkeypatch.setattr(extraction_cache, "_entries", lambda cache_dir: scans.append(cache_dir) or entries(cache_dir))
+
+  for i in range(20):
+    extraction_cache.put(f"{i:032x}", [f"page of document {i}"], 1, cache_dir=tmp_path)
+  assert len(scans) == 1
+
+  entry_size = extraction_cache._entry_path(f"{0:032x}", extraction_cache.DEFAULT_ENGINE, tmp_path).stat().st_size
+  for i in range(20, 40):
+    extraction_cache.put(f"{i:032x}", [f"page of document {i}"], 1, cache_dir=tmp_path, max_bytes=entry_size * 10)
+  assert len(entries(tmp_path)) <= 10
+  # pruning leaves room, so a full cache is not scanned on every write
+  assert len(scans) < 12
+  assert extraction_cache.get(f"{39:032x}", cache_dir=tmp_path) is not None
+  assert extraction_cache.get(f"{0:032x}", cache_dir=tmp_path) is None
@@ -0,0 +1,64 @@
+import hashlib
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("meilisearch")
+pytest.importorskip("google.genai")
+
+import gemini_embeddings_to_meili as indexer
+from doc_analysis import load_document_analysis
+from conftest import write_document
+
+
+class FakeIndex:
+  def __init__(self):
+    self.documents = {}
+    self.deleted = []
+
+  def add_documents(self, documents, primary_key=None):
+    self.documents.update((document["id"], document) for document in documents)
+    return SimpleNamespace(task_uid=0)
+
+  def delete_documents(self, ids):
+    self.deleted.extend(ids)
+    return SimpleNamespace(task_uid=0)
+
+
+class FakeMeili:
+  def __init__(self):
+    self.index = FakeIndex()
+
+  def get_index(self, name):
+    return self.index
+
+  def wait_for_task(self, task_uid):
+    return SimpleNamespace(error=None)
+
+
+class FakeGemini:
+  def __init__(self):
+    self.calls = 0
+
+  def embed_content(self, model, content, task_type):
+    self.calls += 1
+    return {"embedding": [float(len(content))]}
+
+
+def test_indexes_each_page_once(tmp_path, monkeypatch):
+  root_dir = tmp_path / "data_new"
+  write_document(root_dir / "bank" / "fees.pdf", ["fee page one", "fee page two"])
+  write_document(root_dir / "bank" / "rates.pdf", ["rates"])
+  gemini, meili = FakeGemini(), FakeMeili()
+  monkeypatch.setattr(indexer, "create_gemini", lambda: gemini)
+
+  indexer.index_embeddings(meili, root_dir, "documents")
+  name_hash = hashlib.md5(b"fees").hexdigest()
+  assert meili.index.documents[f"bank_{name_hash}_p1"]["filename"] == "fees.pdf"
+  assert len(meili.index.documents) == 3 and gemini.calls == 3
+  doc_analysis = load_document_analysis(root_dir / "bank" / "fees.pdf")
+  assert doc_analysis.indexed_page_hashes == doc_analysis.embedded_page_hashes
+
+  meili.index.documents.clear()
+  indexer.index_embeddings(meili, root_dir, "documents")
+  assert meili.index.documents == {} and gemini.calls == 3
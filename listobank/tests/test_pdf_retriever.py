@@ -0,0 +1,42 @@
+import pytest
+import requests
+
+import crawl_state
+import pdf_retriever
+from conftest import PDF_A, PDF_B
+
+
+def test_downloads_linked_pdfs_then_revalidates(pdf_server, tmp_path):
+  base_url, requests_seen = pdf_server
+  assert pdf_retriever.download_pdfs("bank", [f"{base_url}/list.html"], base_folder=str(tmp_path)) == 2
+  assert (tmp_path / "bank" / "a.pdf").read_bytes() == PDF_A
+  assert (tmp_path / "bank" / "b.pdf").read_bytes() == PDF_B
+
+  requests_seen.clear()
+  assert pdf_retriever.download_pdfs("bank", [f"{base_url}/list.html"], base_folder=str(tmp_path)) == 0
+  assert all("If-None-Match" in headers for _, headers in requests_seen)
+  assert crawl_state.get(f"{base_url}/list.html").status == 304
+
+
+def test_gzip_encoded_pdf_is_not_length_checked(pdf_server, tmp_path):
+  base_url, _ = pdf_server
+  dest = tmp_path / "a.pdf"
+  etag, was_modified, content_hash, size = pdf_retriever.download_file(f"{base_url}/gzip/a.pdf", str(dest))
+  assert (was_modified, size) == (True, len(PDF_A))
+  assert dest.read_bytes() == PDF_A
+
+
+def test_connect_errors_are_retried_then_recorded(tmp_path, monkeypatch):
+  calls = []
+  session = pdf_retriever.get_session()
+
+  def refuse(url, **kwargs):
+    calls.append(url)
+    raise requests.ConnectionError("refused")
+
+  monkeypatch.setattr(session, "get", refuse)
+  url = "http://127.0.0.1:9/unreachable.pdf"
+  with pytest.raises(requests.ConnectionError):
+    pdf_retriever.download_file(url, str(tmp_path / "unreachable.pdf"))
+  assert len(calls) == pdf_retriever.DOWNLOAD_RETRIES + 1
+  assert crawl_state.get(url).error == "refused"
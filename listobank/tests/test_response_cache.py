@@ -0,0 +1,61 @@
+import threading
+
+import response_cache
+
+
+def test_owner_rechecks_the_cache_before_computing(tmp_path, monkeypatch):
+  db_path = tmp_path / "responses.sqlite"
+  calls = []
+  first_get = response_cache.get
+
+  def racing_get(key, ttl=response_cache.TTL_SECONDS, db_path=db_path):
+    # another thread finishes computing the key right after this thread's first lookup
+    value = first_get(key, ttl, db_path)
+    if not calls:
+      calls.append("other thread")
+      response_cache.put(key, "stored", db_path=db_path)
+    return value
+
+  monkeypatch.setattr(response_cache, "get", racing_get)
+  assert response_cache.get_or_compute("k", lambda: calls.append("compute") or "computed", db_path=db_path) == "stored"
+  assert calls == ["other thread"]
+
+
+def test_concurrent_requests_compute_once(tmp_path, monkeypatch):
+  db_path = tmp_path / "responses.sqlite"
+  waiting = threading.Semaphore(0)
+
+  class CountingEvent(threading.Event):
+    def wait(self, timeout=None):
+      waiting.release()
+      return super().wait(timeout)
+
+  class CountingInFlight(response_cache._InFlight):
+    def __init__(self):
+      super().__init__()
+      self.done = CountingEvent()
+
+  monkeypatch.setattr(response_cache, "_InFlight", CountingInFlight)
+  computing, release = threading.Event(), threading.Event()
+  calls = []
+
+  def compute():
+    calls.append(1)
+    computing.set()
+    release.wait(5)
+    return "value"
+
+  results = []
+  threads = [threading.Thread(target=lambda: results.append(response_cache.get_or_compute("k", compute, db_path=db_path)))
+             for _ in range(4)]
+  for thread in threads:
+    thread.start()
+  # one thread computes while the three others block on its in-flight entry
+  assert computing.wait(5)
+  for _ in range(3):
+    assert waiting.acquire(timeout=5)
+  release.set()
+  for thread in threads:
+    thread.join()
+  assert results == ["value"] * 4
+  assert len(calls) == 1
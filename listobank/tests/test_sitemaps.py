@@ -0,0 +1,43 @@
+import datetime
+from pathlib import Path
+
+import pytest
+
+import sitemaps
+
+FIXTURES = Path(__file__).resolve().parent / "fixtures"
+UTC = datetime.timezone.utc
+
+
+def test_discovers_pdfs_through_nested_and_gzipped_sitemaps():
+  entries = sitemaps.discover([str(FIXTURES / "sitemap_index.xml")], sites={"example-bank.gr"})
+  assert [(entry.url, entry.lastmod) for entry in entries] == [
+      # the date-only lastmod is later than the other listing of the same PDF and wins
+      ("https://www.example-bank.gr/docs/fees.pdf", datetime.datetime(2024, 3, 2, tzinfo=UTC)),
+      ("https://files.example-bank.gr/archive/terms-2019.pdf", None),
+  ]
+
+
+def test_out_of_scope_hosts_are_kept_without_sites():
+  entries = sitemaps.discover([str(FIXTURES / "sitemap_index.xml")])
+  assert "https://cdn.other-host.com/docs/rates.pdf" in [entry.url for entry in entries]
+
+
+def test_date_only_lastmod_covers_the_whole_day(tmp_path):
+  dest_path = tmp_path / "fees.pdf"
+  dest_path.write_bytes(b"%PDF-1.4\n")
+  entry = sitemaps.SitemapEntry(url="https://www.example-bank.gr/docs/fees.pdf",
+                                lastmod=sitemaps.parse_lastmod("2024-03-01"))
+  checked_that_day = datetime.datetime(2024, 3, 1, 12, tzinfo=UTC)
+  assert not sitemaps.unchanged_since_checked(entry, dest_path, checked_at=checked_that_day)
+  assert sitemaps.unchanged_since_checked(entry, dest_path, checked_at=checked_that_day + datetime.timedelta(days=1))
+
+
+def test_sitemaps_over_the_size_limit_are_refused(pdf_server, monkeypatch):
+  base_url, _ = pdf_server
+  monkeypatch.setattr(sitemaps, "MAX_SITEMAP_BYTES", 200)
+  with pytest.raises(ValueError):
+    sitemaps.fetch(f"{base_url}/docs/a.pdf")
+  with pytest.raises(ValueError):
+    sitemaps.fetch(str(FIXTURES / "sitemap_index.xml"))
+  assert sitemaps.fetch(f"{base_url}/missing.xml") is None
@@ -1,13 +1,148 @@
+import os
+import concurrent.futures
 from pathlib import Path
-from PyPDF2 import PdfReader
+from typing import Iterator
 from tqdm.auto import tqdm
+from extraction_engines import get_engine
+import ocr
 
+# Default number of worker processes used for text extraction. 1 keeps the
+# original single-process behaviour; override with EXTRACTION_WORKERS.
+DEFAULT_EXTRACTION_WORKERS = int(os.getenv("EXTRACTION_WORKERS", "1"))
 
-def extract_pages_text(pdf_path: Path, indent_level: int = 0, limit: int = 0) -> list[str]:
+# Smallest number of pages handed to a worker at once. Every chunk re-opens the
+# PDF, so very small chunks spend more time parsing the xref than extracting.
+MIN_PAGES_PER_CHUNK = 4
+
+
+def page_count(pdf_path: Path, engine: str | None = None) -> int:
+  """
+  Returns the number of pages in the PDF file without extracting any text.
+  """
+  return get_engine(engine).page_count(pdf_path)
+
+
+def _page_count_or_zero(pdf_path: str, engine: str | None = None) -> int:
+  try:
+    return page_count(Path(pdf_path), engine)
+  except Exception as e:
+    print(f"Warning: Could not open {pdf_path}: {e}")
+    return 0
+
+
+def _extract_page_range(pdf_path: str, start: int, stop: int, engine: str | None = None) -> list[str]:
+  """
+  Extracts the text of pages [start, stop) of a PDF. Runs inside worker processes.
+  """
+  return list(get_engine(engine).iter_pages(Path(pdf_path), start, stop))
+
+
+def page_chunks(page_count: int, workers: int) -> list[tuple[int, int]]:
+  """
+  Splits page indices into [start, stop) ranges so each worker gets a few chunks.
+  """
+  chunk_size = max(MIN_PAGES_PER_CHUNK, -(-page_count // (workers * 4)))
+  return [(start, min(start + chunk_size, page_count)) for start in range(0, page_count, chunk_size)]
+
+
+def ocr_empty_pages(pdf_path: Path, pages: list[str], workers: int | None = None) -> list[str]:
+  """
+  Replaces pages without a text layer with their OCR text (see ocr.ocr_pages).
+  Disabled with OCR_FALLBACK=0.
+  """
+  empty = [i for i, text in enumerate(pages) if not text.strip()]
+  if not empty or not ocr.OCR_ENABLED:
+    return pages
+  ocr_text = ocr.ocr_pages(pdf_path, empty, workers=workers)
+  return [ocr_text.get(i, text) for i, text in enumerate(pages)]
+
+
+def extract_pages_text(pdf_path: Path, indent_level: int = 0, limit: int = 0, workers: int | None = None,
+                       engine: str | None = None) -> list[str]:
   """
   Extracts and returns a list of text content for each page in the PDF file.
+  With workers > 1 the pages are split into chunks and extracted in a process pool;
+  page order is preserved. `engine` selects the extraction backend (see extraction_engines).
+  Pages without a text layer fall back to OCR.
   """
-  reader = PdfReader(str(pdf_path))
+  workers = workers or DEFAULT_EXTRACTION_WORKERS
+  if workers > 1:
+    return extract_documents_text([pdf_path], indent_level=indent_level, limit=limit, workers=workers,
+                                  engine=engine)[pdf_path]
+
   indentation = "  " * indent_level
-  pages = reader.pages[:limit] if limit != 0 else reader.pages
-  return [page.extract_text() or "" for page in tqdm(pages, desc=f"{indentation}Extracting text from {pdf_path.name}", unit="page", leave=False)]
+  pages = get_engine(engine).iter_pages(pdf_path, 0, limit if limit != 0 else None)
+  pages = list(tqdm(pages, desc=f"{indentation}Extracting text from {pdf_path.name}", unit="page", leave=False))
+  return ocr_empty_pages(pdf_path, pages)
+
+
+def iter_pages_text(pdf_path: Path, start: int = 0, indent_level: int = 0, engine: str | None = None) -> Iterator[str]:
+  """
+  Lazily yields the text content of each page in the PDF file, starting at page index `start`.
+  Pages are only parsed as they are consumed, so stopping early skips the rest of the document.
+  Pages without a text layer fall back to OCR.
+  """
+  indentation = "  " * indent_level
+  pages = get_engine(engine).iter_pages(pdf_path, start)
+  for i, text in enumerate(tqdm(pages, desc=f"{indentation}Extracting text from {pdf_path.name}",
+                                unit="page", leave=False, initial=start), start=start):
+    if not text.strip() and ocr.OCR_ENABLED:
+      text = ocr.ocr_pages(pdf_path, [i], workers=1).get(i, text)
+    yield text
+
+
+def extract_documents_text(pdf_paths: list[Path], indent_level: int = 0, limit: int = 0,
+                           workers: int | None = None, engine: str | None = None) -> dict[Path, list[str]]:
+  """
+  Extracts the pages of several PDFs at once, spreading both documents and page ranges
+  across a single process pool. Returns a mapping of each path to its pages, in page order.
+  Documents that fail to open or extract map to an empty list.
+  """
+  if not pdf_paths:
+    return {}
+  workers = workers or DEFAULT_EXTRACTION_WORKERS
+  indentation = "  " * indent_level
+  results: dict[Path, list[str]] = {}
+  chunks: dict[Path, list[list[str] | None]] = {}
+  failed: set[Path] = set()
+
+  with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+    page_counts = {}
+    for pdf_path, count in zip(pdf_paths, executor.map(_page_count_or_zero, [str(p) for p in pdf_paths], [engine] * len(pdf_paths))):
+      page_counts[pdf_path] = min(count, limit) if limit != 0 else count
+
+    futures = {}
+    splits_pages = get_engine(engine).splits_pages
+    for pdf_path in pdf_paths:
+      if splits_pages:
+        ranges = page_chunks(page_counts[pdf_path], workers)
+      else:
+        # the engine parses the whole document for any range; only documents are spread
+        ranges = [(0, page_counts[pdf_path])] if page_counts[pdf_path] else []
+      chunks[pdf_path] = [None] * len(ranges)
+      for chunk_idx, (start, stop) in enumerate(ranges):
+        future = executor.submit(_extract_page_range, str(pdf_path), start, stop, engine)
+        futures[future] = (pdf_path, chunk_idx)
+
+    total_pages = sum(page_counts.values())
+    desc = f"{indentation}Extracting text from {pdf_paths[0].name}" if len(pdf_paths) == 1 \
+        else f"{indentation}Extracting text from {len(pdf_paths)} PDFs"
+    with tqdm(total=total_pages, desc=desc, unit="page", leave=False) as pbar:
+      for future in concurrent.futures.as_completed(futures):
+        pdf_path, chunk_idx = futures[future]
+        try:
+          pages = future.result()
+        except Exception as e:
+          print(f"Warning: Failed to extract text from {pdf_path}: {e}")
+          failed.add(pdf_path)
+          pages = []
+        chunks[pdf_path][chunk_idx] = pages
+        pbar.update(len(pages))
+
+  for pdf_path in pdf_paths:
+    if pdf_path in failed:
+      results[pdf_path] = []
+    else:
+      pages = [page for chunk in chunks[pdf_path] for page in chunk]
+      results[pdf_path] = ocr_empty_pages(pdf_path, pages, workers=workers)
+  return results